@@ -0,0 +1,250 @@
+"""
+Opens or publishes animations in background Blender processes, without a user interface.
+
+Animations are given as files, actor configs or project directories, and spread over a pool of workers. Each worker is
+a Blender process running skywind.blender.worker, which handles many animations before it is restarted.
+
+Examples:
+    python -m skywind.blender.cli open C:/Data/Meshes/Actor/Animations/Walk.fbx
+    python -m skywind.blender.cli publish C:/Data/Meshes/Actor/actor.json --workers 8
+"""
+import os
+import sys
+import json
+import queue
+import logging
+import argparse
+import threading
+import subprocess
+
+from skywind.core.actor import CONFIG_EXTENSION, registry
+from skywind.core.manifest import load_manifest
+
+
+_logger = logging.getLogger(__name__)
+__all__ = ['BlenderWorker', 'get_animation_files', 'run_jobs', 'run_batch', 'main']
+BLENDER_ENVIRONMENT_VARIABLE = 'SKYWIND_BLENDER'
+WORKER_SCRIPT = os.path.join(os.path.dirname(__file__), 'worker.py')
+RESULT_PREFIX = 'SKYWIND_RESULT '
+COMMAND_EXTENSIONS = {'open': '.fbx', 'publish': '.blend'}
+DEFAULT_JOBS_PER_WORKER = 50
+
+
+class BlenderWorker:
+    """
+    A background Blender process that runs jobs one at a time.
+
+    The process is started on the first job, and started again after it ran jobs_per_worker jobs, crashed or timed out.
+
+    Args:
+        blender(str): The Blender executable.
+        jobs_per_worker(int): The number of jobs a process runs before it is restarted. Unlimited if 0.
+        timeout(float): The seconds a job may take before its process is killed. Unlimited if 0.
+    """
+
+    def __init__(self, blender: str, jobs_per_worker: int = DEFAULT_JOBS_PER_WORKER, timeout: float = 0.0):
+        self.blender = blender
+        self.jobs_per_worker = jobs_per_worker
+        self.timeout = timeout
+        self._process = None
+        self._jobs = 0
+
+    def _start(self):
+        self._process = subprocess.Popen(
+            [self.blender, '--background', '--factory-startup', '--python', WORKER_SCRIPT],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, bufsize=1
+        )
+        self._jobs = 0
+
+    def stop(self):
+        """Lets the process finish and waits for it to exit."""
+        if self._process is None:
+            return
+        try:
+            self._process.stdin.close()
+        except OSError:
+            pass
+        self._process.wait()
+        self._process = None
+
+    def run(self, command: str, path: str, **options) -> dict:
+        """
+        Runs a job, restarting the process if needed.
+
+        Args:
+            command(str): The command of the job, see skywind.blender.worker.run_job.
+            path(str): The file the command runs on.
+            options: Other values of the job, as the command expects them.
+
+        Returns:
+            dict: The result of the job, with its path, whether it succeeded, its outputs and error.
+        """
+        if self._process is None or (self.jobs_per_worker and self._jobs >= self.jobs_per_worker):
+            self.stop()
+            self._start()
+
+        process = self._process
+        timed_out = threading.Event()
+
+        def kill():
+            timed_out.set()
+            process.kill()
+
+        timer = threading.Timer(self.timeout, kill) if self.timeout else None
+        try:
+            process.stdin.write(f"{json.dumps({'command': command, 'path': path, **options})}\n")
+            process.stdin.flush()
+            if timer is not None:
+                timer.start()
+            for line in process.stdout:
+                if line.startswith(RESULT_PREFIX):
+                    self._jobs += 1
+                    return json.loads(line[len(RESULT_PREFIX):])
+                _logger.debug(line.rstrip())
+        except OSError:
+            pass
+        finally:
+            if timer is not None:
+                timer.cancel()
+
+        # The process exited without answering
+        returncode = process.wait()
+        self._process = None
+        error = f'Timed out after {self.timeout}s' if timed_out.is_set() else f'Blender exited with code {returncode}'
+        return {'path': path, 'succeeded': False, 'outputs': [], 'error': error}
+
+
+def _list_files(directory: str, extension: str) -> list[str]:
+    if not os.path.isdir(directory):
+        return []
+    return sorted(
+        os.path.join(directory, name) for name in os.listdir(directory) if name.lower().endswith(extension)
+    )
+
+
+def get_animation_files(command: str, paths: list[str]) -> list[str]:
+    """
+    Returns the files a command runs on.
+
+    Args:
+        command(str): Either open, which runs on animation fbx files, or publish, which runs on blend files.
+        paths(list[str]): Animation files, actor configs whose animations are all used, or project directories whose
+            actors' animations are all used.
+    """
+    extension = COMMAND_EXTENSIONS[command]
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            actors = load_manifest(path).get_actors()
+        elif path.endswith(CONFIG_EXTENSION):
+            actors = [registry.get(path)]
+        else:
+            files.append(os.path.abspath(path))
+            continue
+        for actor in actors:
+            try:
+                files.extend(_list_files(actor.animations_fbx, extension))
+            except KeyError:
+                _logger.warning('Skipping %s, which defines no animations', actor)
+    return list(dict.fromkeys(files))
+
+
+def run_jobs(jobs: list[dict], blender: str, workers: int = 1, jobs_per_worker: int = DEFAULT_JOBS_PER_WORKER,
+             timeout: float = 0.0) -> dict[str, list]:
+    """
+    Runs jobs in parallel background Blender processes.
+
+    Args:
+        jobs(list[dict]): The jobs to run, each with a command, a path and the other values the command expects.
+        blender(str): The Blender executable.
+        workers(int): The number of Blender processes.
+        jobs_per_worker(int): The number of jobs a process runs before it is restarted, which bounds leaks.
+        timeout(float): The seconds a job may take before its process is killed. Unlimited if 0.
+
+    Returns:
+        dict[str, list]: The results that succeeded and failed, see BlenderWorker.run.
+    """
+    pending = queue.Queue()
+    for job in jobs:
+        pending.put(job)
+    results = {'succeeded': [], 'failed': []}
+    lock = threading.Lock()
+
+    def work():
+        worker = BlenderWorker(blender, jobs_per_worker, timeout)
+        try:
+            while True:
+                try:
+                    job = pending.get_nowait()
+                except queue.Empty:
+                    return
+                result = worker.run(**job)
+                with lock:
+                    results['succeeded' if result['succeeded'] else 'failed'].append(result)
+                    done = len(results['succeeded']) + len(results['failed'])
+                if result['succeeded']:
+                    _logger.info('[%s/%s] %s %s', done, len(jobs), job['command'], job['path'])
+                else:
+                    _logger.error(
+                        '[%s/%s] Failed to %s %s: %s', done, len(jobs), job['command'], job['path'], result['error']
+                    )
+        finally:
+            worker.stop()
+
+    threads = [threading.Thread(target=work, daemon=True) for _ in range(max(1, min(workers, len(jobs))))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    _logger.info('%s succeeded, %s failed', len(results['succeeded']), len(results['failed']))
+    return results
+
+
+def run_batch(command: str, files: list[str], blender: str, workers: int = 1,
+              jobs_per_worker: int = DEFAULT_JOBS_PER_WORKER, timeout: float = 0.0) -> dict[str, list]:
+    """
+    Runs a command on files in parallel background Blender processes.
+
+    Args:
+        command(str): Either open or publish.
+        files(list[str]): The files to run the command on, see get_animation_files.
+        blender(str): The Blender executable.
+        workers(int): The number of Blender processes.
+        jobs_per_worker(int): The number of files a process handles before it is restarted, which bounds leaks.
+        timeout(float): The seconds a file may take before its process is killed. Unlimited if 0.
+
+    Returns:
+        dict[str, list]: The results that succeeded and failed, see BlenderWorker.run.
+    """
+    jobs = [{'command': command, 'path': filepath} for filepath in files]
+    return run_jobs(jobs, blender, workers=workers, jobs_per_worker=jobs_per_worker, timeout=timeout)
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description='Opens or publishes animations in background Blender processes.')
+    parser.add_argument('command', choices=sorted(COMMAND_EXTENSIONS))
+    parser.add_argument('paths', nargs='+', help='Animation files, actor configs or project directories')
+    parser.add_argument(
+        '--blender', default=os.environ.get(BLENDER_ENVIRONMENT_VARIABLE, 'blender'),
+        help=f'The Blender executable. Defaults to ${BLENDER_ENVIRONMENT_VARIABLE}, or blender on the path'
+    )
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--jobs-per-worker', type=int, default=DEFAULT_JOBS_PER_WORKER)
+    parser.add_argument('--timeout', type=float, default=0.0, help='Seconds before a file is abandoned')
+    options = parser.parse_args(argv)
+
+    files = get_animation_files(options.command, options.paths)
+    if not files:
+        _logger.warning('No files to %s', options.command)
+        return 0
+    results = run_batch(
+        options.command, files, options.blender, workers=options.workers, jobs_per_worker=options.jobs_per_worker,
+        timeout=options.timeout
+    )
+    return 1 if results['failed'] else 0
+
+
+if __name__ == '__main__':
+    from skywind.core import log
+    log.initialize()
+    sys.exit(main(sys.argv[1:]))
@@ -1,5 +1,5 @@
-
 import os
+import time
 import logging
 
 import bpy
@@ -11,37 +11,19 @@ from ...core.preferences import get_last_dir, set_last_dir
 from ...core.blender.metadata import save_tags_to_object, save_source_path_to_object
 from ...core.blender.fbx import import_fbx
 from ...core.fbx.tags import load_animation_tags
+from ...core.blender.skeleton import load_skeleton_fbx
 from ...core.blender.armature import copy_armature_in_world_space, bake_animation
+from ...core.blender.action import frame_animation
+from ...core.blender.template import rig_templates, reset_file
+from ...core.blender.retarget import (
+    get_frames, get_mapping_plan, get_retarget_blocker, add_child_of_constraint, retarget_to_control_rig
+)
 
 
 __all__ = ['SKYWIND_OT_open_animation', 'SKYWIND_OT_open_animation_debug', 'SKYWIND_OT_new_file']
 _logger = logging.getLogger(__name__)
 
 
-def append_scene(filepath: str) -> list:
-    _logger.debug('Appending scene: %s', filepath)
-    imported_objects = []
-
-    # Load and merge collections
-    with bpy.data.libraries.load(filepath, link=False) as (data_from, data_to):
-        _logger.debug(data_from.collections)
-        data_to.collections = data_from.collections
-
-    for imported_col in data_to.collections:
-        bpy.context.scene.collection.children.link(imported_col)
-        for obj in imported_col.objects:
-            imported_objects.append(obj)
-        for obj in imported_col.objects:
-            if obj.type == 'ARMATURE':
-                break
-        else:
-            imported_col.hide_viewport = True
-            imported_col.hide_render = True
-
-    _logger.debug('Imported objects: %s', imported_objects)
-    return imported_objects
-
-
 def find_skeleton(objects: list):
     skeletons = []
     for object in objects:
@@ -54,15 +36,6 @@ def find_skeleton(objects: list):
     return skeletons[0]
 
 
-def _frame_animation(skeleton):
-    keyframes = set()
-    for fcurve in skeleton.animation_data.action.fcurves:
-        for keyframe_point in fcurve.keyframe_points:
-            keyframes.add(int(keyframe_point.co.x))
-    bpy.context.scene.frame_start = min(keyframes)
-    bpy.context.scene.frame_end = max(keyframes)
-
-
 class OpenAnimationMixin:
 
     filepath: StringProperty(
@@ -103,7 +76,7 @@ class OpenAnimationMixin:
 
 class SKYWIND_OT_open_animation(Operator, OpenAnimationMixin):
     bl_label = "Open Animation"
-    bl_description = "Open a Skywind animation"
+    bl_description = "Open a Skywind animation. The saved .blend links the rig meshes from the actor's rig file"
 
     def open(self, filepath: str):
         open_animation(filepath)
@@ -173,7 +146,51 @@ def import_animation_tags(animation_fbx: str, object: any):
             key.interpolation = 'LINEAR'
 
 
+def build_constraint_rig(export_skeleton: bpy.types.Object, animation_skeleton: bpy.types.Object,
+                         control_skeleton: bpy.types.Object, import_mapping: dict[str, str]) -> list:
+    """
+    Constrains a control rig to an imported animation through world space copies of the export skeleton and control
+    rig, for inspecting the retarget or baking it visually.
+
+    Returns:
+        list: The world space copies.
+    """
+    start = time.perf_counter()
+    world_animation_skeleton = copy_armature_in_world_space(export_skeleton, use_pose_bones=True)
+    world_control_skeleton = copy_armature_in_world_space(control_skeleton, use_pose_bones=True)
+    plan = get_mapping_plan(world_control_skeleton.pose.bones, import_mapping)
+
+    for control_name, bone_name, is_root in plan:
+        # Constrain world control to world bone, with offsets maintained
+        add_child_of_constraint(
+            world_control_skeleton.pose.bones[control_name], world_animation_skeleton, '' if is_root else bone_name
+        )
+
+        # Constrain world control to matching control
+        constraint = control_skeleton.pose.bones[control_name].constraints.new(type='COPY_TRANSFORMS')
+        constraint.target = world_control_skeleton
+        constraint.subtarget = control_name
+
+    # Constrain animation bones to world animation bones
+    for _, bone_name, is_root in plan:
+        control = world_animation_skeleton if is_root else world_animation_skeleton.pose.bones[bone_name]
+        constraint = control.constraints.new(type='COPY_TRANSFORMS')
+        constraint.target = animation_skeleton
+        if not is_root:
+            constraint.subtarget = bone_name
+
+    bpy.context.view_layer.update()
+    _logger.info('Built constraint rig for %s controls in %.3fs', len(plan), time.perf_counter() - start)
+    return [world_animation_skeleton, world_control_skeleton]
+
+
 def open_animation(animation_file: str, debug: bool = False):
+    """
+    Retargets an animation fbx onto a copy of its actor's control rig, and saves it to a .blend next to the fbx.
+
+    The rig is copied from the rig file linked by rig_templates. The copy's armatures and actions are local, but its
+    meshes stay linked, so the saved .blend needs the actor's rig file to display them.
+    """
     _logger.info('Opening file: %s', animation_file)
 
     to_cleanup = []
@@ -181,12 +198,11 @@ def open_animation(animation_file: str, debug: bool = False):
 
     # animation_fbx = actor.get_animation(animation_name)
     animation_fbx = animation_file
-    bpy.ops.wm.read_homefile(use_empty=True)
+    reset_file()
 
     # Import Export Skeleton
-    skeleton_fbx_objects = import_fbx(actor.skeleton_fbx, global_scale=100)
-    to_cleanup.extend(skeleton_fbx_objects)
-    export_skeleton = find_skeleton(skeleton_fbx_objects)
+    export_skeleton = load_skeleton_fbx(actor.skeleton_fbx, global_scale=100)
+    to_cleanup.append(export_skeleton)
 
     # Import Animation Skeleton
     animation_fbx_objects = import_fbx(
@@ -197,61 +213,34 @@ def open_animation(animation_file: str, debug: bool = False):
     animation_skeleton = find_skeleton(animation_fbx_objects)
 
     # Import Control Rig
-    control_rig_objects = append_scene(actor.blender_rig)
+    control_rig_objects = rig_templates.instantiate(actor.blender_rig)
     control_skeleton = find_skeleton(control_rig_objects)
 
-    world_animation_skeleton = copy_armature_in_world_space(export_skeleton, use_pose_bones=True)
-    world_control_skeleton = copy_armature_in_world_space(control_skeleton, use_pose_bones=True)
-
-    to_constrain = []
-    for control_bone in world_control_skeleton.pose.bones:
-        if control_bone.name not in actor.blender_import_mapping:
-            continue
-        control_name = control_bone.name
-        bone_name = actor.blender_import_mapping[control_bone.name]
-        is_root = bone_name == 'NPC_s_Root_s__ob_Root_cb_'
-
-        # Constrain world control to world bone, with offsets maintained
-        bpy.context.view_layer.update()  # Ensure the dependency graph is updated
-        control = world_control_skeleton.pose.bones[control_name]
-        constraint = control.constraints.new(type='CHILD_OF')
-        constraint.target = world_animation_skeleton
-        if not is_root:
-            constraint.subtarget = bone_name
-
-        # Constrain world control to matching control
-        bpy.context.view_layer.update()  # Ensure the dependency graph is updated
-        control = control_skeleton.pose.bones[control_name]
-        constraint = control.constraints.new(type='COPY_TRANSFORMS')
-        constraint.target = world_control_skeleton
-        constraint.subtarget = control_name
-        to_constrain.append(bone_name)
-
-    # Constrain animation bones to world animation bones
-    for bone_name in to_constrain:
-        bpy.context.view_layer.update()  # Ensure the dependency graph is updated
-        is_root = bone_name == 'NPC_s_Root_s__ob_Root_cb_'
-        bpy.context.view_layer.update()  # Ensure the dependency graph is updated
-        control = world_animation_skeleton if is_root else world_animation_skeleton.pose.bones[bone_name]
-        constraint = control.constraints.new(type='COPY_TRANSFORMS')
-        constraint.target = animation_skeleton
-        if not is_root:
-            constraint.subtarget = bone_name
-
     if debug:
+        build_constraint_rig(export_skeleton, animation_skeleton, control_skeleton, actor.blender_import_mapping)
         return
 
     # Frame the timeline
-    _frame_animation(animation_skeleton)
+    frame_animation(animation_skeleton)
 
     # Bake animation onto control rig
-    bake_animation(control_skeleton, actor.blender_import_mapping.keys())
+    controls = [name for name in actor.blender_import_mapping if name in control_skeleton.pose.bones]
+    blocker = get_retarget_blocker(control_skeleton, controls)
+    if blocker is None:
+        retarget_to_control_rig(
+            animation_skeleton, export_skeleton, control_skeleton, actor.blender_import_mapping, get_frames()
+        )
+    else:
+        _logger.warning('Baking through a constraint rig, %s', blocker)
+        world_skeletons = build_constraint_rig(
+            export_skeleton, animation_skeleton, control_skeleton, actor.blender_import_mapping
+        )
+        bake_animation(control_skeleton, actor.blender_import_mapping.keys())
+        to_cleanup.extend(world_skeletons)
 
     # Delete skeletons
     for item in to_cleanup:
         bpy.data.objects.remove(item, do_unlink=True)
-    bpy.data.objects.remove(world_control_skeleton, do_unlink=True)
-    bpy.data.objects.remove(world_animation_skeleton, do_unlink=True)
 
     # Save animation tags
     tags = load_animation_tags(animation_fbx)
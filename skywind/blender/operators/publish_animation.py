@@ -1,44 +1,31 @@
-
 import os
 import logging
+import tempfile
 import time
+import contextlib
 
 import bpy
 from bpy.props import StringProperty, BoolProperty, CollectionProperty
 from bpy.types import Operator
 
+from ...core.actor import Actor
 from ...core.preferences import get_last_dir, set_last_dir
 from ...core.fbx.tags import load_animation_tags, save_animation_tags
-from ...core.blender.fbx import import_fbx, export_fbx_animation
+from ...core.blender.fbx import export_fbx_animation
+from ...core.blender.fbx_simplify import Tolerance, simplifying_keys, log_simplifications
 from ...core.blender.metadata import load_tags_from_object, load_source_path_from_object
+from ...core.blender.skeleton import load_skeleton_fbx
 from ...core.blender.armature import copy_armature_in_world_space, bake_animation
+from ...core.blender.retarget import (
+    ROOT_BONE_NAME, get_frames, get_mapping_plan, get_retarget_blocker, add_child_of_constraint,
+    retarget_to_export_skeleton
+)
 from ...core.blender.mixins import ActorOperatorMixin
+from ..cli import run_jobs
 
 
 __all__ = ['SKYWIND_OT_publish_animation', 'SKYWIND_OT_publish_scene']
 _logger = logging.getLogger(__name__)
-ROOT_BONE_NAME = 'NPC_s_Root_s__ob_Root_cb_'
-
-
-def find_skeleton(objects: list):
-    skeletons = []
-    for object in objects:
-        if object.type == 'ARMATURE':
-            skeletons.append(object)
-    if len(skeletons) == 0:
-        raise RuntimeError('No skeletons found.')
-    if len(skeletons) > 1:
-        raise RuntimeError('More than one skeleton found.')
-    return skeletons[0]
-
-
-def _frame_animation(skeleton):
-    keyframes = set()
-    for fcurve in skeleton.animation_data.action.fcurves:
-        for keyframe_point in fcurve.keyframe_points:
-            keyframes.add(int(keyframe_point.co.x))
-    bpy.context.scene.frame_start = min(keyframes)
-    bpy.context.scene.frame_end = max(keyframes)
 
 
 REG_PATH = r"Software\SkywindAnimation"
@@ -83,7 +70,8 @@ class SKYWIND_OT_publish_animation(Operator, ActorOperatorMixin):
                     armature,
                     filepath,
                     actor.skeleton_fbx,
-                    actor.blender_export_mapping
+                    actor.blender_export_mapping,
+                    actor=actor
                 )
                 self.report({'INFO'}, f"Published: {filepath}")
             set_last_dir(self.filepath)
@@ -100,15 +88,27 @@ class SKYWIND_OT_publish_scene(Operator, ActorOperatorMixin):
         self.actor_armatures = self.get_scene_actors()
         if len(self.actor_armatures) == 0:
             return {'CANCELLED'}
-        for actor, armature in self.actor_armatures:
+        if len(self.actor_armatures) == 1:
+            actor, armature = self.actor_armatures[0]
             filepath = load_source_path_from_object(armature)
             publish_control_rig_animation(
                 armature,
                 filepath,
                 actor.skeleton_fbx,
-                actor.blender_export_mapping
+                actor.blender_export_mapping,
+                actor=actor
             )
             self.report({'INFO'}, f"Published: {filepath}")
+            return {'FINISHED'}
+
+        # Publish every actor at once in background processes
+        armatures = [armature for _, armature in self.actor_armatures]
+        results = publish_in_background(armatures)
+        for armature, result in zip(armatures, results):
+            if result['succeeded']:
+                self.report({'INFO'}, f"Published: {', '.join(result['outputs'])}")
+            else:
+                self.report({'ERROR'}, f"Failed to publish {armature.name}: {result['error']}")
         return {'FINISHED'}
 
 
@@ -154,44 +154,24 @@ def import_animation_tags(animation_fbx: str, object: any):
             key.interpolation = 'LINEAR'
 
 
-def publish_control_rig_animation(
-        control_skeleton: bpy.types.Armature, animation_file: str, skeleton_fbx: str,
-        blender_export_mapping: dict[str, str]
-):
-    _logger.info('Publishing file: %s', animation_file)
-
-    to_cleanup = []
-
-    # Import Export Skeleton
-    skeleton_fbx_objects = import_fbx(skeleton_fbx, global_scale=100)
-    to_cleanup.extend(skeleton_fbx_objects)
-    export_skeleton = find_skeleton(skeleton_fbx_objects)
+def build_constraint_rig(control_skeleton: bpy.types.Object, export_skeleton: bpy.types.Object,
+                         export_mapping: dict[str, str]) -> list:
+    """
+    Constrains an export skeleton to a control rig through world space copies of both, for baking it visually.
 
+    Returns:
+        list: The world space copies.
+    """
+    start = time.perf_counter()
     world_export_skeleton = copy_armature_in_world_space(export_skeleton, name='WorldExportSkeleton')
     world_control_skeleton = copy_armature_in_world_space(control_skeleton, name='WorldControlSkeleton')
+    plan = get_mapping_plan(world_control_skeleton.pose.bones, export_mapping)
 
-
-    to_constrain = []
-    for control in world_control_skeleton.pose.bones:
-        if control.name not in blender_export_mapping:
-            continue
-        control_name = control.name
-        bone_name = blender_export_mapping[control_name]
-        is_root = bone_name == ROOT_BONE_NAME
-
+    for control_name, bone_name, is_root in plan:
         # Constrain the world export skeleton to the world control skeleton
-        bpy.context.view_layer.update()  # Ensure the dependency graph is updated
-        if is_root:
-            constraint = world_export_skeleton.constraints.new(type='CHILD_OF')
-            constraint.target = world_control_skeleton
-            constraint.subtarget = control_name
-        else:
-            pose_bone = world_export_skeleton.pose.bones[bone_name]
-            constraint = pose_bone.constraints.new(type='CHILD_OF')
-            constraint.target = world_control_skeleton
-            constraint.subtarget = control_name
+        owner = world_export_skeleton if is_root else world_export_skeleton.pose.bones[bone_name]
+        add_child_of_constraint(owner, world_control_skeleton, control_name)
 
-        bpy.context.view_layer.update()  # Ensure the dependency graph is updated
         if is_root:
             constraint = export_skeleton.constraints.new(type='COPY_TRANSFORMS')
             constraint.target = world_export_skeleton
@@ -200,26 +180,59 @@ def publish_control_rig_animation(
             constraint = export_bone.constraints.new(type='COPY_TRANSFORMS')
             constraint.target = world_export_skeleton
             constraint.subtarget = bone_name
-        to_constrain.append(control_name)
 
-    for control_name in to_constrain:
-        bpy.context.view_layer.update()  # Ensure the dependency graph is updated
+    for control_name, _, _ in plan:
         control = world_control_skeleton.pose.bones[control_name]
         constraint = control.constraints.new(type='COPY_TRANSFORMS')
         constraint.target = control_skeleton
         constraint.subtarget = control_name
 
-    # Bake animation onto control rig
-    to_bake = [bone for bone in blender_export_mapping.values() if bone != ROOT_BONE_NAME]
-    bake_animation(export_skeleton, to_bake)
+    bpy.context.view_layer.update()
+    _logger.info('Built constraint rig for %s controls in %.3fs', len(plan), time.perf_counter() - start)
+    return [world_export_skeleton, world_control_skeleton]
+
+
+def publish_control_rig_animation(
+        control_skeleton: bpy.types.Armature, animation_file: str, skeleton_fbx: str,
+        blender_export_mapping: dict[str, str], use_constraints: bool = False, actor: Actor = None,
+        simplify: bool = False
+):
+    _logger.info('Publishing file: %s', animation_file)
 
-    # Delete skeletons
-    bpy.data.objects.remove(world_control_skeleton, do_unlink=True)
-    bpy.data.objects.remove(world_export_skeleton, do_unlink=True)
+    to_cleanup = []
+
+    # Import Export Skeleton
+    export_skeleton = load_skeleton_fbx(skeleton_fbx, global_scale=100)
+    to_cleanup.append(export_skeleton)
+
+    # Bake animation onto export skeleton
+    to_bake = [bone for bone in blender_export_mapping.values() if bone != ROOT_BONE_NAME]
+    blocker = get_retarget_blocker(export_skeleton, to_bake)
+    if blocker is None and not use_constraints:
+        retarget_to_export_skeleton(control_skeleton, export_skeleton, blender_export_mapping, get_frames())
+    else:
+        if blocker is not None:
+            _logger.warning('Baking through a constraint rig, %s', blocker)
+        world_skeletons = build_constraint_rig(control_skeleton, export_skeleton, blender_export_mapping)
+        bake_animation(export_skeleton, to_bake)
+
+        # Delete skeletons
+        for world_skeleton in world_skeletons:
+            bpy.data.objects.remove(world_skeleton, do_unlink=True)
 
     # Export the animation
     _logger.info('Exporting %s', animation_file)
-    export_fbx_animation(export_skeleton, animation_file, global_scale=0.01)
+    if simplify:
+        tolerances = {
+            bone: Tolerance(*values) for bone, values in (actor.blender_simplify_tolerances if actor else {}).items()
+        }
+        simplifying = simplifying_keys(tolerances)
+    else:
+        simplifying = contextlib.nullcontext()
+    with simplifying as simplifications:
+        export_fbx_animation(export_skeleton, animation_file, global_scale=0.01)
+    if simplify:
+        log_simplifications(simplifications)
 
     # Cleanup export skeleton
     _logger.info('Removing export skeleton')
@@ -234,5 +247,127 @@ def publish_control_rig_animation(
         _logger.info('Exported animation tags')
 
 
+def publish_armature(armature: bpy.types.Object) -> str | None:
+    """
+    Publishes the animation of an actor's control rig to its source file.
+
+    Returns:
+        str: The published animation file, or None if the armature is not an actor.
+    """
+    filepath = load_source_path_from_object(armature)
+    if filepath is None:
+        return None
+    actor = Actor.find(filepath)
+    if actor is None:
+        _logger.warning('No actor found for %s', filepath)
+        return None
+    publish_control_rig_animation(armature, filepath, actor.skeleton_fbx, actor.blender_export_mapping, actor=actor)
+    return filepath
+
+
+def publish_scene() -> list[str]:
+    """
+    Publishes the animation of every actor in the current scene to its source file, without a user interface.
+
+    Returns:
+        list[str]: The published animation files.
+    """
+    published = []
+    for obj in list(bpy.context.scene.objects):
+        if obj.type != 'ARMATURE':
+            continue
+        filepath = publish_armature(obj)
+        if filepath is not None:
+            published.append(filepath)
+    if not published:
+        raise RuntimeError('No actors found.')
+    return published
+
+
+def snapshot_armature(armature: bpy.types.Object, directory: str) -> dict:
+    """
+    Writes a control rig, with its action, tags and everything it depends on, to a blend file a background process can
+    publish.
+
+    Args:
+        armature(bpy.types.Object): The control rig.
+        directory(str): The directory to write the blend file to.
+
+    Returns:
+        dict: The worker job publishing the snapshot, see publish_snapshot.
+    """
+    snapshot_file = os.path.join(directory, f'{bpy.path.clean_name(armature.name)}.blend')
+    bpy.data.libraries.write(snapshot_file, {armature}, path_remap='ABSOLUTE', fake_user=True)
+    scene = bpy.context.scene
+    return {
+        'command': 'publish_snapshot',
+        'path': snapshot_file,
+        'armature': armature.name,
+        'frame_start': scene.frame_start,
+        'frame_end': scene.frame_end,
+        'fps': scene.render.fps,
+        'fps_base': scene.render.fps_base,
+    }
+
+
+def publish_snapshot(snapshot_file: str, armature: str, frame_start: int, frame_end: int, fps: int,
+                     fps_base: float) -> str:
+    """
+    Publishes a control rig written by snapshot_armature, in the current scene.
+
+    Args:
+        snapshot_file(str): The blend file of the snapshot.
+        armature(str): The name of the control rig when it was written.
+        frame_start(int): The first frame of the scene it was written from.
+        frame_end(int): The last frame of the scene it was written from.
+        fps(int): The frame rate of the scene it was written from.
+        fps_base(float): The frame rate base of the scene it was written from.
+
+    Returns:
+        str: The published animation file.
+    """
+    scene = bpy.context.scene
+    scene.frame_start, scene.frame_end = frame_start, frame_end
+    scene.render.fps, scene.render.fps_base = fps, fps_base
+    with bpy.data.libraries.load(snapshot_file, link=False) as (data_from, data_to):
+        data_to.objects = data_from.objects
+    # Appended objects are renamed if their names are taken, so the rig is found by its position
+    index = data_from.objects.index(armature)
+    for obj in data_to.objects:
+        if obj is not None:
+            scene.collection.objects.link(obj)
+    scene.frame_set(frame_start)
+
+    filepath = publish_armature(data_to.objects[index])
+    if filepath is None:
+        raise RuntimeError(f'{armature} is not an actor.')
+    return filepath
+
+
+def publish_in_background(armatures: list[bpy.types.Object], workers: int = 0) -> list[dict]:
+    """
+    Publishes control rigs concurrently, each in a background Blender process, and waits for them.
+
+    Args:
+        armatures(list[bpy.types.Object]): The control rigs.
+        workers(int): The number of processes. One per rig, up to the number of processors, if 0.
+
+    Returns:
+        list[dict]: The result of each rig, in order, with whether it succeeded, its outputs and error.
+    """
+    with tempfile.TemporaryDirectory(prefix='skywind_publish_') as directory:
+        jobs = []
+        for index, armature in enumerate(armatures):
+            # One directory per rig, as rig names may only differ in characters that are not valid in file names
+            snapshot_directory = os.path.join(directory, str(index))
+            os.mkdir(snapshot_directory)
+            jobs.append(snapshot_armature(armature, snapshot_directory))
+        workers = workers or min(len(jobs), os.cpu_count() or 1)
+        _logger.info('Publishing %s rigs in %s background processes', len(jobs), workers)
+        results = run_jobs(jobs, bpy.app.binary_path, workers=workers, jobs_per_worker=0)
+    results = {result['path']: result for result in results['succeeded'] + results['failed']}
+    return [results[job['path']] for job in jobs]
+
+
 def import_rig():
     print('import rig')
\ No newline at end of file
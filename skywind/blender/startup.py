@@ -8,6 +8,9 @@ from ..core import startup
 def register():
     startup.initialize()
 
+    from ..core.blender import template
+    template.register()
+
     from . import operators
     operators.register()
 
@@ -20,4 +23,7 @@ def unregister():
     operators.unregister()
 
     from . import menu
-    menu.unregister()
\ No newline at end of file
+    menu.unregister()
+
+    from ..core.blender import template
+    template.unregister()
\ No newline at end of file
@@ -0,0 +1,77 @@
+"""
+Runs open and publish jobs inside a background Blender, for skywind.blender.cli.
+
+Each line of stdin is a JSON job, e.g. {"command": "open", "path": "C:/Data/Meshes/Actor/Animations/Walk.fbx"}. Each
+job is answered by a line on stdout starting with skywind.blender.cli.RESULT_PREFIX, followed by a JSON result. The
+worker runs jobs until stdin is closed, starting each job from an empty file that keeps the rigs loaded by previous
+jobs.
+
+Run with:
+    blender --background --factory-startup --python skywind/blender/worker.py
+"""
+import os
+import sys
+import json
+import time
+import logging
+import traceback
+
+import bpy
+
+# Run as a script, so the repository is not on the path yet
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from skywind.core import startup
+from skywind.core.blender import template
+from skywind.core.blender.template import reset_file
+from skywind.blender.operators.open_animation import open_animation
+from skywind.blender.operators.publish_animation import publish_scene, publish_snapshot
+from skywind.blender.cli import RESULT_PREFIX
+
+
+_logger = logging.getLogger(__name__)
+
+
+def run_job(job: dict) -> list[str]:
+    """
+    Runs a job in an empty file.
+
+    Returns:
+        list[str]: The files written by the job.
+    """
+    path = job['path']
+    if job['command'] == 'open':
+        open_animation(path)
+        return [os.path.join(os.path.dirname(path), f"{os.path.basename(path).split('.')[0]}.blend")]
+    if job['command'] == 'publish':
+        bpy.ops.wm.open_mainfile(filepath=path)
+        return publish_scene()
+    if job['command'] == 'publish_snapshot':
+        options = {key: value for key, value in job.items() if key not in ('command', 'path')}
+        return [publish_snapshot(path, **options)]
+    raise ValueError(f"Unknown command: {job['command']}")
+
+
+def main():
+    startup.initialize()
+    template.register()
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        job = json.loads(line)
+        start = time.perf_counter()
+        result = {'path': job['path'], 'succeeded': True, 'outputs': [], 'error': ''}
+        try:
+            result['outputs'] = run_job(job)
+        except Exception as e:
+            _logger.error('Failed to %s %s:\n%s', job['command'], job['path'], traceback.format_exc())
+            result.update(succeeded=False, error=f'{type(e).__name__}: {e}')
+        finally:
+            reset_file()
+        result['duration'] = time.perf_counter() - start
+        sys.stdout.write(f'{RESULT_PREFIX}{json.dumps(result)}\n')
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""
+Module for writing animation tags directly into the annotation tracks of an HKX animation.
+
+This avoids a full animation re-import when only tags changed. The HKX is converted to XML in a scratch directory,
+the annotation tracks are rewritten line by line without parsing the rest of the document, and the XML is converted
+back to an HKX of the same platform.
+"""
+import os
+import re
+import shutil
+import logging
+import tempfile
+from typing import Iterable, Iterator
+from xml.sax.saxutils import escape
+
+from skywind.ck.api import convert_hkx_to_xml, convert_xml_to_hkx, get_hkx_platform
+
+
+_logger = logging.getLogger(__name__)
+__all__ = ['get_annotation_text', 'rewrite_annotation_tracks', 'write_animation_annotations']
+TAG_PREFIX = 'hk'
+# Characters the FBX SDK escapes in node names, in the order they are restored
+FBX_NAME_ESCAPES = (('_ob_', '['), ('_cb_', ']'), ('_s_', ' '))
+ANNOTATION_TRACKS_PATTERN = re.compile(r'<hkparam name="annotationTracks" numelements="\d+">')
+TRACK_NAME_PATTERN = re.compile(r'<hkparam name="trackName">(.*)</hkparam>')
+ANNOTATIONS_PATTERN = re.compile(r'^(\s*)<hkparam name="annotations" numelements="\d+"\s*(/?)>(.*)$')
+
+
+def _get_track_name(node: str) -> str:
+    """Returns the Havok bone name of an FBX node name."""
+    for escaped, character in FBX_NAME_ESCAPES:
+        node = node.replace(escaped, character)
+    return node
+
+
+def get_annotation_text(tag_name: str, label: str) -> str:
+    """
+    Returns the annotation text of a tag keyframe.
+
+    Tags are the enum properties ck-cmd turns annotations into, named after the start of the annotation text with a
+    hk prefix and labelled with the rest of it, e.g. hkweapon labelled Swing for weaponSwing. The text is the tag name
+    and label joined verbatim, so it does not depend on where the text was split.
+
+    Raises:
+        ValueError: If the tag name does not start with the hk prefix, since the tag then did not come from an
+            annotation.
+    """
+    if not tag_name.startswith(TAG_PREFIX):
+        raise ValueError(f'{tag_name} is not an annotation tag, as it does not start with {TAG_PREFIX}')
+    return f'{tag_name[len(TAG_PREFIX):]}{label}'
+
+
+def _get_annotations_by_track(tags: Iterable) -> dict[str, list[tuple[float, str]]]:
+    annotations = {}
+    for tag in tags:
+        track = annotations.setdefault(_get_track_name(tag.node), [])
+        track.extend((time, get_annotation_text(tag.name, label)) for time, label in tag.keyframes)
+    for track in annotations.values():
+        track.sort()
+    return annotations
+
+
+def _format_annotations(indent: str, annotations: list[tuple[float, str]]) -> Iterator[str]:
+    if not annotations:
+        yield f'{indent}<hkparam name="annotations" numelements="0"></hkparam>\n'
+        return
+    yield f'{indent}<hkparam name="annotations" numelements="{len(annotations)}">\n'
+    for time, text in annotations:
+        yield f'{indent}\t<hkobject>\n'
+        yield f'{indent}\t\t<hkparam name="time">{time:.6f}</hkparam>\n'
+        yield f'{indent}\t\t<hkparam name="text">{escape(text)}</hkparam>\n'
+        yield f'{indent}\t</hkobject>\n'
+    yield f'{indent}</hkparam>\n'
+
+
+def rewrite_annotation_tracks(lines: Iterable[str], tags: Iterable) -> Iterator[str]:
+    """
+    Streams the lines of a Havok XML file, replacing the annotations of every annotation track with the tags.
+
+    Tracks without tags are cleared, since the tags describe all events of the animation.
+
+    Args:
+        lines(Iterable[str]): The lines of the XML file, including line endings.
+        tags(Iterable[Tag]): The tags to write.
+    """
+    annotations = _get_annotations_by_track(tags)
+    written = set()
+    in_tracks = False
+    track_name = None
+    skipping = False
+    for line in lines:
+        if skipping:
+            if line.strip() == '</hkparam>':
+                skipping = False
+            continue
+        if not in_tracks:
+            in_tracks = ANNOTATION_TRACKS_PATTERN.search(line) is not None
+            yield line
+            continue
+
+        match = TRACK_NAME_PATTERN.search(line)
+        if match:
+            track_name = match.group(1)
+            yield line
+            continue
+        match = ANNOTATIONS_PATTERN.match(line)
+        if match and track_name is not None:
+            indent, self_closing, rest = match.groups()
+            skipping = not self_closing and '</hkparam>' not in rest
+            yield from _format_annotations(indent, annotations.get(track_name, []))
+            written.add(track_name)
+            track_name = None
+            continue
+        if line.strip() == '</hkparam>' and track_name is None:
+            # The end of the annotation tracks
+            in_tracks = False
+        yield line
+
+    for missing in sorted(set(annotations) - written):
+        _logger.warning('No annotation track found for %s', missing)
+
+
+def write_animation_annotations(animation_hkx: str, tags: Iterable, output_hkx: str = None) -> str:
+    """
+    Writes tags into the annotation tracks of an HKX animation.
+
+    Args:
+        animation_hkx(str): The animation to update.
+        tags(Iterable[Tag]): The tags describing every event of the animation.
+        output_hkx(str): An optional output path. Defaults to updating the animation in place.
+
+    Returns:
+        str: The written HKX file.
+    """
+    output_hkx = output_hkx or animation_hkx
+    platform = get_hkx_platform(animation_hkx)
+    with tempfile.TemporaryDirectory(prefix='skywind_annotations_') as scratch_directory:
+        source_xml = convert_hkx_to_xml(animation_hkx, os.path.join(scratch_directory, 'source.xml'))
+        target_xml = os.path.join(scratch_directory, 'target.xml')
+        with open(source_xml, 'r') as source, open(target_xml, 'w') as target:
+            target.writelines(rewrite_annotation_tracks(source, tags))
+        target_hkx = convert_xml_to_hkx(target_xml, os.path.join(scratch_directory, 'target.hkx'), platform)
+        shutil.move(target_hkx, output_hkx)
+    _logger.info('Wrote annotations to %s', output_hkx)
+    return output_hkx
@@ -1,19 +1,85 @@
 import os
+import signal
+import logging
 import tempfile
 import subprocess
+from collections import deque
 from contextlib import contextmanager
 
+from skywind.ck.backends import ConverterBackend
+from skywind.ck.cache import merge_cache_fragments, write_cache_fragment, CacheFormatError
+
 
 CKCMD = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'bin', 'ck-cmd.exe')
 HKXCMD = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'bin', 'hkxcmd.exe')
 HKXCONV = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'bin', 'hkxconv.exe')
 BEHAVIOR_CONVERTER_PATH = os.path.join(os.path.dirname(__file__), 'bin', 'HavokBehaviorPostProcess.exe')
 
+# Per-tool timeouts as (base seconds, additional seconds per megabyte of input).
+TIMEOUTS = {
+    'convert': (60.0, 10.0),
+    'exportrig': (120.0, 10.0),
+    'exportanimation': (120.0, 20.0),
+    'importanimation': (120.0, 20.0),
+}
+OUTPUT_TAIL_LINES = 20
+
+_logger = logging.getLogger(__name__)
+
 
 class CkCmdException(Exception):
     """"""
 
 
+_backend = ConverterBackend()
+
+
+def get_backend() -> ConverterBackend:
+    return _backend
+
+
+def set_backend(backend: ConverterBackend):
+    """Sets the backend used to run the converters, for example a stand-in on machines without the executables."""
+    global _backend
+    _backend = backend
+
+
+def _ckcmd() -> str:
+    return _backend.get_command(CKCMD)
+
+
+def _hkxconv() -> str:
+    return _backend.get_command(HKXCONV)
+
+
+class CkCmdTimeout(CkCmdException):
+    """Raised when a converter process exceeds its timeout and is killed."""
+
+
+def get_timeout(tool: str, *input_files: str) -> float:
+    """
+    Returns the timeout for a tool, scaled by the total size of its input files.
+
+    Args:
+        tool(str): A key of TIMEOUTS.
+        input_files(str): Input files or directories. Missing paths and directories are ignored.
+    """
+    base, per_megabyte = TIMEOUTS[tool]
+    size = sum(os.path.getsize(path) for path in input_files if os.path.isfile(path))
+    return base + per_megabyte * size / (1024 * 1024)
+
+
+def _kill_process_tree(process: subprocess.Popen):
+    """Kills a process along with every process it spawned."""
+    if os.name == 'nt':
+        subprocess.run(f'taskkill /F /T /PID {process.pid}', stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    else:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
 @contextmanager
 def ensure_file_modified(filepath: str):
     existed = os.path.exists(filepath)
@@ -25,13 +91,14 @@ def ensure_file_modified(filepath: str):
         raise FileExistsError(f'{filepath} was not modified')
 
 
-def _run_command(command: str, directory: str = '/'):
+def _run_command(command: str, directory: str = '/', timeout: float | None = None):
     """
     Runs a given command in a separate process. Prints the output and raises any exceptions.
 
     Args:
         command(str): A command string to run.
         directory(str): A directory to run the command in.
+        timeout(float): Seconds to wait before the process tree is killed and CkCmdTimeout is raised.
     """
     command = command.replace('\\\\', '\\')
     directory = directory.replace('\\\\', '\\')
@@ -39,10 +106,17 @@ def _run_command(command: str, directory: str = '/'):
     with open(os.path.join(tempfile.gettempdir(), 'ck.log'), 'w') as f:
         try:
             process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                                       text=True, shell=True, cwd=directory)
+                                       text=True, shell=True, cwd=directory, start_new_session=os.name != 'nt')
         except Exception as e:
             raise CkCmdException('Command "%s" failed.' % command) from e
-        out, err = process.communicate()
+        try:
+            out, err = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            _kill_process_tree(process)
+            out, err = process.communicate()
+            tail = '\n'.join(deque((out + err).splitlines(), maxlen=OUTPUT_TAIL_LINES))
+            _logger.error('Command stalled after %.0fs and was killed: %s\n%s', timeout, command, tail)
+            raise CkCmdTimeout('\nTimed out after %.0fs: %s\n%s' % (timeout, command, tail))
         print (out)
         if process.returncode != 0 or 'Exception' in str(err):
             raise CkCmdException('\n%s' % str(err))
@@ -53,8 +127,8 @@ def convert_hkx_to_xml(hkx: str, xml: str = None) -> str:
     if xml is None:
         xml = os.path.join(tempfile.gettempdir(), os.path.basename(hkx).split('.')[0] + '.xml')
     with ensure_file_modified(xml):
-        command = f'{HKXCONV} convert "{hkx}" "{xml}"'
-        _run_command(command)
+        command = f'{_hkxconv()} convert "{hkx}" "{xml}"'
+        _run_command(command, timeout=get_timeout('convert', hkx))
     return xml
 
 
@@ -64,15 +138,30 @@ def convert_xml_to_le_hkx(xml: str, le_hkx: str = None) -> str:
         le_hkx = os.path.join(tempfile.gettempdir(), os.path.basename(xml).split('.')[0] + '_le.hkx')
     with ensure_file_modified(le_hkx):
         output_directory = os.path.dirname(le_hkx)
-        command = f'"{CKCMD}" convert "{xml}" -o "{le_hkx}" -v WIN32 -f SAVE_DEFAULT'
-        _run_command(command, directory=output_directory)
-    return xml
+        command = f'{_ckcmd()} convert "{xml}" -o "{le_hkx}" -v WIN32 -f SAVE_DEFAULT'
+        _run_command(command, directory=output_directory, timeout=get_timeout('convert', xml))
+    return le_hkx
+
+
+def get_hkx_platform(hkx: str) -> str:
+    """Returns the platform a binary HKX packfile was saved for: AMD64 for Special Edition, WIN32 for Legacy."""
+    with open(hkx, 'rb') as openfile:
+        header = openfile.read(17)
+    return 'AMD64' if len(header) == 17 and header[16] == 8 else 'WIN32'
+
+
+def convert_xml_to_hkx(xml: str, hkx: str, platform: str = 'AMD64') -> str:
+    """Converts an XML file to a binary HKX file for a given platform."""
+    with ensure_file_modified(hkx):
+        command = f'{_ckcmd()} convert "{xml}" -o "{hkx}" -v {platform} -f SAVE_DEFAULT'
+        _run_command(command, directory=os.path.dirname(hkx), timeout=get_timeout('convert', xml))
+    return hkx
 
 
 def export_rig(skeleton_hkx: str, skeleton_nif: str, skeleton_fbx: str,
               animation_hkx: str='', mesh_nif: str='', cache_txt: str='', behavior_directory: str=''):
     """Converts a Skyrim rig from hkx to fbx."""
-    commands = [CKCMD, "exportrig"]
+    commands = [_ckcmd(), "exportrig"]
     commands.append('"%s"' % skeleton_hkx)
     commands.append('"%s"' % skeleton_nif)
     commands.append('--e="%s"' % skeleton_fbx)
@@ -85,26 +174,79 @@ def export_rig(skeleton_hkx: str, skeleton_nif: str, skeleton_fbx: str,
     if cache_txt:
         commands.append('--c="%s"' % cache_txt)
     command = ' '.join(commands)
-    _run_command(command, directory=os.path.dirname(skeleton_fbx))
+    timeout = get_timeout('exportrig', skeleton_hkx, skeleton_nif, animation_hkx, mesh_nif)
+    _run_command(command, directory=os.path.dirname(skeleton_fbx), timeout=timeout)
+
+
+def convert_hkx_to_le_hkx(hkx: str, le_hkx: str) -> str:
+    """Converts an HKX file of any platform to a legacy HKX file, through XML in a scratch directory."""
+    with tempfile.TemporaryDirectory(prefix='skywind_legacy_') as scratch_directory:
+        xml = convert_hkx_to_xml(hkx, os.path.join(scratch_directory, os.path.basename(hkx).split('.')[0] + '.xml'))
+        return convert_xml_to_le_hkx(xml, le_hkx)
 
 
-def convert_animation_hkx_to_fbx(skeleton_hkx: str, animation_hkx: str, output_directory: str):
+def convert_animation_hkx_to_fbx(
+        skeleton_hkx: str, animation_hkx: str, output_directory: str, skeleton_le_hkx: str = '',
+        scratch_directory: str = ''
+):
     """
     Converts a Skyrim animation from hkx to fbx.
 
     Args:
         skeleton_hkx(str): A skeleton.hkx path.
-        animation_hkx(str): Either an animation hkx file or directory containing animation hkx files.
+        animation_hkx(str): An animation hkx file.
         output_directory(str): The output directory.
+        skeleton_le_hkx(str): An optional legacy conversion of the skeleton, so batches only convert it once.
+        scratch_directory(str): An optional directory for the intermediate files. Defaults to a temporary directory.
+    """
+    with tempfile.TemporaryDirectory(prefix='skywind_export_') as temp_directory:
+        scratch_directory = scratch_directory or temp_directory
+        if not skeleton_le_hkx:
+            skeleton_le_hkx = convert_hkx_to_le_hkx(skeleton_hkx, os.path.join(scratch_directory, 'skeleton_le.hkx'))
+        # The fbx is named after the legacy animation, so it keeps the name of the animation
+        legacy_directory = os.path.join(scratch_directory, 'legacy')
+        os.makedirs(legacy_directory, exist_ok=True)
+        animation_le_hkx = convert_hkx_to_le_hkx(
+            animation_hkx, os.path.join(legacy_directory, os.path.basename(animation_hkx))
+        )
+        command = f'{_ckcmd()} exportanimation "{skeleton_le_hkx}" "{animation_le_hkx}" --e="{output_directory}"'
+        timeout = get_timeout('exportanimation', skeleton_le_hkx, animation_le_hkx)
+        _run_command(command, directory=output_directory, timeout=timeout)
+
+
+def _run_importanimation(
+        skeleton_hkx: str, animation_fbx: str, output_directory: str, cache_txt: str, behavior_directory: str
+):
+    command = f'{_ckcmd()} importanimation "{skeleton_hkx}" "{animation_fbx}" --c="{cache_txt}" --b="{behavior_directory}" --e="{output_directory}"'
+    timeout = get_timeout('importanimation', skeleton_hkx, animation_fbx)
+    _run_command(command, directory=output_directory, timeout=timeout)
+
+
+def _import_animation_through_fragment(
+        skeleton_hkx: str, animation_fbx: str, output_directory: str, cache_txt: str, behavior_directory: str
+) -> bool:
     """
-    skeleton_le_hkx = convert_xml_to_le_hkx(convert_hkx_to_xml(skeleton_hkx))
-    animation_le_hkx = convert_xml_to_le_hkx(convert_hkx_to_xml(animation_hkx))
-    command = '%s exportanimation "%s" "%s" --e="%s"' % (CKCMD, skeleton_le_hkx, animation_le_hkx, output_directory)
-    _run_command(command, directory=output_directory)
+    Imports an animation writing to a fragment holding its cache entry, then merges the fragment into the cache.
+
+    Returns:
+        bool: False if the cache or the fragment cannot be parsed. The cache is left as it was.
+    """
+    with tempfile.TemporaryDirectory(prefix='skywind_cache_') as scratch_directory:
+        cache_fragment = os.path.join(scratch_directory, 'cache.txt')
+        try:
+            # The converter only sees the fragment, so it starts from the animation's existing entry
+            write_cache_fragment(cache_txt, cache_fragment, [os.path.basename(animation_fbx).split('.')[0]])
+            _run_importanimation(skeleton_hkx, animation_fbx, output_directory, cache_fragment, behavior_directory)
+            merge_cache_fragments(cache_txt, [cache_fragment])
+        except CacheFormatError as e:
+            _logger.warning('Passing all of %s to ck-cmd, its entries cannot be parsed: %s', cache_txt, e)
+            return False
+    return True
 
 
 def convert_animation_fbx_to_hkx(
-        skeleton_hkx: str, animation_fbx: str, output_directory: str, cache_txt: str = '', behavior_directory: str = ''
+        skeleton_hkx: str, animation_fbx: str, output_directory: str, cache_txt: str = '', behavior_directory: str = '',
+        use_fragment: bool = True
 ):
     """Converts an animation from fbx to hkx.
 
@@ -112,12 +254,20 @@ def convert_animation_fbx_to_hkx(
         skeleton_hkx(str): A skeleton.hkx path.
         animation_fbx(str): An animation fbx file or directory containing animation fbx files.
         output_directory(str): The output directory.
-        cache_txt(str): An optional cache file to contain root motion data.
+        cache_txt(str): An optional cache file to contain root motion data. Only the entries of the converted
+            animations are updated, unless the cache cannot be parsed. ck-cmd then gets the whole file.
         behavior_directory(str): An optional behavior directory.
+        use_fragment(bool): If False, cache_txt is handed to ck-cmd as is instead of through a fragment holding the
+            animation's entry, e.g. when cache_txt already is such a fragment.
     """
-    command = f'{CKCMD} importanimation "{skeleton_hkx}" "{animation_fbx}" --c="{cache_txt}" --b="{behavior_directory}" --e="{output_directory}"'
-    _run_command(command, directory=output_directory)
     output_file = os.path.join(output_directory, os.path.basename(animation_fbx).replace('.fbx', '.hkx'))
+    imported = False
+    if cache_txt and use_fragment:
+        imported = _import_animation_through_fragment(
+            skeleton_hkx, animation_fbx, output_directory, cache_txt, behavior_directory
+        )
+    if not imported:
+        _run_importanimation(skeleton_hkx, animation_fbx, output_directory, cache_txt, behavior_directory)
     if not os.path.exists(output_file):
         raise FileNotFoundError(f'Failed to import {animation_fbx}')
 
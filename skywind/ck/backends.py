@@ -0,0 +1,58 @@
+"""Backends resolving the converter executables used by skywind.ck.api."""
+import os
+import sys
+import hashlib
+from functools import lru_cache
+
+
+__all__ = ['ConverterBackend', 'FakeBackend']
+FAKE_SCRIPT = os.path.join(os.path.dirname(__file__), 'fake.py')
+
+
+class ConverterBackend:
+    """Runs the real converter executables."""
+
+    def get_command(self, executable: str) -> str:
+        """Returns the command prefix used to run an executable."""
+        return f'"{executable}"'
+
+    def get_version(self, executable: str) -> str:
+        """Returns a string identifying the build of an executable, used to key stored conversion outputs."""
+        return _hash_file(executable, os.path.getmtime(executable)) if os.path.exists(executable) else ''
+
+
+class FakeBackend(ConverterBackend):
+    """
+    Runs the Python stand-ins from skywind.ck.fake in place of the converter executables.
+
+    Args:
+        latency(float): Seconds each invocation sleeps before producing its outputs.
+        latency_per_mb(float): Additional seconds per megabyte of input.
+        failure_rate(float): The fraction of inputs whose conversion fails.
+        hang_rate(float): The fraction of inputs whose conversion never finishes.
+    """
+
+    def __init__(self, latency: float = 0.0, latency_per_mb: float = 0.0, failure_rate: float = 0.0,
+                 hang_rate: float = 0.0):
+        self.latency = latency
+        self.latency_per_mb = latency_per_mb
+        self.failure_rate = failure_rate
+        self.hang_rate = hang_rate
+
+    def get_command(self, executable: str) -> str:
+        tool = os.path.basename(executable).split('.')[0]
+        return (
+            f'"{sys.executable}" "{FAKE_SCRIPT}" --latency={self.latency} --latency-per-mb={self.latency_per_mb} '
+            f'--failure-rate={self.failure_rate} --hang-rate={self.hang_rate} {tool}'
+        )
+
+    def get_version(self, executable: str) -> str:
+        tool = os.path.basename(executable).split('.')[0]
+        return f'fake-{tool}-{_hash_file(FAKE_SCRIPT, os.path.getmtime(FAKE_SCRIPT))}'
+
+
+@lru_cache
+def _hash_file(filepath: str, mtime: float) -> str:
+    """Hashes a file. The modification time is only part of the cache key, so updated files are hashed again."""
+    with open(filepath, 'rb') as openfile:
+        return hashlib.file_digest(openfile, 'sha256').hexdigest()
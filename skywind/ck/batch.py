@@ -1,37 +1,675 @@
-
 import os
+import sys
+import json
 import logging
+import argparse
 import shutil
 import tempfile
+import threading
+from functools import partial
+from dataclasses import dataclass
 
 from skywind.core.actor import Actor
-from skywind.ck.api import convert_animation_fbx_to_hkx
+from skywind.core.manifest import load_manifest
+from skywind.ck.api import (
+    convert_animation_fbx_to_hkx, convert_animation_hkx_to_fbx, convert_hkx_to_le_hkx, convert_hkx_to_xml,
+    convert_xml_to_le_hkx, get_backend, CkCmdTimeout, CKCMD, HKXCONV
+)
+from skywind.ck.annotations import write_animation_annotations
+from skywind.ck.cache import merge_cache_fragments, write_cache_fragment, AnimationCache, CacheFormatError
+from skywind.ck.schedule import DurationHistory, Task, run_tasks, HISTORY_FILENAME
+from skywind.ck.staging import stage_behavior_directory
+from skywind.ck.store import ArtifactStore, STORE_ENVIRONMENT_VARIABLE
 
 
 _logger = logging.getLogger(__name__)
+_quarantine_lock = threading.Lock()
+_cache_locks: dict[str, threading.Lock] = {}
+_cache_locks_lock = threading.Lock()
+QUARANTINE_FILENAME = '.quarantine'
+RESULTS_FILENAME = '.batch_results.json'
+REPLAY_FILENAME = '.batch_replay.txt'
+EXPORT_DIRECTORY = 'exported'
+
+
+@dataclass
+class ImportJob:
+    actor: Actor
+    animation_fbx: str
+    scratch_directory: str
+    behavior_directory: str = ''
+    use_fragment: bool = True
+
+    @property
+    def name(self) -> str:
+        return os.path.basename(self.animation_fbx).replace('.fbx', '')
+
+    @property
+    def output_file(self) -> str:
+        return os.path.join(self.actor.animations_hkx, f'{self.name}.hkx')
+
+    @property
+    def cache_fragment(self) -> str:
+        """A cache file private to this job, merged into the actor's cache once the batch is done."""
+        if not self.actor.cache_txt or not self.use_fragment:
+            return ''
+        return os.path.join(self.scratch_directory, f'{self.name}.txt')
+
+
+def _get_quarantine_file(actor: Actor) -> str:
+    return os.path.join(actor.animations_fbx, QUARANTINE_FILENAME)
+
+
+def load_quarantine(actor: Actor) -> set[str]:
+    """Returns the animation filenames of an actor that are skipped by batch imports."""
+    quarantine_file = _get_quarantine_file(actor)
+    if not os.path.exists(quarantine_file):
+        return set()
+    with open(quarantine_file, 'r') as openfile:
+        return {line.strip() for line in openfile if line.strip()}
+
+
+def quarantine_animation(actor: Actor, filepath: str):
+    """Excludes an animation from future batch imports until it is removed from the quarantine file."""
+    _logger.error('Quarantining %s', filepath)
+    with _quarantine_lock, open(_get_quarantine_file(actor), 'a') as openfile:
+        openfile.write(os.path.basename(filepath) + '\n')
+
+
+def _get_cache_lock(cache_txt: str) -> threading.Lock:
+    with _cache_locks_lock:
+        return _cache_locks.setdefault(os.path.abspath(cache_txt), threading.Lock())
+
+
+def _can_split_cache(actor: Actor) -> bool:
+    """Returns False if the cache of an actor cannot be parsed into the entries per-job fragments are made of."""
+    try:
+        AnimationCache(actor.cache_txt)
+    except CacheFormatError as e:
+        _logger.warning(
+            'Converting to %s one animation at a time, its entries cannot be parsed: %s', actor.cache_txt, e
+        )
+        return False
+    return True
+
+
+def _convert_animation(job: ImportJob, store: ArtifactStore | None):
+    """Converts the animation of a job, or materializes the outputs of an identical conversion from the store."""
+    if job.actor.cache_txt and not job.use_fragment:
+        # ck-cmd updates the whole cache file, which neither fits the store nor allows conversions in parallel
+        with _get_cache_lock(job.actor.cache_txt):
+            convert_animation_fbx_to_hkx(
+                job.actor.skeleton_le_hkx, job.animation_fbx, os.path.dirname(job.output_file),
+                cache_txt=job.actor.cache_txt, behavior_directory=job.behavior_directory, use_fragment=False
+            )
+        return
+    # The job extracts its own fragment, so the converter writes to it directly
+    if job.cache_fragment:
+        write_cache_fragment(job.actor.cache_txt, job.cache_fragment, [job.name])
+    if store is None:
+        convert_animation_fbx_to_hkx(
+            job.actor.skeleton_le_hkx, job.animation_fbx, os.path.dirname(job.output_file),
+            cache_txt=job.cache_fragment, behavior_directory=job.behavior_directory, use_fragment=False
+        )
+        return
+
+    input_files = [job.actor.skeleton_le_hkx, job.animation_fbx]
+    if job.behavior_directory:
+        input_files.append(job.behavior_directory)
+    if job.cache_fragment and os.path.exists(job.cache_fragment):
+        # The existing entry is an input of the conversion
+        input_files.append(job.cache_fragment)
+    key = store.get_key(
+        get_backend().get_version(CKCMD), input_files, ['importanimation', job.name, bool(job.cache_fragment)]
+    )
+    destinations = {f'{job.name}.hkx': job.output_file, 'cache.txt': job.cache_fragment}
+    with store.reserve(key):
+        if store.materialize(key, destinations):
+            _logger.info('Reused stored conversion of %s', job.animation_fbx)
+            return
+        output_directory = os.path.join(job.scratch_directory, job.name)
+        os.makedirs(output_directory, exist_ok=True)
+        convert_animation_fbx_to_hkx(
+            job.actor.skeleton_le_hkx, job.animation_fbx, output_directory,
+            cache_txt=job.cache_fragment, behavior_directory=job.behavior_directory, use_fragment=False
+        )
+        outputs = {f'{job.name}.hkx': os.path.join(output_directory, f'{job.name}.hkx')}
+        if job.cache_fragment:
+            outputs['cache.txt'] = job.cache_fragment
+        store.add(key, outputs)
+        store.materialize(key, destinations)
+
+
+def _import_animation(job: ImportJob, timeout_retries: int, store: ArtifactStore | None) -> bool:
+    """Imports an animation, retrying stalled conversions. Returns False if the animation was quarantined."""
+    _logger.info('Importing animation from %s', job.animation_fbx)
+    for attempt in range(timeout_retries + 1):
+        try:
+            _convert_animation(job, store)
+            _logger.info('Imported animation to %s', job.output_file)
+            return True
+        except CkCmdTimeout:
+            _logger.warning(
+                'Import of %s timed out (attempt %s of %s)', job.animation_fbx, attempt + 1, timeout_retries + 1
+            )
+    quarantine_animation(job.actor, job.animation_fbx)
+    return False
+
+
+def _needs_skeleton_conversion(actor: Actor) -> bool:
+    """Returns True if the legacy skeleton is missing or older than the skeleton it is converted from."""
+    try:
+        skeleton_hkx = actor.skeleton_hkx
+    except KeyError:
+        return False
+    if not os.path.exists(skeleton_hkx):
+        return False
+    return not os.path.exists(actor.skeleton_le_hkx) or \
+        os.path.getmtime(actor.skeleton_le_hkx) < os.path.getmtime(skeleton_hkx)
+
+
+def _convert_skeleton(actor: Actor, scratch_directory: str, store: ArtifactStore | None):
+    if store is None:
+        _logger.info('Converting skeleton %s', actor.skeleton_hkx)
+        xml = convert_hkx_to_xml(actor.skeleton_hkx, os.path.join(scratch_directory, 'skeleton.xml'))
+        convert_xml_to_le_hkx(xml, actor.skeleton_le_hkx)
+        return
+
+    tool_version = get_backend().get_version(HKXCONV) + get_backend().get_version(CKCMD)
+    key = store.get_key(tool_version, [actor.skeleton_hkx], ['skeleton_le_hkx'])
+    destinations = {'skeleton_le.hkx': actor.skeleton_le_hkx}
+    with store.reserve(key):
+        if store.materialize(key, destinations):
+            _logger.info('Reused stored conversion of %s', actor.skeleton_hkx)
+            return
+        _logger.info('Converting skeleton %s', actor.skeleton_hkx)
+        xml = convert_hkx_to_xml(actor.skeleton_hkx, os.path.join(scratch_directory, 'skeleton.xml'))
+        le_hkx = os.path.join(scratch_directory, 'skeleton_le.hkx')
+        convert_xml_to_le_hkx(xml, le_hkx)
+        store.add(key, {'skeleton_le.hkx': le_hkx})
+        store.materialize(key, destinations)
+
+
+def _stage_behaviors(actor: Actor, jobs: list[ImportJob], scratch_directory: str):
+    """Stages the behavior files needed by the jobs of an actor once, and points every job at them."""
+    try:
+        behavior_directory = stage_behavior_directory(
+            actor.behavior_directory, [job.animation_fbx for job in jobs], os.path.join(scratch_directory, 'behaviors')
+        )
+    except OSError as e:
+        _logger.warning('Failed to stage %s, using the full directory: %s', actor.behavior_directory, e)
+        return
+    for job in jobs:
+        job.behavior_directory = behavior_directory
+
+
+def _merge_cache(actor: Actor, tasks: list[Task], jobs: list[ImportJob]):
+    fragments = [job.cache_fragment for job, task in zip(jobs, tasks) if task.result]
+    _logger.info('Merging %s cache fragments into %s', len(fragments), actor.cache_txt)
+    merge_cache_fragments(actor.cache_txt, fragments)
+
+
+def _is_up_to_date(job: ImportJob) -> bool:
+    return os.path.exists(job.output_file) and \
+        os.path.getmtime(job.output_file) >= os.path.getmtime(job.animation_fbx)
+
+
+def _get_import_jobs(
+        actor: Actor, scratch_directory: str, convert_skeleton: bool, incremental: bool, replay: set[str] | None
+) -> tuple[list[ImportJob], dict[str, Exception]]:
+    """Returns the import jobs of an actor, along with the precondition failures of animations that cannot run."""
+    jobs = []
+    failures = {}
+    quarantined = load_quarantine(actor)
+    for filename in sorted(os.listdir(actor.animations_fbx)):
+        if not filename.endswith('.fbx'):
+            continue
+        if filename in quarantined:
+            _logger.warning('Skipping quarantined animation %s', filename)
+            continue
+        job = ImportJob(
+            actor, os.path.join(actor.animations_fbx, filename), scratch_directory, actor.behavior_directory
+        )
+        if replay is not None and job.animation_fbx not in replay:
+            continue
+        required_files = [job.animation_fbx, os.path.dirname(job.output_file)]
+        if not convert_skeleton:
+            required_files.append(actor.skeleton_le_hkx)
+        missing_files = [required_file for required_file in required_files if not os.path.exists(required_file)]
+        if missing_files:
+            failures[job.animation_fbx] = FileNotFoundError(f'{missing_files[0]} does not exist')
+            continue
+        if replay is None and incremental and not convert_skeleton and _is_up_to_date(job):
+            _logger.debug('Skipping up to date animation %s', filename)
+            continue
+        jobs.append(job)
+    return jobs, failures
+
+
+def _add_skeleton_task(
+        actor: Actor, scratch_directory: str, history: DurationHistory, skeleton_tasks: dict[str, Task],
+        store: ArtifactStore | None, tasks: list[Task]
+) -> str:
+    """Adds a task converting the legacy skeleton of an actor, unless another actor added it. Returns its key."""
+    if actor.skeleton_le_hkx not in skeleton_tasks:
+        skeleton_tasks[actor.skeleton_le_hkx] = Task(
+            actor.skeleton_le_hkx, partial(_convert_skeleton, actor, scratch_directory, store),
+            history.estimate(actor.skeleton_hkx)
+        )
+        tasks.append(skeleton_tasks[actor.skeleton_le_hkx])
+    return actor.skeleton_le_hkx
+
+
+def _get_actor_tasks(
+        actor: Actor, scratch_directory: str, history: DurationHistory, timeout_retries: int, incremental: bool,
+        replay: set[str] | None, skeleton_tasks: dict[str, Task], store: ArtifactStore | None
+) -> tuple[list[Task], list[tuple[ImportJob, Task]], dict[str, Exception]]:
+    """
+    Returns the tasks for an actor, the import job of each animation task and the precondition failures.
+
+    Skeleton conversions are shared between actors using the same legacy skeleton through skeleton_tasks.
+    """
+    tasks = []
+    dependencies = []
+    convert_skeleton = _needs_skeleton_conversion(actor)
+    if convert_skeleton:
+        dependencies.append(_add_skeleton_task(actor, scratch_directory, history, skeleton_tasks, store, tasks))
+
+    jobs, failures = _get_import_jobs(actor, scratch_directory, convert_skeleton, incremental, replay)
+    split_cache = bool(actor.cache_txt) and _can_split_cache(actor)
+    for job in jobs:
+        job.use_fragment = split_cache
+    if actor.behavior_directory and jobs:
+        stage_task = Task(f'stage:{scratch_directory}', partial(_stage_behaviors, actor, jobs, scratch_directory), 0.0)
+        tasks.append(stage_task)
+        dependencies.append(stage_task.key)
+    import_tasks = [
+        Task(job.animation_fbx, partial(_import_animation, job, timeout_retries, store),
+             history.estimate(job.animation_fbx), list(dependencies))
+        for job in jobs
+    ]
+    tasks.extend(import_tasks)
+
+    if split_cache and import_tasks:
+        tasks.append(Task(
+            actor.cache_txt, partial(_merge_cache, actor, import_tasks, jobs), 0.0,
+            [task.key for task in import_tasks], requires_success=False
+        ))
+    return tasks, list(zip(jobs, import_tasks)), failures
+
+
+def load_replay(replay_file: str) -> set[str]:
+    """Returns the animation fbx files listed in a replay file."""
+    with open(replay_file, 'r') as openfile:
+        return {line.strip() for line in openfile if line.strip()}
+
 
+def _write_results(directory: str, jobs: list[tuple[str, Task]], failures: dict[str, Exception]) -> dict:
+    """
+    Writes the results and the replay list of a batch, given the source file of each task, to the directory.
 
-def batch_import_animations(directory: str):
+    Quarantined animations are left out of the replay list: batches skip them until they are removed from the
+    quarantine file, so replaying them would convert nothing.
+    """
+    failures = dict(failures)
+    results = {'succeeded': [], 'quarantined': [], 'failed': []}
+    for source_file, task in jobs:
+        if task.error is not None:
+            failures[source_file] = task.error
+        elif task.result:
+            results['succeeded'].append(source_file)
+        elif task.duration is not None:
+            results['quarantined'].append(source_file)
+    for source_file, error in sorted(failures.items()):
+        results['failed'].append({'file': source_file, 'error': type(error).__name__, 'stderr': str(error).strip()})
 
-    for actor in Actor.in_directory(directory):
-        for filename in os.listdir(actor.animations_fbx):
-            if not filename.endswith('.fbx'):
+    with open(os.path.join(directory, RESULTS_FILENAME), 'w') as openfile:
+        json.dump(results, openfile, indent=2)
+    with open(os.path.join(directory, REPLAY_FILENAME), 'w') as openfile:
+        openfile.writelines(failure['file'] + '\n' for failure in results['failed'])
+    _logger.info(
+        '%s succeeded, %s quarantined, %s failed. Results written to %s',
+        len(results['succeeded']), len(results['quarantined']), len(results['failed']), RESULTS_FILENAME
+    )
+    return results
+
+
+def _get_exit_code(results: dict) -> int:
+    """Returns 1 if any animation of a batch failed or was quarantined, 0 otherwise."""
+    return 1 if results['failed'] or results['quarantined'] else 0
+
+
+def batch_import_animations(
+        directory: str, timeout_retries: int = 1, workers: int = 1, incremental: bool = False,
+        continue_on_error: bool = False, replay_file: str = '', store_directory: str = ''
+) -> dict:
+    """
+    Imports every animation fbx of every actor in a directory.
+
+    Conversions write their root motion to per-job cache fragments, which are merged into each actor's cache file
+    once all of its conversions are done. This keeps the shared cache file intact when converting in parallel. A cache
+    file that cannot be parsed is handed to ck-cmd whole instead, one conversion at a time.
+
+    Conversions are started longest-first, using the durations of previous runs recorded in the directory, or the
+    file size when an animation has not been converted before. Outdated legacy skeletons are converted before the
+    animations that depend on them.
+
+    Args:
+        directory(str): A directory containing actor configs.
+        timeout_retries(int): How many times a timed out conversion is retried before it is quarantined.
+        workers(int): The number of conversions to run at once.
+        incremental(bool): Skips animations whose hkx is newer than their fbx. Every animation is converted by
+            default.
+        continue_on_error(bool): Records failures and finishes the remaining work instead of raising. The results
+            are written to RESULTS_FILENAME and the failed animations to REPLAY_FILENAME in the directory.
+        replay_file(str): Only converts the animations listed in a replay file written by a previous batch.
+        store_directory(str): An optional ArtifactStore directory. Conversions with identical inputs across actors
+            and batches then run once, and the outputs are copied from the store.
+
+    Returns:
+        dict: The succeeded, quarantined and failed animations.
+    """
+    history = DurationHistory(os.path.join(directory, HISTORY_FILENAME))
+    replay = load_replay(replay_file) if replay_file else None
+    store = ArtifactStore(store_directory) if store_directory else None
+    scratch_directory = tempfile.mkdtemp(prefix='skywind_import_')
+    tasks = []
+    imports = []
+    failures = {}
+    skeleton_tasks = {}
+    try:
+        for actor in load_manifest(directory).get_actors():
+            actor_tasks, actor_imports, actor_failures = _get_actor_tasks(
+                actor, tempfile.mkdtemp(dir=scratch_directory), history, timeout_retries, incremental, replay,
+                skeleton_tasks, store
+            )
+            tasks.extend(actor_tasks)
+            imports.extend(actor_imports)
+            failures.update(actor_failures)
+        if failures and not continue_on_error:
+            raise next(iter(failures.values()))
+        run_tasks(tasks, workers, continue_on_error=continue_on_error)
+    finally:
+        for job, task in imports:
+            if task.result:
+                history.record(job.animation_fbx, task.duration)
+        history.save()
+        shutil.rmtree(scratch_directory, ignore_errors=True)
+    if store is not None:
+        store.collect_garbage()
+    return _write_results(directory, [(job.animation_fbx, task) for job, task in imports], failures)
+
+
+def _write_annotations(job: ImportJob) -> bool:
+    """Rewrites the annotation tracks of the hkx of a job from the tags of its fbx."""
+    from skywind.core.fbx.tags import load_animation_tags
+
+    _logger.info('Writing the tags of %s', job.animation_fbx)
+    tags = load_animation_tags(job.animation_fbx)
+    if tags is None:
+        raise ValueError(f'Failed to load the tags of {job.animation_fbx}')
+    write_animation_annotations(job.output_file, tags)
+    return True
+
+
+def batch_write_annotations(
+        directory: str, workers: int = 1, continue_on_error: bool = False, replay_file: str = ''
+) -> dict:
+    """
+    Writes the tags of every animation fbx of every actor in a directory into the annotations of its hkx.
+
+    This replaces a full import when only tags changed, see write_animation_annotations. Animations without an hkx
+    fail, as they need a full import.
+
+    Args:
+        directory(str): A directory containing actor configs.
+        workers(int): The number of animations to update at once.
+        continue_on_error(bool): Records failures and finishes the remaining work instead of raising. The results
+            are written to RESULTS_FILENAME and the failed animations to REPLAY_FILENAME in the directory.
+        replay_file(str): Only updates the animations listed in a replay file written by a previous batch.
+
+    Returns:
+        dict: The succeeded, quarantined and failed animations.
+    """
+    replay = load_replay(replay_file) if replay_file else None
+    tasks = []
+    imports = []
+    failures = {}
+    for actor in load_manifest(directory).get_actors():
+        quarantined = load_quarantine(actor)
+        for filename in sorted(os.listdir(actor.animations_fbx)):
+            if not filename.endswith('.fbx') or filename in quarantined:
+                continue
+            job = ImportJob(actor, os.path.join(actor.animations_fbx, filename), '')
+            if replay is not None and job.animation_fbx not in replay:
+                continue
+            if not os.path.exists(job.output_file):
+                failures[job.animation_fbx] = FileNotFoundError(f'{job.output_file} does not exist')
                 continue
-            filepath = os.path.join(actor.animations_fbx, filename)
-            output_file = os.path.join(
-                actor.animations_hkx, os.path.basename(filepath).replace('.fbx', '.hkx')
+            task = Task(job.animation_fbx, partial(_write_annotations, job), os.path.getsize(job.output_file))
+            tasks.append(task)
+            imports.append((job, task))
+    if failures and not continue_on_error:
+        raise next(iter(failures.values()))
+    run_tasks(tasks, workers, continue_on_error=continue_on_error)
+    return _write_results(directory, [(job.animation_fbx, task) for job, task in imports], failures)
+
+
+@dataclass
+class ExportJob:
+    actor: Actor
+    animation_hkx: str
+    scratch_directory: str
+    skeleton_le_hkx: str
+    output_directory: str
+
+    @property
+    def name(self) -> str:
+        return os.path.basename(self.animation_hkx).replace('.hkx', '')
+
+    @property
+    def output_file(self) -> str:
+        return os.path.join(self.output_directory, f'{self.name}.fbx')
+
+
+def get_export_directory(actor: Actor, directory: str = '', output_directory: str = '') -> str:
+    """
+    Returns the directory the animations of an actor are exported to.
+
+    Exports never go to the actor's animation fbx directory, which holds the authored animations.
+
+    Args:
+        actor(Actor): The actor.
+        directory(str): The directory containing the actor configs of the batch.
+        output_directory(str): The output directory of the batch. Each actor exports to the path of its animation
+            fbx directory relative to the batch directory within it. Defaults to EXPORT_DIRECTORY within the actor's
+            animation fbx directory, which batch imports do not read from.
+    """
+    if not output_directory:
+        return os.path.join(actor.animations_fbx, EXPORT_DIRECTORY)
+    return os.path.normpath(os.path.join(output_directory, os.path.relpath(actor.animations_fbx, directory)))
+
+
+def _export_animation(job: ExportJob, timeout_retries: int) -> bool:
+    """Exports an animation, retrying stalled conversions."""
+    _logger.info('Exporting animation from %s', job.animation_hkx)
+    job_directory = os.path.join(job.scratch_directory, job.name)
+    for attempt in range(timeout_retries + 1):
+        try:
+            os.makedirs(job_directory, exist_ok=True)
+            convert_animation_hkx_to_fbx(
+                job.actor.skeleton_hkx, job.animation_hkx, job.output_directory,
+                skeleton_le_hkx=job.skeleton_le_hkx, scratch_directory=job_directory
             )
-            _logger.info('Importing animation from %s', filepath)
-            for required_file in (actor.skeleton_le_hkx, filepath, os.path.dirname(output_file)):
-                if not os.path.exists(required_file):
-                    raise FileNotFoundError(f'{required_file} does not exist')
-            convert_animation_fbx_to_hkx(actor.skeleton_le_hkx, filepath, os.path.dirname(output_file))
-            _logger.info('Imported animation to %s', output_file)
+            break
+        except CkCmdTimeout:
+            _logger.warning(
+                'Export of %s timed out (attempt %s of %s)', job.animation_hkx, attempt + 1, timeout_retries + 1
+            )
+            if attempt == timeout_retries:
+                raise
+        finally:
+            shutil.rmtree(job_directory, ignore_errors=True)
+    if not os.path.exists(job.output_file):
+        raise FileNotFoundError(f'Failed to export {job.animation_hkx}')
+    _logger.info('Exported animation to %s', job.output_file)
+    return True
 
 
-if __name__ == '__main__':
+def _get_export_jobs(
+        actor: Actor, scratch_directory: str, skeleton_le_hkx: str, output_directory: str, force: bool,
+        replay: set[str] | None
+) -> tuple[list[ExportJob], dict[str, Exception]]:
+    """Returns the export jobs of an actor, along with the animations that would overwrite an outdated fbx."""
+    jobs = []
+    failures = {}
+    for filename in sorted(os.listdir(actor.animations_hkx)):
+        if not filename.endswith('.hkx'):
+            continue
+        job = ExportJob(
+            actor, os.path.join(actor.animations_hkx, filename), scratch_directory, skeleton_le_hkx, output_directory
+        )
+        if replay is not None and job.animation_hkx not in replay:
+            continue
+        if not force and os.path.exists(job.output_file):
+            if os.path.getmtime(job.output_file) >= os.path.getmtime(job.animation_hkx):
+                _logger.debug('Skipping up to date animation %s', filename)
+            else:
+                failures[job.animation_hkx] = FileExistsError(
+                    f'{job.output_file} already exists, export with force to overwrite it'
+                )
+            continue
+        jobs.append(job)
+    return jobs, failures
+
+
+def _get_actor_export_tasks(
+        actor: Actor, scratch_directory: str, history: DurationHistory, timeout_retries: int, output_directory: str,
+        force: bool, replay: set[str] | None, skeleton_tasks: dict[str, Task]
+) -> tuple[list[Task], list[tuple[ExportJob, Task]], dict[str, Exception]]:
+    """
+    Returns the tasks exporting the animations of an actor, the export job of each animation task and the
+    animations that cannot be exported.
+
+    The skeleton is converted to legacy once per actor. Actors without a legacy skeleton get one in the scratch
+    directory, outdated legacy skeletons are updated in place, as when importing.
+    """
+    try:
+        skeleton_le_hkx = actor.skeleton_le_hkx
+        temporary_skeleton = False
+    except KeyError:
+        skeleton_le_hkx = os.path.join(scratch_directory, 'skeleton_le.hkx')
+        temporary_skeleton = True
+
+    jobs, failures = _get_export_jobs(actor, scratch_directory, skeleton_le_hkx, output_directory, force, replay)
+    if not jobs:
+        return [], [], failures
 
-    directory = None
+    tasks = []
+    dependencies = []
+    if temporary_skeleton:
+        tasks.append(Task(
+            skeleton_le_hkx, partial(convert_hkx_to_le_hkx, actor.skeleton_hkx, skeleton_le_hkx),
+            history.estimate(actor.skeleton_hkx)
+        ))
+        dependencies.append(skeleton_le_hkx)
+    elif _needs_skeleton_conversion(actor):
+        dependencies.append(_add_skeleton_task(actor, scratch_directory, history, skeleton_tasks, None, tasks))
+    os.makedirs(output_directory, exist_ok=True)
+    export_tasks = [
+        Task(job.animation_hkx, partial(_export_animation, job, timeout_retries), history.estimate(job.animation_hkx),
+             list(dependencies))
+        for job in jobs
+    ]
+    tasks.extend(export_tasks)
+    return tasks, list(zip(jobs, export_tasks)), failures
+
+
+def batch_export_animations(
+        path: str, output_directory: str = '', timeout_retries: int = 1, workers: int = 1, force: bool = False,
+        continue_on_error: bool = False, replay_file: str = ''
+) -> dict:
+    """
+    Exports every animation hkx of an actor, or of every actor in a directory, to fbx.
+
+    Each skeleton is converted once, and the animations are converted on a pool of workers, longest-first, each in
+    its own scratch directory. The fbx are written to a separate directory, see get_export_directory, so the
+    authored animations are never overwritten. Animations whose fbx is newer than their hkx are skipped, and existing
+    fbx are never overwritten unless forced.
+
+    Args:
+        path(str): An actor config, or a directory containing actor configs.
+        output_directory(str): The directory to export to, see get_export_directory.
+        timeout_retries(int): How many times a timed out conversion is retried before it fails.
+        workers(int): The number of conversions to run at once.
+        force(bool): Exports every animation, overwriting existing fbx.
+        continue_on_error(bool): Records failures and finishes the remaining work instead of raising. The results
+            are written to RESULTS_FILENAME and the failed animations to REPLAY_FILENAME in the directory.
+        replay_file(str): Only exports the animations listed in a replay file written by a previous batch.
+
+    Returns:
+        dict: The succeeded, quarantined and failed animations.
+    """
+    if os.path.isfile(path):
+        actors = [Actor(path)]
+        directory = os.path.dirname(os.path.abspath(path))
+    else:
+        actors = load_manifest(path).get_actors()
+        directory = path
+    history = DurationHistory(os.path.join(directory, HISTORY_FILENAME))
+    replay = load_replay(replay_file) if replay_file else None
+    scratch_directory = tempfile.mkdtemp(prefix='skywind_export_')
+    tasks = []
+    exports = []
+    failures = {}
+    skeleton_tasks = {}
+    try:
+        for actor in actors:
+            actor_tasks, actor_exports, actor_failures = _get_actor_export_tasks(
+                actor, tempfile.mkdtemp(dir=scratch_directory), history, timeout_retries,
+                get_export_directory(actor, directory, output_directory), force, replay, skeleton_tasks
+            )
+            tasks.extend(actor_tasks)
+            exports.extend(actor_exports)
+            failures.update(actor_failures)
+        if failures and not continue_on_error:
+            raise next(iter(failures.values()))
+        run_tasks(tasks, workers, continue_on_error=continue_on_error)
+    finally:
+        for job, task in exports:
+            if task.result:
+                history.record(job.animation_hkx, task.duration)
+        history.save()
+        shutil.rmtree(scratch_directory, ignore_errors=True)
+    return _write_results(directory, [(job.animation_hkx, task) for job, task in exports], failures)
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description='Imports every animation fbx of every actor in a directory.')
+    parser.add_argument('directory', nargs='?', help='A directory, or an actor config when exporting')
+    parser.add_argument('--export', action='store_true', help='Exports every animation hkx to fbx instead')
+    parser.add_argument(
+        '--output', default='',
+        help=f'The directory to export to. Defaults to {EXPORT_DIRECTORY} within each animation fbx directory'
+    )
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--force', action='store_true', help='Overwrites existing fbx when exporting')
+    parser.add_argument(
+        '--incremental', action='store_true', help='Skips animations whose hkx is newer than their fbx when importing'
+    )
+    parser.add_argument(
+        '--tags-only', action='store_true',
+        help='Only writes the tags of every animation fbx into the annotations of its existing hkx when importing'
+    )
+    parser.add_argument('--continue-on-error', action='store_true')
+    parser.add_argument('--replay', default='', help='A replay file written by a previous batch')
+    parser.add_argument(
+        '--store', default=os.environ.get(STORE_ENVIRONMENT_VARIABLE, ''),
+        help=f'An artifact store to reuse identical conversions from. Defaults to ${STORE_ENVIRONMENT_VARIABLE}'
+    )
+    options = parser.parse_args(argv)
+
+    directory = options.directory
     while directory is None:
         input_text = input('Enter a directory: ')
         if not os.path.exists(input_text):
@@ -39,4 +677,26 @@ if __name__ == '__main__':
             continue
         directory = input_text
 
-    batch_import_animations(directory)
\ No newline at end of file
+    if options.export:
+        results = batch_export_animations(
+            directory, output_directory=options.output, workers=options.workers, force=options.force,
+            continue_on_error=options.continue_on_error, replay_file=options.replay
+        )
+        return _get_exit_code(results)
+    if options.tags_only:
+        results = batch_write_annotations(
+            directory, workers=options.workers, continue_on_error=options.continue_on_error,
+            replay_file=options.replay
+        )
+        return _get_exit_code(results)
+    results = batch_import_animations(
+        directory, workers=options.workers, incremental=options.incremental,
+        continue_on_error=options.continue_on_error, replay_file=options.replay, store_directory=options.store
+    )
+    return _get_exit_code(results)
+
+
+if __name__ == '__main__':
+    from skywind.core import log
+    log.initialize()
+    sys.exit(main(sys.argv[1:]))
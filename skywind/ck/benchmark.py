@@ -0,0 +1,169 @@
+"""
+Benchmarks the batch orchestration in skywind.ck on synthetic projects, using the converter stand-ins.
+
+Usage:
+    python -m skywind.ck.benchmark [--sizes 10 100 1000 5000] [--workers 8] [--latency 0.05]
+    python -m skywind.ck.benchmark --behavior-actor path/to/character.actor.json [--invocations 5] [--fake]
+"""
+import os
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import subprocess
+import contextlib
+
+from skywind.core.actor import Actor
+from skywind.ck import api
+from skywind.ck.backends import FakeBackend
+from skywind.ck.batch import batch_import_animations
+from skywind.ck.staging import stage_behavior_directory
+
+
+ANIMATION_SIZE = 64 * 1024
+
+
+def create_synthetic_project(directory: str, animations: int, actors: int = 1) -> list[str]:
+    """
+    Creates actors with empty skeletons and random animation fbx files.
+
+    Returns:
+        list[str]: The animation fbx files.
+    """
+    animation_files = []
+    for actor_index in range(actors):
+        actor_directory = os.path.join(directory, f'actor{actor_index}')
+        os.makedirs(os.path.join(actor_directory, 'animations'))
+        os.makedirs(os.path.join(actor_directory, 'hkx'))
+        with open(os.path.join(actor_directory, 'skeleton_le.hkx'), 'w') as openfile:
+            openfile.write('skeleton')
+        with open(os.path.join(actor_directory, f'actor{actor_index}.actor.json'), 'w') as openfile:
+            json.dump({
+                'skeleton_le_hkx': 'skeleton_le.hkx',
+                'animations_fbx': 'animations',
+                'animations_hkx': 'hkx',
+                'cache_txt': 'cache.txt',
+            }, openfile)
+        for index in range(actor_index, animations, actors):
+            filepath = os.path.join(actor_directory, 'animations', f'animation{index:05}.fbx')
+            with open(filepath, 'wb') as openfile:
+                openfile.write(os.urandom(ANIMATION_SIZE))
+            animation_files.append(filepath)
+    return animation_files
+
+
+def _time(function, *args, **kwargs) -> float:
+    start = time.perf_counter()
+    function(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def measure_overhead(directory: str, animations: int) -> dict[str, float]:
+    """Compares a serial batch against spawning the same number of stand-in processes directly."""
+    animation_files = create_synthetic_project(directory, animations)
+    backend = FakeBackend()
+    start = time.perf_counter()
+    for filepath in animation_files:
+        subprocess.run(f'{backend.get_command(api.CKCMD)} --help', shell=True, stdout=subprocess.DEVNULL)
+    spawn = time.perf_counter() - start
+    batch = _time(batch_import_animations, directory, workers=1)
+    return {'spawn': spawn, 'batch': batch, 'overhead_per_job': (batch - spawn) / animations}
+
+
+def measure_speedup(directory: str, animations: int, workers: int) -> dict[str, float]:
+    """Compares a serial batch against a parallel batch of the same project."""
+    create_synthetic_project(directory, animations, actors=2)
+    serial = _time(batch_import_animations, directory, workers=1)
+    parallel = _time(batch_import_animations, directory, workers=workers)
+    return {'serial': serial, 'parallel': parallel, 'speedup': serial / parallel}
+
+
+def measure_incremental(directory: str, animations: int, workers: int, changed: float = 0.01) -> dict[str, float]:
+    """Compares a full batch against a rebuild after a fraction of the animations changed."""
+    animation_files = create_synthetic_project(directory, animations)
+    full = _time(batch_import_animations, directory, workers=workers, incremental=True)
+    unchanged = _time(batch_import_animations, directory, workers=workers, incremental=True)
+    modified = animation_files[:max(1, int(len(animation_files) * changed))]
+    timestamp = time.time() + 1
+    for filepath in modified:
+        os.utime(filepath, (timestamp, timestamp))
+    incremental = _time(batch_import_animations, directory, workers=workers, incremental=True)
+    return {'full': full, 'unchanged': unchanged, 'incremental': incremental, 'changed': len(modified)}
+
+
+def measure_behavior_staging(actor_config: str, invocations: int) -> dict[str, float]:
+    """Times importanimation on a real actor with its full behavior directory and with a staged one."""
+    actor = Actor(actor_config)
+    animation_files = sorted(
+        os.path.join(actor.animations_fbx, filename) for filename in os.listdir(actor.animations_fbx)
+        if filename.endswith('.fbx')
+    )
+    scratch_directory = tempfile.mkdtemp(prefix='skywind_benchmark_')
+    try:
+        start = time.perf_counter()
+        staged_directory = stage_behavior_directory(
+            actor.behavior_directory, animation_files, os.path.join(scratch_directory, 'behaviors')
+        )
+        staging = time.perf_counter() - start
+        timings = {}
+        for key, behavior_directory in (('full', actor.behavior_directory), ('staged', staged_directory)):
+            output_directory = os.path.join(scratch_directory, f'output_{key}')
+            os.makedirs(output_directory)
+            timings[key] = sum(
+                _time(api.convert_animation_fbx_to_hkx, actor.skeleton_le_hkx, filepath, output_directory,
+                      behavior_directory=behavior_directory)
+                for filepath in animation_files[:invocations]
+            ) / min(invocations, len(animation_files))
+    finally:
+        shutil.rmtree(scratch_directory, ignore_errors=True)
+    return {'staging': staging, 'full': timings['full'], 'staged': timings['staged'],
+            'saving_per_invocation': timings['full'] - timings['staged']}
+
+
+def _run(measure, animations: int, *args) -> dict[str, float]:
+    directory = tempfile.mkdtemp(prefix='skywind_benchmark_')
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            return measure(directory, animations, *args)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000, 5000])
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--behavior-actor', help='Measures behavior staging on a real actor config instead')
+    parser.add_argument('--invocations', type=int, default=5)
+    parser.add_argument('--fake', action='store_true', help='Uses the converter stand-ins with --behavior-actor')
+    options = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    previous_backend = api.get_backend()
+    if options.behavior_actor:
+        if options.fake:
+            api.set_backend(FakeBackend())
+        try:
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                result = measure_behavior_staging(options.behavior_actor, options.invocations)
+            print('behavior staging:', result)
+        finally:
+            api.set_backend(previous_backend)
+        return
+
+    try:
+        for animations in options.sizes:
+            api.set_backend(FakeBackend())
+            print(animations, 'animations, overhead:', _run(measure_overhead, animations))
+            api.set_backend(FakeBackend(latency=options.latency))
+            print(animations, 'animations, speedup:', _run(measure_speedup, animations, options.workers))
+            print(animations, 'animations, incremental:', _run(measure_incremental, animations, options.workers))
+    finally:
+        api.set_backend(previous_backend)
+
+
+if __name__ == '__main__':
+    main()
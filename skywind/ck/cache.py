@@ -0,0 +1,152 @@
+"""
+Module for reading and updating root motion cache files written by ck-cmd.
+
+A cache file is a sequence of entries separated by blank lines. The first line of an entry names the animation it
+belongs to, the remaining lines hold its root motion data. This layout is taken from the cache files ck-cmd writes for
+our actors, not from a specification, so files that do not follow it are refused instead of rewritten: every entry must
+name a different animation, and an entry's lines are kept as they are.
+"""
+import os
+import shutil
+import logging
+import tempfile
+from functools import lru_cache
+
+
+_logger = logging.getLogger(__name__)
+__all__ = ['AnimationCache', 'CacheFormatError', 'write_cache_fragment', 'merge_cache_fragments']
+
+
+class CacheFormatError(ValueError):
+    """Raised when a cache file does not have the layout this module expects."""
+
+
+class AnimationCache:
+    """
+    A cache file loaded into entries indexed by animation name.
+
+    Entries keep their order and formatting, so saving after updating a few entries only changes those entries.
+    """
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self.modified = False
+        self._entries = {}
+        self._newline = '\n'
+        if os.path.exists(filepath):
+            with open(filepath, 'r', newline='') as openfile:
+                text = openfile.read()
+            if '\r\n' in text:
+                self._newline = '\r\n'
+            self._parse(text.splitlines())
+
+    def _parse(self, lines: list[str]):
+        entry = []
+        for line in lines + ['']:
+            if line.strip():
+                entry.append(line)
+            elif entry:
+                name = entry[0].strip()
+                if name in self._entries:
+                    raise CacheFormatError(f'{self.filepath} has more than one entry named {name}')
+                self._entries[name] = entry
+                entry = []
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._entries
+
+    def __getitem__(self, name: str) -> list[str]:
+        return self._entries[name]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def names(self) -> list[str]:
+        return list(self._entries)
+
+    def update(self, name: str, lines: list[str]):
+        """Replaces the entry of an animation in place, or appends it if the animation has no entry yet."""
+        if self._entries.get(name) != lines:
+            self._entries[name] = lines
+            self.modified = True
+
+    def update_from(self, other: 'AnimationCache') -> list[str]:
+        """Updates the entries of every animation in another cache. Returns the names of the updated entries."""
+        for name in other.names():
+            _logger.debug('Updating cache entry %s from %s', name, other.filepath)
+            self.update(name, other[name])
+        return other.names()
+
+    def remove(self, name: str):
+        if self._entries.pop(name, None) is not None:
+            self.modified = True
+
+    def save(self):
+        """Writes the cache atomically, so an interrupted write never leaves a truncated cache file."""
+        directory = os.path.dirname(os.path.abspath(self.filepath))
+        handle, temp_path = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+        try:
+            if os.path.exists(self.filepath):
+                shutil.copymode(self.filepath, temp_path)
+            with os.fdopen(handle, 'w', newline=self._newline) as openfile:
+                openfile.write('\n\n'.join('\n'.join(lines) for lines in self._entries.values()))
+                openfile.write('\n')
+            os.replace(temp_path, self.filepath)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        self.modified = False
+
+
+@lru_cache(maxsize=4)
+def _read_cache(cache_txt: str, mtime: int) -> AnimationCache:
+    return AnimationCache(cache_txt)
+
+
+def write_cache_fragment(cache_txt: str, fragment: str, names: list[str]) -> list[str]:
+    """
+    Writes a cache fragment holding the existing entries of some animations, so a conversion writing to the fragment
+    starts from the same entries it would find in the cache file.
+
+    Args:
+        cache_txt(str): The cache file to read the entries from. Nothing is written if it does not exist.
+        fragment(str): The fragment to write.
+        names(list[str]): The animations to copy the entries of. Animations without an entry are skipped.
+
+    Returns:
+        list[str]: The names of the copied entries.
+    """
+    if not os.path.exists(cache_txt):
+        return []
+    cache = _read_cache(os.path.abspath(cache_txt), os.stat(cache_txt).st_mtime_ns)
+    names = [name for name in names if name in cache]
+    if not names:
+        return []
+    seed = AnimationCache(fragment)
+    for name in names:
+        seed.update(name, cache[name])
+    seed.save()
+    return names
+
+
+def merge_cache_fragments(cache_txt: str, fragments: list[str]) -> list[str]:
+    """
+    Merges per-job cache fragments into a cache file.
+
+    Entries in the fragments replace entries of the same name, every other entry is kept in place. New entries are
+    appended in fragment order, so the result only depends on the fragments, not the order the jobs finished in.
+
+    Args:
+        cache_txt(str): The cache file to update.
+        fragments(list[str]): Cache files written by individual conversions. Missing fragments are ignored.
+
+    Returns:
+        list[str]: The names of the merged entries.
+    """
+    cache = AnimationCache(cache_txt)
+    merged = []
+    for fragment in sorted(fragments):
+        merged.extend(cache.update_from(AnimationCache(fragment)))
+    if cache.modified:
+        cache.save()
+    return merged
@@ -0,0 +1,112 @@
+"""
+Python stand-ins for the ck-cmd and hkxconv executables.
+
+The stand-ins accept the same command lines as the real tools and write plausible outputs, so the batch logic in
+skywind.ck can run on machines without the executables. Latency, failures and hangs can be injected to exercise
+timeouts and error handling.
+
+Usage:
+    python fake.py [--latency S] [--latency-per-mb S] [--failure-rate R] [--hang-rate R] ck-cmd importanimation ...
+"""
+import os
+import sys
+import time
+import zlib
+import argparse
+
+
+def _rolls_under(key: str, rate: float, salt: str) -> bool:
+    """Deterministically decides per input whether an injected event happens, so reruns behave the same."""
+    value = zlib.crc32(f'{salt}:{key}'.encode()) % 10000
+    return value < rate * 10000
+
+
+def _write(filepath: str, content: str):
+    os.makedirs(os.path.dirname(os.path.abspath(filepath)), exist_ok=True)
+    with open(filepath, 'w') as openfile:
+        openfile.write(content)
+
+
+def _read_behavior_directory(behavior_directory: str):
+    """Reads every file of a behavior directory, as ck-cmd does on each invocation."""
+    for root, dirs, files in os.walk(behavior_directory):
+        for filename in files:
+            with open(os.path.join(root, filename), 'rb') as openfile:
+                openfile.read()
+
+
+def _name(filepath: str) -> str:
+    return os.path.basename(filepath).split('.')[0]
+
+
+def _hkxconv(args: list[str]):
+    parser = argparse.ArgumentParser(prog='hkxconv', allow_abbrev=False)
+    parser.add_argument('command', choices=['convert'])
+    parser.add_argument('input')
+    parser.add_argument('output')
+    parsed = parser.parse_args(args)
+    _write(parsed.output, f'<?xml version="1.0" encoding="ascii"?>\n<hkpackfile source="{parsed.input}"/>\n')
+
+
+def _ckcmd(args: list[str]):
+    parser = argparse.ArgumentParser(prog='ck-cmd', allow_abbrev=False)
+    parser.add_argument('command', choices=['convert', 'exportrig', 'importanimation', 'exportanimation'])
+    parser.add_argument('inputs', nargs='+')
+    for option in ('--a', '--b', '--c', '--e', '--n', '-o', '-v', '-f'):
+        parser.add_argument(option, default='')
+    parsed = parser.parse_args(args)
+
+    if parsed.b:
+        _read_behavior_directory(parsed.b)
+
+    if parsed.command == 'convert':
+        _write(parsed.o, f'hkx {parsed.v} {parsed.inputs[0]}\n')
+    elif parsed.command == 'exportrig':
+        _write(parsed.e, f'fbx rig {parsed.inputs[0]}\n')
+    elif parsed.command == 'exportanimation':
+        _write(os.path.join(parsed.e, _name(parsed.inputs[1]) + '.fbx'), f'fbx animation {parsed.inputs[1]}\n')
+    elif parsed.command == 'importanimation':
+        name = _name(parsed.inputs[1])
+        _write(os.path.join(parsed.e, name + '.hkx'), f'hkx animation {parsed.inputs[1]}\n')
+        if parsed.c:
+            # Replaces the entry of the animation and keeps the others, as ck-cmd does
+            entries = []
+            if os.path.exists(parsed.c):
+                with open(parsed.c, 'r') as openfile:
+                    entries = [entry.strip('\n') for entry in openfile.read().split('\n\n') if entry.strip()]
+            entries = [entry for entry in entries if entry.splitlines()[0].strip() != name]
+            size = os.path.getsize(parsed.inputs[1])
+            entries.append(f'{name}\n{size / 1024:.6f}\n1\n0 0 0 0\n1\n0 0 0 0 1')
+            _write(parsed.c, '\n\n'.join(entries) + '\n')
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(prog='fake', allow_abbrev=False)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--latency-per-mb', type=float, default=0.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--hang-rate', type=float, default=0.0)
+    parser.add_argument('tool', choices=['ck-cmd', 'hkxconv'])
+    options, args = parser.parse_known_args(argv)
+
+    sources = [arg for arg in args if os.path.isfile(arg)]
+    size = sum(os.path.getsize(source) for source in sources)
+    time.sleep(options.latency + options.latency_per_mb * size / (1024 * 1024))
+    key = ' '.join(os.path.basename(source) for source in sources)
+    if _rolls_under(key, options.hang_rate, 'hang'):
+        while True:
+            time.sleep(60)
+    if _rolls_under(key, options.failure_rate, 'failure'):
+        sys.stderr.write(f'Exception: injected failure for {key}\n')
+        return 1
+
+    if options.tool == 'hkxconv':
+        _hkxconv(args)
+    else:
+        _ckcmd(args)
+    print(f'{options.tool} {" ".join(args)}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
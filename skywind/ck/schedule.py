@@ -0,0 +1,193 @@
+"""Module for scheduling conversion tasks longest-first using historical durations."""
+import os
+import json
+import time
+import heapq
+import logging
+import threading
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable
+
+
+_logger = logging.getLogger(__name__)
+__all__ = ['DurationHistory', 'Task', 'DependencyFailed', 'estimate_makespan', 'run_tasks']
+HISTORY_FILENAME = '.conversion_history.json'
+DEFAULT_SECONDS_PER_MEGABYTE = 10.0
+MINIMUM_ESTIMATE = 1.0
+REPORT_LINES = 10
+
+
+class DurationHistory:
+    """Conversion durations of past runs, keyed by input file."""
+
+    def __init__(self, filepath: str):
+        self._filepath = filepath
+        self._lock = threading.Lock()
+        self._data = {}
+        self._seconds_per_byte = None
+        if os.path.exists(filepath):
+            with open(filepath, 'r') as openfile:
+                self._data = json.load(openfile)
+
+    def _get_seconds_per_byte(self) -> float:
+        if self._seconds_per_byte is None:
+            sizes = sum(record['size'] for record in self._data.values())
+            durations = sum(record['duration'] for record in self._data.values())
+            if sizes == 0 or durations == 0:
+                self._seconds_per_byte = DEFAULT_SECONDS_PER_MEGABYTE / (1024 * 1024)
+            else:
+                self._seconds_per_byte = durations / sizes
+        return self._seconds_per_byte
+
+    def estimate(self, filepath: str) -> float:
+        """Returns the last recorded duration of a file, or an estimate based on its size."""
+        record = self._data.get(filepath)
+        if record is not None:
+            return record['duration']
+        size = os.path.getsize(filepath) if os.path.exists(filepath) else 0
+        return max(MINIMUM_ESTIMATE, size * self._get_seconds_per_byte())
+
+    def record(self, filepath: str, duration: float):
+        with self._lock:
+            self._data[filepath] = {'duration': duration, 'size': os.path.getsize(filepath)}
+            self._seconds_per_byte = None
+
+    def save(self):
+        with self._lock, open(self._filepath, 'w') as openfile:
+            json.dump(self._data, openfile)
+
+
+@dataclass
+class Task:
+    key: str
+    run: Callable[[], Any]
+    estimate: float
+    dependencies: list[str] = field(default_factory=list)
+    requires_success: bool = True
+    result: Any = None
+    duration: float | None = None
+    error: BaseException | None = None
+
+
+def _get_dependents(tasks: list[Task]) -> dict[str, list[Task]]:
+    dependents = {task.key: [] for task in tasks}
+    for task in tasks:
+        for dependency in task.dependencies:
+            dependents[dependency].append(task)
+    return dependents
+
+
+def _get_priorities(tasks: list[Task], dependents: dict[str, list[Task]]) -> dict[str, float]:
+    """Returns the critical path length of each task: its estimate plus the longest chain of tasks depending on it."""
+    priorities = {}
+
+    def get_priority(task: Task) -> float:
+        if task.key not in priorities:
+            priorities[task.key] = task.estimate + max(
+                (get_priority(dependent) for dependent in dependents[task.key]), default=0.0
+            )
+        return priorities[task.key]
+
+    for task in tasks:
+        get_priority(task)
+    return priorities
+
+
+def estimate_makespan(tasks: list[Task], workers: int) -> float:
+    """Simulates running the tasks on a number of workers and returns the estimated total duration."""
+    dependents = _get_dependents(tasks)
+    priorities = _get_priorities(tasks, dependents)
+    remaining = {task.key: set(task.dependencies) for task in tasks}
+    ready = [(-priorities[task.key], task.key, task) for task in tasks if not task.dependencies]
+    heapq.heapify(ready)
+    running = []  # (finish time, key)
+    now = 0.0
+    while ready or running:
+        while ready and len(running) < workers:
+            _, key, task = heapq.heappop(ready)
+            heapq.heappush(running, (now + task.estimate, key))
+        now, key = heapq.heappop(running)
+        for other in dependents[key]:
+            remaining[other.key].remove(key)
+            if not remaining[other.key]:
+                heapq.heappush(ready, (-priorities[other.key], other.key, other))
+    return now
+
+
+def _log_report(tasks: list[Task], planned: float, actual: float):
+    _logger.info('Planned makespan %.1fs, actual makespan %.1fs', planned, actual)
+    finished = [task for task in tasks if task.duration is not None]
+    finished.sort(key=lambda task: abs(task.duration - task.estimate), reverse=True)
+    for task in finished[:REPORT_LINES]:
+        _logger.info('  %s: planned %.1fs, actual %.1fs', task.key, task.estimate, task.duration)
+    _logger.info(
+        'Total work planned %.1fs, actual %.1fs',
+        sum(task.estimate for task in finished), sum(task.duration for task in finished)
+    )
+
+
+def _run_task(task: Task):
+    start = time.perf_counter()
+    try:
+        task.result = task.run()
+    except Exception as e:
+        _logger.error('%s failed: %s', task.key, e)
+        task.error = e
+    finally:
+        task.duration = time.perf_counter() - start
+
+
+class DependencyFailed(Exception):
+    """Stored on tasks that were skipped because a task they require failed."""
+
+
+def run_tasks(tasks: list[Task], workers: int, continue_on_error: bool = False):
+    """
+    Runs tasks on a pool of workers, always starting the ready task with the longest critical path first.
+
+    A task only starts once all of its dependencies have finished. If a task raises, no further tasks are started and
+    the exception is raised once the running tasks have finished.
+
+    Args:
+        tasks(list[Task]): The tasks to run. Results, durations and errors are stored on the tasks.
+        workers(int): The number of tasks to run at once.
+        continue_on_error(bool): Keeps running after a task raises. Tasks requiring the success of a failed task are
+            skipped with a DependencyFailed error, and nothing is raised.
+    """
+    dependents = _get_dependents(tasks)
+    priorities = _get_priorities(tasks, dependents)
+    planned = estimate_makespan(tasks, workers)
+    _logger.info('Scheduling %s tasks on %s workers, estimated makespan %.1fs', len(tasks), workers, planned)
+
+    start = time.perf_counter()
+    remaining = {task.key: set(task.dependencies) for task in tasks}
+    ready = [(-priorities[task.key], task.key, task) for task in tasks if not task.dependencies]
+    heapq.heapify(ready)
+    running = {}
+    error = None
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while running or (ready and error is None):
+            while ready and error is None and len(running) < workers:
+                _, key, task = heapq.heappop(ready)
+                running[executor.submit(_run_task, task)] = task
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            finished = [running.pop(future) for future in done]
+            while finished:
+                task = finished.pop()
+                if task.error is not None and not continue_on_error:
+                    error = error or task.error
+                    continue
+                for other in dependents[task.key]:
+                    remaining[other.key].remove(task.key)
+                    if task.error is not None and other.requires_success and other.error is None:
+                        other.error = DependencyFailed(f'{task.key} failed')
+                    if not remaining[other.key]:
+                        if other.error is None:
+                            heapq.heappush(ready, (-priorities[other.key], other.key, other))
+                        else:
+                            finished.append(other)
+
+    _log_report(tasks, planned, time.perf_counter() - start)
+    if error is not None:
+        raise error
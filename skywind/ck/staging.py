@@ -0,0 +1,113 @@
+"""
+Module for staging minimal behavior directories.
+
+ck-cmd parses every file of the behavior directory it is given on each invocation. A staged directory only links the
+behavior files that lead to the animations being converted, so repeated conversions of one actor parse far less.
+"""
+import os
+import re
+import shutil
+import logging
+
+
+_logger = logging.getLogger(__name__)
+__all__ = ['link_file', 'stage_behavior_directory']
+# Paths behavior files reference other files by, e.g. characters\defaultmale.hkx, matched in lowercase contents
+REFERENCE_PATTERN = re.compile(rb'[a-z0-9_\-. \\/]+\.(?:hkx|xml)')
+ANIMATIONS_DIRECTORY = b'animations'
+
+
+def link_file(source: str, destination: str):
+    """Hardlinks a file, falling back to a copy across drives or on file systems without hardlinks."""
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+
+def _read_behavior_files(behavior_directory: str) -> dict[str, bytes]:
+    contents = {}
+    for root, dirs, files in os.walk(behavior_directory):
+        for filename in files:
+            filepath = os.path.join(root, filename)
+            with open(filepath, 'rb') as openfile:
+                contents[filepath] = openfile.read().lower()
+    return contents
+
+
+def _get_referencing_files(contents: dict[str, bytes], names: set[bytes]) -> set[str]:
+    """Returns the files referencing any of the names, along with every file referencing those, and so on."""
+    referencing = set()
+    while names:
+        found = {
+            filepath for filepath, data in contents.items()
+            if filepath not in referencing and any(name in data for name in names)
+        }
+        referencing.update(found)
+        names = {os.path.basename(filepath).lower().encode() for filepath in found}
+    return referencing
+
+
+def _get_referenced_files(contents: dict[str, bytes], files: set[str]) -> tuple[set[str], set[bytes]]:
+    """
+    Returns the files referenced by any of the files, along with every file those reference, and so on.
+
+    References are resolved by filename. References to animations are left to the converter, and any other reference
+    that does not resolve is returned as missing.
+    """
+    by_name = {}
+    for filepath in contents:
+        by_name.setdefault(os.path.basename(filepath).lower().encode(), set()).add(filepath)
+    referenced = set()
+    missing = set()
+    pending = set(files)
+    while pending:
+        filepath = pending.pop()
+        for reference in set(REFERENCE_PATTERN.findall(contents[filepath])):
+            reference = reference.strip().replace(b'\\', b'/')
+            found = by_name.get(reference.rsplit(b'/', 1)[-1])
+            if found:
+                pending.update(found - referenced - files)
+                referenced.update(found)
+            elif ANIMATIONS_DIRECTORY not in reference.split(b'/')[:-1]:
+                missing.add(reference)
+    return referenced, missing
+
+
+def stage_behavior_directory(behavior_directory: str, animation_files: list[str], staging_directory: str) -> str:
+    """
+    Links the behavior files needed to convert the animations into a staging directory.
+
+    These are the files referencing any of the animations, plus the files referencing those up to the project file,
+    plus everything those files reference, such as characters, skeletons and other behavior graphs. The relative
+    layout of the behavior directory is kept. If no behavior file references the animations, or a staged file
+    references a file that cannot be found, the full behavior directory is returned instead, so the converter never
+    sees less than it needs.
+
+    Args:
+        behavior_directory(str): The actor's behavior directory.
+        animation_files(list[str]): The animation files that will be converted with the staged directory.
+        staging_directory(str): An empty directory to stage the behavior files in.
+
+    Returns:
+        str: The directory to pass to the converter.
+    """
+    names = {os.path.basename(filepath).split('.')[0].lower().encode() + b'.hkx' for filepath in animation_files}
+    contents = _read_behavior_files(behavior_directory)
+    referencing = _get_referencing_files(contents, names)
+    if not referencing:
+        _logger.warning('No behavior files in %s reference the animations, using all of them', behavior_directory)
+        return behavior_directory
+    referenced, missing = _get_referenced_files(contents, referencing)
+    if missing:
+        _logger.warning(
+            'Behavior files in %s reference missing files such as %s, using all of them', behavior_directory,
+            sorted(missing)[0].decode(errors='replace')
+        )
+        return behavior_directory
+    referencing.update(referenced)
+    for source in sorted(referencing):
+        link_file(source, os.path.join(staging_directory, os.path.relpath(source, behavior_directory)))
+    _logger.info('Staged %s of %s behavior files from %s', len(referencing), len(contents), behavior_directory)
+    return staging_directory
@@ -0,0 +1,237 @@
+"""
+Module for a content-addressed store of conversion outputs.
+
+Outputs are stored under a key hashing the contents of the conversion inputs, its arguments and the converter build,
+so identical conversions across actors, and across batches, only run once. Stored outputs are materialized into the
+project as copies, cloned where the file system supports it, so writing to a materialized output never changes the
+store or other projects. Every use of an entry touches it, and garbage collection removes the entries that were not
+used for longest.
+
+Usage:
+    python -m skywind.ck.store path/to/store [--max-age-days 30] [--max-size-gb 20]
+"""
+import os
+import sys
+import time
+import shutil
+import hashlib
+import logging
+import argparse
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Iterable
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+_logger = logging.getLogger(__name__)
+__all__ = ['ArtifactStore', 'STORE_ENVIRONMENT_VARIABLE']
+STORE_ENVIRONMENT_VARIABLE = 'SKYWIND_ARTIFACT_STORE'
+DEFAULT_MAX_AGE_DAYS = 30.0
+OBJECTS_DIRECTORY = 'objects'
+TEMP_DIRECTORY = 'tmp'
+# Temporary entries older than this are left over from interrupted processes
+TEMP_MAX_AGE = 24 * 60 * 60
+# The Linux ioctl cloning a file on copy-on-write file systems
+FICLONE = 0x40049409
+
+
+def copy_file(source: str, destination: str):
+    """Copies a file, cloning it on file systems that support it. The copy is dated to now."""
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    if fcntl is not None:
+        with open(source, 'rb') as source_file, open(destination, 'wb') as destination_file:
+            try:
+                fcntl.ioctl(destination_file.fileno(), FICLONE, source_file.fileno())
+                return
+            except OSError:
+                pass
+    shutil.copyfile(source, destination)
+
+
+class ArtifactStore:
+    """
+    A directory of conversion outputs indexed by the hash of everything the conversion depends on.
+
+    Args:
+        directory(str): The store directory. Keep it on the same drive as the projects, so outputs can be cloned.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = os.path.abspath(directory)
+        self._digests = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _get_entry_directory(self, key: str) -> str:
+        return os.path.join(self.directory, OBJECTS_DIRECTORY, key[:2], key)
+
+    def get_digest(self, path: str) -> str:
+        """
+        Returns the content hash of a file or directory.
+
+        File hashes are reused until the size or modification time of the file changes. Directory hashes cover the
+        relative paths and contents of every file, and are reused for the lifetime of the store object.
+        """
+        path = os.path.abspath(path)
+        if os.path.isdir(path):
+            if path not in self._digests:
+                digest = hashlib.sha256()
+                for root, dirs, files in os.walk(path):
+                    dirs.sort()
+                    for filename in sorted(files):
+                        filepath = os.path.join(root, filename)
+                        digest.update(os.path.relpath(filepath, path).replace('\\', '/').lower().encode())
+                        digest.update(self.get_digest(filepath).encode())
+                self._digests[path] = digest.hexdigest()
+            return self._digests[path]
+
+        stat = os.stat(path)
+        cache_key = (path, stat.st_size, stat.st_mtime_ns)
+        if cache_key not in self._digests:
+            with open(path, 'rb') as openfile:
+                self._digests[cache_key] = hashlib.file_digest(openfile, 'sha256').hexdigest()
+        return self._digests[cache_key]
+
+    def get_key(self, tool_version: str, input_files: Iterable[str], arguments: Iterable[str] = ()) -> str:
+        """
+        Returns the key of a conversion.
+
+        Args:
+            tool_version(str): Identifies the converter build, see ConverterBackend.get_version.
+            input_files(Iterable[str]): Every file or directory the conversion reads, in argument order.
+            arguments(Iterable[str]): Any other arguments affecting the outputs, such as output names.
+        """
+        digest = hashlib.sha256(tool_version.encode())
+        for input_file in input_files:
+            digest.update(b'\0' + self.get_digest(input_file).encode())
+        for argument in arguments:
+            digest.update(b'\1' + str(argument).encode())
+        return digest.hexdigest()
+
+    @contextmanager
+    def reserve(self, key: str):
+        """Holds a key for the calling thread, so concurrent jobs doing identical work wait for the first one."""
+        with self._lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            yield
+
+    def _touch(self, entry_directory: str):
+        now = time.time()
+        for filename in os.listdir(entry_directory):
+            os.utime(os.path.join(entry_directory, filename), (now, now))
+        os.utime(entry_directory, (now, now))
+
+    def materialize(self, key: str, destinations: dict[str, str]) -> bool:
+        """
+        Copies the outputs of an entry to their destinations, replacing existing files.
+
+        The entry is touched, which marks it as used for garbage collection. The materialized outputs are dated to now.
+
+        Args:
+            key(str): The key of the entry.
+            destinations(dict[str, str]): The destination of each output name. Empty destinations are skipped.
+
+        Returns:
+            bool: False if the entry does not exist or lacks any of the outputs.
+        """
+        entry_directory = self._get_entry_directory(key)
+        sources = {
+            name: os.path.join(entry_directory, name) for name, destination in destinations.items() if destination
+        }
+        if not all(os.path.isfile(source) for source in sources.values()):
+            return False
+        self._touch(entry_directory)
+        for name, source in sources.items():
+            destination = destinations[name]
+            temp_destination = f'{destination}.{threading.get_ident()}.tmp'
+            copy_file(source, temp_destination)
+            os.replace(temp_destination, destination)
+        _logger.debug('Materialized %s from %s', ', '.join(sources), key)
+        return True
+
+    def add(self, key: str, outputs: dict[str, str]):
+        """
+        Adds the outputs of a conversion under a key. If another process added the key first, its entry is kept.
+
+        Args:
+            key(str): The key of the conversion.
+            outputs(dict[str, str]): The file of each output name.
+        """
+        temp_root = os.path.join(self.directory, TEMP_DIRECTORY)
+        os.makedirs(temp_root, exist_ok=True)
+        temp_directory = tempfile.mkdtemp(dir=temp_root)
+        try:
+            for name, filepath in outputs.items():
+                copy_file(filepath, os.path.join(temp_directory, name))
+            entry_directory = self._get_entry_directory(key)
+            os.makedirs(os.path.dirname(entry_directory), exist_ok=True)
+            try:
+                os.rename(temp_directory, entry_directory)
+            except OSError:
+                if not os.path.isdir(entry_directory):
+                    raise
+                _logger.debug('%s was already stored', key)
+        finally:
+            shutil.rmtree(temp_directory, ignore_errors=True)
+
+    def collect_garbage(self, max_age_days: float | None = DEFAULT_MAX_AGE_DAYS, max_size: int | None = None) -> int:
+        """
+        Removes the entries that were not used recently.
+
+        Args:
+            max_age_days(float): Removes entries not used for this many days.
+            max_size(int): Then removes the least recently used entries until the store is at most this many bytes.
+
+        Returns:
+            int: The number of removed entries.
+        """
+        entries = []
+        objects_directory = os.path.join(self.directory, OBJECTS_DIRECTORY)
+        if os.path.isdir(objects_directory):
+            for prefix in os.scandir(objects_directory):
+                for entry in os.scandir(prefix.path):
+                    size = sum(child.stat().st_size for child in os.scandir(entry.path))
+                    entries.append((entry.stat().st_mtime, size, entry.path))
+        entries.sort()
+
+        now = time.time()
+        total_size = sum(size for mtime, size, path in entries)
+        removed = 0
+        for mtime, size, path in entries:
+            expired = max_age_days is not None and now - mtime > max_age_days * 24 * 60 * 60
+            oversized = max_size is not None and total_size > max_size
+            if not expired and not oversized:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total_size -= size
+            removed += 1
+
+        temp_root = os.path.join(self.directory, TEMP_DIRECTORY)
+        if os.path.isdir(temp_root):
+            for entry in os.scandir(temp_root):
+                if now - entry.stat().st_mtime > TEMP_MAX_AGE:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+        _logger.info('Removed %s of %s stored entries, %.1f MB remain', removed, len(entries), total_size / 1024 / 1024)
+        return removed
+
+
+def main(argv: list[str]):
+    parser = argparse.ArgumentParser(description='Removes the least recently used entries of an artifact store.')
+    parser.add_argument('directory')
+    parser.add_argument('--max-age-days', type=float, default=DEFAULT_MAX_AGE_DAYS)
+    parser.add_argument('--max-size-gb', type=float)
+    options = parser.parse_args(argv)
+    max_size = None if options.max_size_gb is None else int(options.max_size_gb * 1024 * 1024 * 1024)
+    ArtifactStore(options.directory).collect_garbage(options.max_age_days, max_size)
+
+
+if __name__ == '__main__':
+    from skywind.core import log
+    log.initialize()
+    main(sys.argv[1:])
@@ -1,45 +1,104 @@
-
 from __future__ import annotations
 
 import os
 import json
 import logging
 from dataclasses import dataclass
+from functools import cached_property
 
 
 _logger = logging.getLogger(__name__)
 CONFIG_EXTENSION = '.actor.json'
 
 
+class ActorRegistry:
+    """
+    Caches the config files found in each directory and the actor loaded from each config file.
+
+    Cached directories are reused until their modification time changes, which happens when files are added, removed
+    or renamed, so directories without a config are cached as well. Cached actors are reused until the modification
+    time of their config file changes.
+    """
+
+    def __init__(self):
+        self._config_files = {}
+        self._actors = {}
+
+    def get_config_files(self, directory: str) -> list[str]:
+        """Returns the names of the config files in a directory."""
+        mtime = os.stat(directory).st_mtime_ns
+        cached = self._config_files.get(directory)
+        if cached is None or cached[0] != mtime:
+            config_files = [name for name in os.listdir(directory) if name.endswith(CONFIG_EXTENSION)]
+            cached = self._config_files[directory] = (mtime, config_files)
+        return cached[1]
+
+    def get(self, filepath: str) -> Actor:
+        """Returns the actor of a config file, loading it again only if the file changed."""
+        filepath = os.path.abspath(filepath)
+        mtime = os.stat(filepath).st_mtime_ns
+        cached = self._actors.get(filepath)
+        if cached is None or cached[0] != mtime:
+            cached = self._actors[filepath] = (mtime, Actor(filepath))
+        return cached[1]
+
+    def find(self, path: str) -> Actor | None:
+        """Finds the actor of the nearest config file in the directory of a path or any of its parents."""
+        directory = os.path.abspath(path)
+        while not os.path.isdir(directory):
+            parent = os.path.dirname(directory)
+            if parent == directory:
+                return None
+            directory = parent
+        while True:
+            config_files = self.get_config_files(directory)
+            if len(config_files) > 1:
+                _logger.warning(f'More than one config file found: {config_files}')
+                return None
+            if len(config_files) == 1:
+                return self.get(os.path.join(directory, config_files[0]))
+            parent = os.path.dirname(directory)
+            if parent == directory:
+                return None
+            directory = parent
+
+    def invalidate(self, path: str = ''):
+        """
+        Forgets cached directories and actors, for changes modification times miss, e.g. edits within their precision.
+
+        Args:
+            path(str): A config file or directory to forget, along with everything below it. Forgets everything if
+                empty.
+        """
+        if not path:
+            self._config_files.clear()
+            self._actors.clear()
+            return
+        path = os.path.abspath(path)
+        for cache in (self._config_files, self._actors):
+            for key in [key for key in cache if key == path or key.startswith(path + os.sep)]:
+                del cache[key]
+
+
+registry = ActorRegistry()
+
+
 @dataclass
 class Actor:
 
     @classmethod
     def find(cls, path: str) -> Actor | None:
         """Finds an actor given a file path."""
-        if not os.path.exists(path) or os.path.isfile(path):
-            return Actor.find(os.path.dirname(path))
-        config_files = [name for name in os.listdir(path) if name.endswith(CONFIG_EXTENSION)]
-        if len(config_files) > 1:
-            _logger.warning(f'More than one config file found: {config_files}')
-            return None
-        if len(config_files) == 1:
-            return Actor(os.path.join(path, config_files[0]))
-        if os.path.dirname(path) == path:
-            return None
-        return Actor.find(os.path.dirname(path))
+        return registry.find(path)
 
     @classmethod
-    def in_directory(self, directory: str) -> list[Actor]:
-        """Finds all actors in a given directory."""
-        actors = []
-        for root, dirs, files in os.walk(directory):
-            for filename in files:
-                if not filename.endswith(CONFIG_EXTENSION):
-                    continue
-                filepath = os.path.join(root, filename)
-                actors.append(Actor(filepath))
-        return actors
+    def in_directory(self, directory: str, **kwargs) -> list[Actor]:
+        """
+        Finds all actors in a given directory, sorted by config path. Subtrees without actors such as textures are
+        skipped, see skywind.core.discovery.discover_configs for the keyword arguments.
+        """
+        from skywind.core.discovery import discover_actors
+        return sorted(discover_actors(directory, **kwargs), key=lambda actor: actor._filepath)
 
     def __init__(self, filepath: str, data: dict[str, any] = None):
         self._filepath = filepath
@@ -55,34 +114,48 @@ class Actor:
             raise KeyError(f'Key "{key}" is not defined')
         return self._data[key]
 
-    @property
+    @cached_property
     def skeleton_fbx(self):
         return os.path.abspath(os.path.join(self._directory, self.get('skeleton_fbx')))
 
-    @property
+    @cached_property
     def skeleton_hkx(self):
         return os.path.abspath(os.path.join(self._directory, self.get('skeleton_hkx')))
 
-    @property
+    @cached_property
     def skeleton_nif(self):
         return os.path.abspath(os.path.join(self._directory, self.get('skeleton_nif')))
 
-    @property
+    @cached_property
     def skeleton_le_hkx(self):
         return os.path.abspath(os.path.join(self._directory, self.get('skeleton_le_hkx')))
 
-    @property
+    @cached_property
     def animations_fbx(self):
         return os.path.abspath(os.path.join(self._directory, self.get('animations_fbx')))
 
-    @property
+    @cached_property
     def animations_hkx(self):
         return os.path.abspath(os.path.join(self._directory, self.get('animations_hkx')))
 
+    @cached_property
+    def cache_txt(self):
+        """The root motion cache file, or an empty string if the actor does not define one."""
+        if 'cache_txt' not in self._data:
+            return ''
+        return os.path.abspath(os.path.join(self._directory, self.get('cache_txt')))
+
+    @cached_property
+    def behavior_directory(self):
+        """The behavior directory, or an empty string if the actor does not define one."""
+        if 'behavior_directory' not in self._data:
+            return ''
+        return os.path.abspath(os.path.join(self._directory, self.get('behavior_directory')))
+
     def get_animation(self, animation: str):
         return os.path.abspath(os.path.join(self.animations, animation))
 
-    @property
+    @cached_property
     def blender_rig(self):
         return os.path.abspath(os.path.join(self._directory, self.get('blender_rig')))
 
@@ -95,6 +168,11 @@ class Actor:
         return self.get('blender_export_mapping')
 
     @property
+    def blender_simplify_tolerances(self) -> dict[str, list[float]]:
+        """The [centimeters, degrees] tolerances of bones simplified unlike the defaults, or an empty dict if none."""
+        return self._data.get('blender_simplify_tolerances', {})
+
+    @cached_property
     def maya_rig(self):
         return os.path.join(self._directory, self.get('maya_rig'))
 
@@ -0,0 +1,177 @@
+import logging
+
+import bpy
+import mathutils
+import numpy as np
+
+_logger = logging.getLogger(__name__)
+# Values of the FCurve keyframe interpolation enum, as foreach_set expects them
+INTERPOLATION_MODES = {'CONSTANT': 0, 'LINEAR': 1, 'BEZIER': 2}
+OBJECT_TRANSFORMS_GROUP = 'Object Transforms'
+
+
+def ensure_action(obj: bpy.types.Object) -> bpy.types.Action:
+    """Returns the action of an object, creating its animation data and action if needed."""
+    if obj.animation_data is None:
+        obj.animation_data_create()
+    if obj.animation_data.action is None:
+        obj.animation_data.action = bpy.data.actions.new(name=f"{obj.name}_Action")
+    return obj.animation_data.action
+
+
+def get_keyframe_frames(fcurve: bpy.types.FCurve) -> np.ndarray:
+    """Returns the frames of the keyframes of an fcurve."""
+    coordinates = np.empty(len(fcurve.keyframe_points) * 2, dtype=np.float32)
+    fcurve.keyframe_points.foreach_get('co', coordinates)
+    return coordinates[::2]
+
+
+def get_frame_range(action: bpy.types.Action) -> tuple[int, int] | None:
+    """Returns the first and last keyframe of an action, truncated to whole frames, or None if it has no keyframes."""
+    first, last = np.inf, -np.inf
+    for fcurve in action.fcurves:
+        if len(fcurve.keyframe_points):
+            frames = get_keyframe_frames(fcurve)
+            first, last = min(first, frames.min()), max(last, frames.max())
+    if first > last:
+        return None
+    return int(first), int(last)
+
+
+def frame_animation(obj: bpy.types.Object, scene: bpy.types.Scene = None):
+    """Sets the frame range of a scene to the keyframes of an object's action."""
+    scene = scene or bpy.context.scene
+    frame_range = get_frame_range(obj.animation_data.action)
+    if frame_range is None:
+        raise ValueError(f'{obj.name} has no keyframes')
+    scene.frame_start, scene.frame_end = frame_range
+
+
+def write_fcurve(action: bpy.types.Action, data_path: str, index: int, frames: np.ndarray, values: np.ndarray,
+                 group: str = '', interpolation: str = None) -> bpy.types.FCurve:
+    """
+    Replaces the keyframes of an fcurve with keyframes at the given frames, written in bulk.
+
+    Existing fcurves are updated in place, keeping their group, modifiers and other settings.
+
+    Args:
+        action(bpy.types.Action): The action to write to.
+        data_path(str): The data path of the fcurve.
+        index(int): The array index of the fcurve.
+        frames(np.ndarray): The frame of each keyframe.
+        values(np.ndarray): The value of each keyframe.
+        group(str): An optional action group for new fcurves.
+        interpolation(str): A key of INTERPOLATION_MODES. Keeps the interpolation of the existing keyframes if None,
+            per keyframe if their number is unchanged, or the default interpolation of new fcurves.
+    """
+    fcurve = action.fcurves.find(data_path, index=index)
+    interpolations = None
+    if fcurve is None:
+        if group:
+            fcurve = action.fcurves.new(data_path, index=index, action_group=group)
+        else:
+            fcurve = action.fcurves.new(data_path, index=index)
+    elif len(fcurve.keyframe_points):
+        if interpolation is None:
+            interpolations = np.empty(len(fcurve.keyframe_points), dtype=np.int32)
+            fcurve.keyframe_points.foreach_get('interpolation', interpolations)
+            if len(interpolations) != len(frames):
+                interpolations = np.full(len(frames), interpolations[0], dtype=np.int32)
+        fcurve.keyframe_points.clear()
+
+    keyframe_points = fcurve.keyframe_points
+    keyframe_points.add(len(frames))
+    coordinates = np.empty((len(frames), 2), dtype=np.float32)
+    coordinates[:, 0] = frames
+    coordinates[:, 1] = values
+    keyframe_points.foreach_set('co', coordinates.ravel())
+    if interpolation is not None:
+        interpolations = np.full(len(frames), INTERPOLATION_MODES[interpolation], dtype=np.int32)
+    if interpolations is not None:
+        keyframe_points.foreach_set('interpolation', interpolations)
+    fcurve.update()
+    return fcurve
+
+
+def matrix_to_quaternion(rotations: np.ndarray) -> np.ndarray:
+    """
+    Converts (..., 3, 3) orthonormal rotation matrices to (..., 4) quaternions in Blender's w, x, y, z order.
+
+    Uses the branch of the largest diagonal term for stability, and returns quaternions with a non-negative w.
+    """
+    m = rotations
+    trace = m[..., 0, 0] + m[..., 1, 1] + m[..., 2, 2]
+    candidates = np.stack([
+        np.stack([1.0 + trace, m[..., 2, 1] - m[..., 1, 2], m[..., 0, 2] - m[..., 2, 0], m[..., 1, 0] - m[..., 0, 1]],
+                 axis=-1),
+        np.stack([m[..., 2, 1] - m[..., 1, 2], 1.0 + m[..., 0, 0] - m[..., 1, 1] - m[..., 2, 2],
+                  m[..., 0, 1] + m[..., 1, 0], m[..., 0, 2] + m[..., 2, 0]], axis=-1),
+        np.stack([m[..., 0, 2] - m[..., 2, 0], m[..., 0, 1] + m[..., 1, 0],
+                  1.0 + m[..., 1, 1] - m[..., 0, 0] - m[..., 2, 2], m[..., 1, 2] + m[..., 2, 1]], axis=-1),
+        np.stack([m[..., 1, 0] - m[..., 0, 1], m[..., 0, 2] + m[..., 2, 0], m[..., 1, 2] + m[..., 2, 1],
+                  1.0 + m[..., 2, 2] - m[..., 0, 0] - m[..., 1, 1]], axis=-1),
+    ], axis=-2)
+    diagonal = np.stack([trace, m[..., 0, 0], m[..., 1, 1], m[..., 2, 2]], axis=-1)
+    best = np.argmax(diagonal, axis=-1)
+    quaternions = np.take_along_axis(candidates, best[..., None, None], axis=-2)[..., 0, :]
+    quaternions /= np.linalg.norm(quaternions, axis=-1, keepdims=True)
+    return np.where(quaternions[..., :1] < 0.0, -quaternions, quaternions)
+
+
+def make_quaternions_compatible(quaternions: np.ndarray) -> np.ndarray:
+    """Flips (frames, ..., 4) quaternions into the hemisphere of the previous frame, like Quaternion.make_compatible."""
+    steps = np.where(np.sum(quaternions[1:] * quaternions[:-1], axis=-1) < 0.0, -1.0, 1.0)
+    signs = np.cumprod(np.concatenate([np.ones_like(steps[:1]), steps], axis=0), axis=0)
+    return quaternions * signs[..., None]
+
+
+def decompose_matrices(matrices: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Splits (..., 4, 4) matrices into locations, normalized rotation matrices and scales."""
+    locations = matrices[..., :3, 3]
+    scales = np.linalg.norm(matrices[..., :3, :3], axis=-2)
+    rotations = matrices[..., :3, :3] / np.where(scales == 0.0, 1.0, scales)[..., None, :]
+    return locations, rotations, scales
+
+
+def _to_eulers(rotations: np.ndarray, order: str) -> np.ndarray:
+    """Converts (frames, 3, 3) rotations to eulers, each compatible with the previous frame like baking keeps them."""
+    eulers = np.empty((len(rotations), 3))
+    previous = None
+    for frame, rotation in enumerate(rotations):
+        matrix = mathutils.Matrix(rotation.tolist())
+        previous = matrix.to_euler(order, previous) if previous is not None else matrix.to_euler(order)
+        eulers[frame] = previous
+    return eulers
+
+
+def write_transform_animation(action: bpy.types.Action, frames: np.ndarray, matrices: np.ndarray,
+                              rotation_mode: str, data_path_prefix: str = '', group: str = ''):
+    """
+    Writes location, rotation and scale fcurves from (frames, 4, 4) basis matrices.
+
+    Args:
+        action(bpy.types.Action): The action to write to.
+        frames(np.ndarray): The frame of each matrix.
+        matrices(np.ndarray): The basis matrices, e.g. PoseBone.matrix_basis or Object.matrix_basis.
+        rotation_mode(str): The rotation mode of the animated pose bone or object.
+        data_path_prefix(str): The path of the pose bone, e.g. 'pose.bones["Root"].', or empty for objects.
+        group(str): The action group of the fcurves.
+    """
+    locations, rotations, scales = decompose_matrices(matrices)
+    if rotation_mode == 'QUATERNION':
+        rotation_path = 'rotation_quaternion'
+        rotation_values = make_quaternions_compatible(matrix_to_quaternion(rotations))
+    elif rotation_mode == 'AXIS_ANGLE':
+        rotation_path = 'rotation_axis_angle'
+        quaternions = make_quaternions_compatible(matrix_to_quaternion(rotations))
+        angles = 2.0 * np.arccos(np.clip(quaternions[:, 0], -1.0, 1.0))
+        axes = quaternions[:, 1:] / np.maximum(np.sin(angles / 2.0), 1e-12)[:, None]
+        axes[angles < 1e-6] = (0.0, 1.0, 0.0)
+        rotation_values = np.concatenate([angles[:, None], axes], axis=1)
+    else:
+        rotation_path = 'rotation_euler'
+        rotation_values = _to_eulers(rotations, rotation_mode)
+
+    for path, values in (('location', locations), (rotation_path, rotation_values), ('scale', scales)):
+        for index in range(values.shape[1]):
+            write_fcurve(action, f'{data_path_prefix}{path}', index, frames, values[:, index], group=group)
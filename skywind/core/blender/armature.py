@@ -1,9 +1,8 @@
-
-
 import logging
 
 import bpy
 import mathutils
+import numpy as np
 
 from .contexts import view_3d_context
 
@@ -19,46 +18,146 @@ def _get_bone_matrix(bone: bpy.types.Bone) -> mathutils.Matrix:
         return mat
 
 
-@view_3d_context()
-def copy_armature_in_world_space(armature_obj: bpy.types.Object, use_pose_bones: bool = False,
-                                 name: str = None) -> bpy.types.Object:
-    intermediate_rig_name = name or 'IntermediateRig'
-    intermediate_rig_data = bpy.data.armatures.new(intermediate_rig_name)
-    intermediate_obj = bpy.data.objects.new(intermediate_rig_name, intermediate_rig_data)
-    bpy.context.collection.objects.link(intermediate_obj)
+def get_bone_matrices(armature_obj: bpy.types.Object, use_pose_bones: bool = False) -> np.ndarray:
+    """
+    Returns the armature space matrices of every bone as an (n, 4, 4) array of row-major matrices.
+
+    Args:
+        armature_obj(bpy.types.Object): An armature object.
+        use_pose_bones(bool): Reads the posed matrices instead of the rest matrices.
+    """
+    bones = armature_obj.pose.bones if use_pose_bones else armature_obj.data.bones
+    matrices = np.empty(len(bones) * 16, dtype=np.float32)
+    bones.foreach_get('matrix' if use_pose_bones else 'matrix_local', matrices)
+    # Blender stores matrices column-major
+    return matrices.reshape(-1, 4, 4).transpose(0, 2, 1).astype(np.float64)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    lengths = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(lengths == 0.0, 1.0, lengths)
+
+
+def orthonormalize(matrices: np.ndarray) -> np.ndarray:
+    """
+    Returns the rigid transforms of bone matrices, as edit bones built from their heads, tails and Z axes store them.
+
+    The Y axis keeps its direction, the Z axis is projected perpendicular to it and the X axis completes the basis.
+    """
+    result = np.zeros_like(matrices)
+    y_axes = _normalize(matrices[..., :3, 1])
+    z_axes = matrices[..., :3, 2]
+    z_axes = _normalize(z_axes - y_axes * np.sum(z_axes * y_axes, axis=-1, keepdims=True))
+    result[..., :3, 0] = np.cross(y_axes, z_axes)
+    result[..., :3, 1] = y_axes
+    result[..., :3, 2] = z_axes
+    result[..., :3, 3] = matrices[..., :3, 3]
+    result[..., 3, 3] = 1.0
+    return result
+
+
+def get_world_bone_matrices(armature_obj: bpy.types.Object, use_pose_bones: bool = False) -> np.ndarray:
+    """Returns the world space bone matrices of the armature copy_armature_in_world_space creates, as (n, 4, 4)."""
+    return orthonormalize(np.array(armature_obj.matrix_world) @ get_bone_matrices(armature_obj, use_pose_bones))
+
+
+def get_bone_rolls(directions: np.ndarray, z_axes: np.ndarray) -> np.ndarray:
+    """
+    Returns the rolls aligning the Z axes of bones to the given axes, like EditBone.align_roll for every bone at once.
+
+    The Z axis of a bone at zero roll follows Blender's vec_roll_to_mat3_normalized, and the roll is the signed
+    angle from it to the given axis projected onto the plane perpendicular to the bone.
+
+    Args:
+        directions(np.ndarray): (n, 3) normalized head to tail directions.
+        z_axes(np.ndarray): (n, 3) normalized axes to align to.
+    """
+    x, y, z = directions[:, 0], directions[:, 1], directions[:, 2]
+    theta = 1.0 + y
+    theta_alt = x * x + z * z
+    # Thresholds of vec_roll_to_mat3_normalized for bones pointing almost straight down
+    safe_threshold = 6.1e-3
+    critical_threshold_squared = 2.5e-4 ** 2
+    regular = (theta > safe_threshold) | (theta_alt > critical_threshold_squared)
+    theta = np.where(theta > safe_threshold, theta, theta_alt * 0.5 + theta_alt * theta_alt * 0.125)
+    theta = np.where(regular, theta, 1.0)
+    zero_roll_z = np.where(
+        regular[:, None],
+        np.stack([-x * z / theta, -z, 1.0 - z * z / theta], axis=1),
+        np.array([0.0, 0.0, 1.0]),
+    )
+    projected = z_axes - directions * np.sum(z_axes * directions, axis=1, keepdims=True)
+    sine = np.sum(np.cross(zero_roll_z, projected) * directions, axis=1)
+    cosine = np.sum(zero_roll_z * projected, axis=1)
+    return np.arctan2(sine, cosine)
+
 
-    # Ensure the source is evaluated if using pose bones
-    src_obj_eval = armature_obj
+@view_3d_context()
+def create_armature(name: str, bone_names: list[str], matrices: np.ndarray, lengths: np.ndarray,
+                    parents: np.ndarray = None, use_connect: np.ndarray = None) -> bpy.types.Object:
+    """
+    Creates an armature object from rest matrices, computing heads, tails and rolls for all bones at once and writing
+    them to the edit bones with foreach_set.
+
+    Args:
+        name(str): The name of the armature object and data.
+        bone_names(list[str]): The name of each bone.
+        matrices(np.ndarray): (n, 4, 4) orthonormal armature space rest matrices.
+        lengths(np.ndarray): The length of each bone.
+        parents(np.ndarray): The index of the parent of each bone, or -1 for root bones. Every bone is a root if None.
+        use_connect(np.ndarray): Whether each bone is connected to its parent.
+    """
+    armature_data = bpy.data.armatures.new(name)
+    armature_obj = bpy.data.objects.new(name, armature_data)
+    bpy.context.collection.objects.link(armature_obj)
+
+    heads = matrices[:, :3, 3]
+    # In Blender bones, the Y-axis points from Head to Tail
+    directions = matrices[:, :3, 1]
+    tails = heads + directions * np.asarray(lengths)[:, None]
+    rolls = get_bone_rolls(directions, matrices[:, :3, 2])
 
     # Enter edit mode to create bones
-    bpy.context.view_layer.objects.active = intermediate_obj
+    bpy.context.view_layer.objects.active = armature_obj
     bpy.ops.object.mode_set(mode='EDIT')
+    edit_bones = armature_data.edit_bones
+    for bone_name in bone_names:
+        edit_bones.new(bone_name)
+    edit_bones.foreach_set('head', heads.astype(np.float32).ravel())
+    edit_bones.foreach_set('tail', tails.astype(np.float32).ravel())
+    edit_bones.foreach_set('roll', rolls.astype(np.float32))
+    if parents is not None:
+        for edit_bone, parent in zip(edit_bones, parents.tolist()):
+            if parent >= 0:
+                edit_bone.parent = edit_bones[parent]
+        if use_connect is not None:
+            edit_bones.foreach_set('use_connect', np.asarray(use_connect, dtype=bool))
+    bpy.ops.object.mode_set(mode='OBJECT')
+    return armature_obj
 
-    source_bones = src_obj_eval.pose.bones if use_pose_bones else src_obj_eval.data.bones
-
-    for src_bone in source_bones:
-        # Create new bone
-        new_bone = intermediate_rig_data.edit_bones.new(src_bone.name)
-
-        # Calculate World Matrix: Object World Matrix @ Bone Local Matrix
-        # Note: For PoseBones use .matrix, for EditBones/DataBones use .matrix_local
-        bone_local_matrix = src_bone.matrix if use_pose_bones else src_bone.matrix_local
-        world_matrix = armature_obj.matrix_world @ bone_local_matrix
-
-        # 1. Set Head (The translation part of the matrix)
-        new_bone.head = world_matrix.to_translation()
-
-        # 2. Set Tail (The head + the Y-axis direction scaled by length)
-        # In Blender bones, the Y-axis points from Head to Tail
-        bone_direction = world_matrix.to_quaternion() @ mathutils.Vector((0, 1, 0))
-        new_bone.tail = new_bone.head + (bone_direction * src_bone.length)
-
-        # 3. Match Roll
-        # We align the new bone's Z-axis to the source bone's world-space Z-axis
-        world_z_axis = world_matrix.to_quaternion() @ mathutils.Vector((0, 0, 1))
-        new_bone.align_roll(world_z_axis)
 
-    bpy.ops.object.mode_set(mode='OBJECT')
+def copy_armature_in_world_space(armature_obj: bpy.types.Object, use_pose_bones: bool = False,
+                                 name: str = None) -> bpy.types.Object:
+    """
+    Creates an unparented copy of an armature's bones with the world space transforms of the source.
+
+    Matrices and lengths are read with foreach_get, and the copy is built for all bones at once by create_armature.
+
+    Args:
+        armature_obj(bpy.types.Object): The armature to copy.
+        use_pose_bones(bool): Copies the current pose instead of the rest pose.
+        name(str): The name of the new armature.
+    """
+    source_bones = armature_obj.pose.bones if use_pose_bones else armature_obj.data.bones
+    lengths = np.empty(len(source_bones), dtype=np.float32)
+    source_bones.foreach_get('length', lengths)
+
+    # World Matrix: Object World Matrix @ Bone Local Matrix, without scale
+    world_matrices = get_world_bone_matrices(armature_obj, use_pose_bones)
+    intermediate_obj = create_armature(
+        name or 'IntermediateRig', [bone.name for bone in source_bones], world_matrices, lengths
+    )
+    _logger.debug('Copied %s bones of %s in world space', len(source_bones), armature_obj.name)
     return intermediate_obj
 
 
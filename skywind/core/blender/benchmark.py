@@ -0,0 +1,122 @@
+"""
+Benchmarks the armature helpers of skywind.core.blender on a synthetic rig.
+
+Run inside Blender:
+    blender --factory-startup --python-expr "from skywind.core.blender import benchmark; benchmark.main()"
+"""
+import time
+import logging
+
+import bpy
+import mathutils
+import numpy as np
+
+from .armature import copy_armature_in_world_space, get_bone_matrices
+from .contexts import view_3d_context
+
+_logger = logging.getLogger(__name__)
+BONE_COUNT = 300
+REPEATS = 5
+
+
+def create_benchmark_rig(bone_count: int = BONE_COUNT, seed: int = 0) -> bpy.types.Object:
+    """Creates an armature with a random hierarchy of bones in a random pose."""
+    random = np.random.default_rng(seed)
+    armature_data = bpy.data.armatures.new('BenchmarkRig')
+    armature_obj = bpy.data.objects.new('BenchmarkRig', armature_data)
+    armature_obj.matrix_world = mathutils.Matrix.LocRotScale(
+        mathutils.Vector((1.0, 2.0, 3.0)), mathutils.Euler((0.3, -0.2, 1.1)), mathutils.Vector((1.5, 1.5, 1.5))
+    )
+    bpy.context.collection.objects.link(armature_obj)
+    bpy.context.view_layer.objects.active = armature_obj
+    bpy.ops.object.mode_set(mode='EDIT')
+    for index in range(bone_count):
+        edit_bone = armature_data.edit_bones.new(f'Bone{index:03}')
+        edit_bone.head = random.normal(size=3)
+        edit_bone.tail = edit_bone.head + mathutils.Vector(random.normal(size=3)).normalized() * random.uniform(0.1, 1)
+        edit_bone.roll = random.uniform(-np.pi, np.pi)
+        if index:
+            edit_bone.parent = armature_data.edit_bones[int(random.integers(index))]
+    bpy.ops.object.mode_set(mode='OBJECT')
+
+    rotations = random.normal(size=(bone_count, 4))
+    rotations /= np.linalg.norm(rotations, axis=1, keepdims=True)
+    armature_obj.pose.bones.foreach_set('rotation_quaternion', rotations.astype(np.float32).ravel())
+    bpy.context.view_layer.update()
+    return armature_obj
+
+
+@view_3d_context()
+def copy_armature_in_world_space_legacy(armature_obj: bpy.types.Object, use_pose_bones: bool = False,
+                                        name: str = None) -> bpy.types.Object:
+    """The per-bone implementation copy_armature_in_world_space replaced, kept as a reference."""
+    intermediate_rig_name = name or 'IntermediateRig'
+    intermediate_rig_data = bpy.data.armatures.new(intermediate_rig_name)
+    intermediate_obj = bpy.data.objects.new(intermediate_rig_name, intermediate_rig_data)
+    bpy.context.collection.objects.link(intermediate_obj)
+    bpy.context.view_layer.objects.active = intermediate_obj
+    bpy.ops.object.mode_set(mode='EDIT')
+    source_bones = armature_obj.pose.bones if use_pose_bones else armature_obj.data.bones
+    for src_bone in source_bones:
+        new_bone = intermediate_rig_data.edit_bones.new(src_bone.name)
+        bone_local_matrix = src_bone.matrix if use_pose_bones else src_bone.matrix_local
+        world_matrix = armature_obj.matrix_world @ bone_local_matrix
+        new_bone.head = world_matrix.to_translation()
+        bone_direction = world_matrix.to_quaternion() @ mathutils.Vector((0, 1, 0))
+        new_bone.tail = new_bone.head + (bone_direction * src_bone.length)
+        world_z_axis = world_matrix.to_quaternion() @ mathutils.Vector((0, 0, 1))
+        new_bone.align_roll(world_z_axis)
+    bpy.ops.object.mode_set(mode='OBJECT')
+    return intermediate_obj
+
+
+def _remove_armature(armature_obj: bpy.types.Object):
+    armature_data = armature_obj.data
+    bpy.data.objects.remove(armature_obj)
+    bpy.data.armatures.remove(armature_data)
+
+
+def _time_copy(function, armature_obj: bpy.types.Object, use_pose_bones: bool, repeats: int) -> float:
+    durations = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        copy = function(armature_obj, use_pose_bones=use_pose_bones)
+        durations.append(time.perf_counter() - start)
+        _remove_armature(copy)
+    return min(durations)
+
+
+def benchmark_copy_armature(bone_count: int = BONE_COUNT, repeats: int = REPEATS) -> dict[str, float]:
+    """
+    Times copy_armature_in_world_space against the legacy implementation, and measures how far their results differ.
+
+    Returns:
+        dict[str, float]: The best times in seconds and the largest difference between the copied bone matrices.
+    """
+    armature_obj = create_benchmark_rig(bone_count)
+    results = {}
+    try:
+        for use_pose_bones in (False, True):
+            key = 'pose' if use_pose_bones else 'rest'
+            results[f'{key}_legacy'] = _time_copy(
+                copy_armature_in_world_space_legacy, armature_obj, use_pose_bones, repeats
+            )
+            results[f'{key}_vectorized'] = _time_copy(
+                copy_armature_in_world_space, armature_obj, use_pose_bones, repeats
+            )
+            results[f'{key}_speedup'] = results[f'{key}_legacy'] / results[f'{key}_vectorized']
+
+            legacy = copy_armature_in_world_space_legacy(armature_obj, use_pose_bones=use_pose_bones)
+            vectorized = copy_armature_in_world_space(armature_obj, use_pose_bones=use_pose_bones)
+            difference = np.abs(get_bone_matrices(legacy) - get_bone_matrices(vectorized)).max()
+            results[f'{key}_max_difference'] = float(difference)
+            _remove_armature(legacy)
+            _remove_armature(vectorized)
+    finally:
+        _remove_armature(armature_obj)
+    return results
+
+
+def main():
+    for key, value in benchmark_copy_armature().items():
+        print(f'copy_armature_in_world_space {BONE_COUNT} bones, {key}: {value:.6f}')
@@ -0,0 +1,119 @@
+"""
+Compares publishing a control rig animation through the NumPy retarget against the constraint rig it replaced.
+
+Open an animation of an actor, then run inside Blender:
+    blender animation.blend --python-expr "from skywind.core.blender import benchmark_publish; benchmark_publish.main()"
+
+Both paths publish the same control rig to scratch fbx files. The fbx are imported again, and every bone of both is
+compared on every frame. The comparison fails if any bone differs by more than MATRIX_TOLERANCE.
+
+No results are recorded yet, so neither the speedup nor the equivalence of both paths has been measured.
+"""
+import os
+import time
+import shutil
+import logging
+import tempfile
+
+import bpy
+import numpy as np
+
+from ..actor import Actor
+from .fbx import import_fbx
+from .metadata import load_source_path_from_object
+from .retarget import get_frames, sample_world_matrices
+
+_logger = logging.getLogger(__name__)
+REPEATS = 3
+# The largest difference allowed between any element of the world matrices of a bone, in centimeters for translations
+MATRIX_TOLERANCE = 1e-3
+
+
+def find_control_rig() -> tuple[bpy.types.Object, Actor]:
+    """Returns the first armature of the current scene that belongs to an actor, and its actor."""
+    for obj in bpy.context.scene.objects:
+        if obj.type != 'ARMATURE':
+            continue
+        filepath = load_source_path_from_object(obj)
+        actor = Actor.find(filepath) if filepath is not None else None
+        if actor is not None:
+            return obj, actor
+    raise RuntimeError('No control rig of an actor found in the current scene')
+
+
+def _time_publish(control_skeleton: bpy.types.Object, actor: Actor, fbx_file: str, use_constraints: bool,
+                  repeats: int) -> float:
+    from skywind.blender.operators.publish_animation import publish_control_rig_animation
+
+    durations = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        publish_control_rig_animation(
+            control_skeleton, fbx_file, actor.skeleton_fbx, actor.blender_export_mapping,
+            use_constraints=use_constraints, actor=actor
+        )
+        durations.append(time.perf_counter() - start)
+    return min(durations)
+
+
+def _sample_published(fbx_file: str, frames: np.ndarray) -> dict[str, np.ndarray]:
+    """Imports a published fbx as opening an animation does, and returns the (frames, 4, 4) matrices of each bone."""
+    objects = import_fbx(fbx_file, global_scale=100, anim_offset=0)
+    try:
+        armatures = [obj for obj in objects if obj.type == 'ARMATURE']
+        if len(armatures) != 1:
+            raise RuntimeError(f'Expected one skeleton in {fbx_file}, found {len(armatures)}.')
+        bone_matrices, _ = sample_world_matrices(armatures[0], frames)
+        return {pose_bone.name: bone_matrices[:, index] for index, pose_bone in enumerate(armatures[0].pose.bones)}
+    finally:
+        bpy.data.batch_remove(objects)
+
+
+def benchmark_publish(control_skeleton: bpy.types.Object, actor: Actor, repeats: int = REPEATS) -> dict[str, float]:
+    """
+    Times publishing a control rig with and without constraints, and measures how far the published bones differ.
+
+    Args:
+        control_skeleton(bpy.types.Object): The animated control rig.
+        actor(Actor): The actor of the control rig.
+        repeats(int): How many times each path is timed. The best time is kept.
+
+    Returns:
+        dict[str, float]: The best times in seconds, the speedup and the largest difference between the matrices of
+            any bone.
+
+    Raises:
+        AssertionError: If a bone differs by more than MATRIX_TOLERANCE.
+    """
+    frames = get_frames()
+    scratch_directory = tempfile.mkdtemp(prefix='skywind_benchmark_')
+    try:
+        constraints_fbx = os.path.join(scratch_directory, 'constraints.fbx')
+        retarget_fbx = os.path.join(scratch_directory, 'retarget.fbx')
+        results = {
+            'constraints': _time_publish(control_skeleton, actor, constraints_fbx, True, repeats),
+            'retarget': _time_publish(control_skeleton, actor, retarget_fbx, False, repeats),
+        }
+        results['speedup'] = results['constraints'] / results['retarget']
+
+        expected = _sample_published(constraints_fbx, frames)
+        actual = _sample_published(retarget_fbx, frames)
+    finally:
+        shutil.rmtree(scratch_directory, ignore_errors=True)
+
+    if expected.keys() != actual.keys():
+        raise AssertionError(f'Published different bones: {sorted(expected.keys() ^ actual.keys())}')
+    errors = {name: float(np.abs(actual[name] - expected[name]).max()) for name in expected}
+    for name, error in sorted(errors.items(), key=lambda item: item[1], reverse=True)[:10]:
+        _logger.info('%s: max difference %.6f', name, error)
+    results['max_difference'] = max(errors.values(), default=0.0)
+    failed = {name: error for name, error in errors.items() if error > MATRIX_TOLERANCE}
+    if failed:
+        raise AssertionError(f'{len(failed)} bones differ by more than {MATRIX_TOLERANCE}: {failed}')
+    return results
+
+
+def main():
+    control_skeleton, actor = find_control_rig()
+    for key, value in benchmark_publish(control_skeleton, actor).items():
+        print(f'publish_control_rig_animation {control_skeleton.name}, {key}: {value:.6f}')
@@ -7,9 +7,14 @@ import bpy
 
 @contextlib.contextmanager
 def view_3d_context():
+    """
+    Overrides the context with the first 3D viewport. Leaves the context as it is when there is none, as when Blender
+    runs in the background.
+    """
     for window in bpy.context.window_manager.windows:
         for area in window.screen.areas:
             if area.type == "VIEW_3D":
                 with bpy.context.temp_override(window=window, area=area):
                     yield
-                break
\ No newline at end of file
+                return
+    yield
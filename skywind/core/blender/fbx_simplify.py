@@ -0,0 +1,278 @@
+"""
+Module for removing the keys of an exported fbx animation that can be rebuilt by interpolating their neighbours.
+
+Blender's exporter keys every bone on every frame. While it writes the file, the translation, rotation and scale
+curves of each bone are simplified with the Douglas-Peucker algorithm, keeping a key wherever linear interpolation
+between the kept keys would move the bone further than its tolerance. Errors are measured on the whole transform, as a
+distance in centimeters for translations and an angle in degrees for rotations, for every frame of a segment at once.
+
+It is only reachable through publish_control_rig_animation(simplify=True), not the publish operators or the command
+line, until its tolerances and the encode_bin.write wrapper have been checked on fbx files exported by Blender.
+"""
+import zlib
+import logging
+import contextlib
+import dataclasses
+from struct import pack, unpack
+
+import numpy as np
+
+from .fbx_tree import find_child, find_children, get_int, get_name, get_string
+
+
+_logger = logging.getLogger(__name__)
+__all__ = [
+    'Tolerance', 'BoneSimplification', 'simplify_keys', 'simplify_fbx_tree', 'simplifying_keys', 'log_simplifications'
+]
+DEFAULT_POSITION_TOLERANCE = 0.01
+DEFAULT_ROTATION_TOLERANCE = 0.05
+SCALE_TOLERANCE = 1e-4
+# The FBX SDK flags of the interpolation of a key
+INTERPOLATION_MASK = 0x0000000e
+LINEAR_INTERPOLATION = 0x00000004
+# Arrays are compressed past this size, like the FBX SDK does
+COMPRESSION_THRESHOLD = 128
+CHANNELS = (b'd|X', b'd|Y', b'd|Z')
+
+
+@dataclasses.dataclass
+class Tolerance:
+    position: float = DEFAULT_POSITION_TOLERANCE
+    rotation: float = DEFAULT_ROTATION_TOLERANCE
+
+
+@dataclasses.dataclass
+class BoneSimplification:
+    bone: str
+    keys: int = 0
+    removed: int = 0
+    position_error: float = 0.0
+    rotation_error: float = 0.0
+
+
+def position_errors(expected: np.ndarray, actual: np.ndarray) -> np.ndarray:
+    """Returns the distances between (n, 3) translations."""
+    return np.linalg.norm(actual - expected, axis=1)
+
+
+def _to_quaternions(eulers: np.ndarray) -> np.ndarray:
+    # FBX eulers are in degrees and rotate around X, then Y, then Z
+    half = np.radians(eulers.astype(np.float64)) * 0.5
+    (cx, cy, cz), (sx, sy, sz) = np.cos(half).T, np.sin(half).T
+    return np.stack([
+        cx * cy * cz + sx * sy * sz,
+        sx * cy * cz - cx * sy * sz,
+        cx * sy * cz + sx * cy * sz,
+        cx * cy * sz - sx * sy * cz,
+    ], axis=1)
+
+
+def rotation_errors(expected: np.ndarray, actual: np.ndarray) -> np.ndarray:
+    """Returns the angles in degrees between the rotations of (n, 3) FBX eulers."""
+    expected, actual = _to_quaternions(expected), _to_quaternions(actual)
+    # The distance between unit quaternions is 2 sin(angle / 4), which stays precise for small angles
+    distance = np.minimum(np.linalg.norm(expected - actual, axis=1), np.linalg.norm(expected + actual, axis=1))
+    return np.degrees(4.0 * np.arcsin(np.clip(distance * 0.5, 0.0, 1.0)))
+
+
+def scale_errors(expected: np.ndarray, actual: np.ndarray) -> np.ndarray:
+    """Returns the largest difference between the components of (n, 3) scales."""
+    return np.max(np.abs(actual - expected), axis=1)
+
+
+def _interpolate(times: np.ndarray, values: np.ndarray, kept: np.ndarray) -> np.ndarray:
+    return np.stack([np.interp(times, times[kept], values[kept, axis]) for axis in range(values.shape[1])], axis=1)
+
+
+def simplify_keys(times: np.ndarray, values: np.ndarray, tolerance: float, get_errors=position_errors) -> np.ndarray:
+    """
+    Returns the keys to keep so that interpolating them linearly stays within a tolerance of every key.
+
+    The first and last keys are always kept, so a constant curve keeps only those.
+
+    Args:
+        times(np.ndarray): The (n,) time of each key, increasing.
+        values(np.ndarray): The (n, 3) values of each key.
+        tolerance(float): The largest error allowed.
+        get_errors(callable): Returns the (m,) errors of (m, 3) interpolated values from the expected values.
+
+    Returns:
+        np.ndarray: The (n,) mask of the keys to keep.
+    """
+    kept = np.zeros(len(times), dtype=bool)
+    kept[[0, -1]] = True
+    segments = [(0, len(times) - 1)]
+    while segments:
+        start, end = segments.pop()
+        if end - start < 2:
+            continue
+        weights = (times[start + 1:end] - times[start]) / (times[end] - times[start])
+        interpolated = values[start] + weights[:, None] * (values[end] - values[start])
+        errors = get_errors(values[start + 1:end], interpolated)
+        worst = int(np.argmax(errors))
+        if errors[worst] > tolerance:
+            split = start + 1 + worst
+            kept[split] = True
+            segments.extend([(start, split), (split, end)])
+    return kept
+
+
+def _read_array(element, dtype: str) -> np.ndarray:
+    length, encoding, _ = unpack('<3I', element.props[0][:12])
+    data = element.props[0][12:]
+    if encoding == 1:
+        data = zlib.decompress(data)
+    array = np.frombuffer(data, dtype=dtype)
+    if len(array) != length:
+        raise ValueError(f'Expected {length} values in {element.id.decode()}, found {len(array)}')
+    return array
+
+
+def _write_array(element, array: np.ndarray):
+    data = array.tobytes()
+    encoding = 1 if len(data) > COMPRESSION_THRESHOLD else 0
+    if encoding == 1:
+        data = zlib.compress(data, 1)
+    element.props[0] = pack('<3I', len(array), encoding, len(data)) + data
+
+
+def _get_transform_curves(objects, connections) -> dict[str, dict[bytes, list]]:
+    """Returns the X, Y and Z curves of the translation, rotation and scale of each model."""
+    models = {get_int(model): get_name(model) for model in find_children(objects, b'Model')}
+    curve_nodes = {get_int(curve_node): curve_node for curve_node in find_children(objects, b'AnimationCurveNode')}
+    curves = {get_int(curve): curve for curve in find_children(objects, b'AnimationCurve')}
+
+    node_properties = {}
+    node_curves = {}
+    for connection in find_children(connections, b'C'):
+        if get_string(connection) != b'OP':
+            continue
+        source, destination, prop = get_int(connection, 1), get_int(connection, 2), get_string(connection, 3)
+        if source in curve_nodes and destination in models and prop.startswith(b'Lcl '):
+            node_properties[source] = (models[destination], prop)
+        elif source in curves and destination in curve_nodes and prop in CHANNELS:
+            node_curves.setdefault(destination, {})[prop] = curves[source]
+
+    transform_curves = {}
+    for curve_node, (model, prop) in node_properties.items():
+        channels = node_curves.get(curve_node, {})
+        if all(channel in channels for channel in CHANNELS):
+            transform_curves.setdefault(model, {})[prop] = [channels[channel] for channel in CHANNELS]
+    return transform_curves
+
+
+def _simplify_curves(curves: list, tolerance: float, get_errors) -> tuple[int, int, float]:
+    """Simplifies the X, Y and Z curves of a transform together, returning the keys before and after and the error."""
+    times = [_read_array(find_child(curve, b'KeyTime'), '<i8') for curve in curves]
+    if any(len(channel_times) != len(times[0]) or np.any(channel_times != times[0]) for channel_times in times[1:]):
+        _logger.debug('Not simplifying curves keyed at different times')
+        return 0, 0, 0.0
+    times = times[0]
+    if len(times) < 3:
+        return len(times) * 3, len(times) * 3, 0.0
+    for curve in curves:
+        if len(_read_array(find_child(curve, b'KeyAttrRefCount'), '<i4')) != 1:
+            raise ValueError('Expected keys sharing a single set of attributes')
+    flags = [_read_array(find_child(curve, b'KeyAttrFlags'), '<i4') for curve in curves]
+
+    values = np.stack([_read_array(find_child(curve, b'KeyValueFloat'), '<f4') for curve in curves], axis=1)
+    float_times, float_values = times.astype(np.float64), values.astype(np.float64)
+    kept = simplify_keys(float_times, float_values, tolerance, get_errors)
+    error = float(np.max(get_errors(float_values, _interpolate(float_times, float_values, kept))))
+
+    # Everything was read and checked, so the curves are replaced whole
+    for axis, curve in enumerate(curves):
+        _write_array(find_child(curve, b'KeyTime'), np.ascontiguousarray(times[kept], dtype='<i8'))
+        _write_array(find_child(curve, b'KeyValueFloat'), np.ascontiguousarray(values[kept, axis], dtype='<f4'))
+        # The error was measured with linear interpolation, so the keys must interpolate linearly
+        _write_array(
+            find_child(curve, b'KeyAttrFlags'),
+            ((flags[axis] & ~INTERPOLATION_MASK) | LINEAR_INTERPOLATION).astype('<i4')
+        )
+        _write_array(find_child(curve, b'KeyAttrRefCount'), np.array([np.count_nonzero(kept)], dtype='<i4'))
+    return len(times) * 3, int(np.count_nonzero(kept)) * 3, error
+
+
+def simplify_fbx_tree(root, tolerances: dict[str, Tolerance] = None,
+                      default: Tolerance = None) -> list[BoneSimplification]:
+    """
+    Removes the keys of every bone animated in the element tree of an fbx Blender is exporting, within tolerances.
+
+    Args:
+        root(io_scene_fbx.encode_bin.FBXElem): The root element passed to io_scene_fbx.encode_bin.write.
+        tolerances(dict[str, Tolerance]): The tolerance of each bone, in centimeters and degrees.
+        default(Tolerance): The tolerance of the other bones.
+
+    Returns:
+        list[BoneSimplification]: The keys removed from each bone and the largest errors that causes.
+    """
+    tolerances = tolerances or {}
+    default = default or Tolerance()
+    objects = find_child(root, b'Objects')
+    connections = find_child(root, b'Connections')
+
+    simplifications = []
+    for bone, transform_curves in _get_transform_curves(objects, connections).items():
+        tolerance = tolerances.get(bone, default)
+        simplification = BoneSimplification(bone)
+        for prop, (bound, get_errors) in {
+            b'Lcl Translation': (tolerance.position, position_errors),
+            b'Lcl Rotation': (tolerance.rotation, rotation_errors),
+            b'Lcl Scaling': (SCALE_TOLERANCE, scale_errors),
+        }.items():
+            if prop not in transform_curves:
+                continue
+            keys, kept, error = _simplify_curves(transform_curves[prop], bound, get_errors)
+            simplification.keys += keys
+            simplification.removed += keys - kept
+            if prop == b'Lcl Translation':
+                simplification.position_error = error
+            elif prop == b'Lcl Rotation':
+                simplification.rotation_error = error
+        simplifications.append(simplification)
+    return simplifications
+
+
+@contextlib.contextmanager
+def simplifying_keys(tolerances: dict[str, Tolerance] = None, default: Tolerance = None):
+    """
+    Simplifies the bone animation of every fbx Blender exports within the context, see simplify_fbx_tree.
+
+    Yields:
+        list[BoneSimplification]: Filled with the simplification of each bone once the fbx is written. If simplifying
+            fails, the fbx is written with every key.
+    """
+    from io_scene_fbx import encode_bin
+
+    simplifications = []
+    write = encode_bin.write
+
+    def write_simplified(filepath, root, *args, **kwargs):
+        try:
+            simplifications.extend(simplify_fbx_tree(root, tolerances, default))
+        except Exception as e:
+            # Each transform is replaced whole once it is simplified, so the tree stays valid
+            _logger.warning('Exporting every key, as simplifying %s failed: %s', filepath, e)
+        return write(filepath, root, *args, **kwargs)
+
+    encode_bin.write = write_simplified
+    try:
+        yield simplifications
+    finally:
+        encode_bin.write = write
+
+
+def log_simplifications(simplifications: list[BoneSimplification]):
+    """Logs the keys removed from each bone and the largest errors, and their totals."""
+    for simplification in simplifications:
+        _logger.debug(
+            '%s: removed %s of %s keys, max error %.4f cm, %.4f deg', simplification.bone, simplification.removed,
+            simplification.keys, simplification.position_error, simplification.rotation_error
+        )
+    keys = sum(simplification.keys for simplification in simplifications)
+    removed = sum(simplification.removed for simplification in simplifications)
+    _logger.info(
+        'Removed %s of %s keys (%.1f%%), max error %.4f cm, %.4f deg', removed, keys, 100.0 * removed / max(keys, 1),
+        max((simplification.position_error for simplification in simplifications), default=0.0),
+        max((simplification.rotation_error for simplification in simplifications), default=0.0)
+    )
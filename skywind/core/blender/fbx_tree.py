@@ -0,0 +1,43 @@
+"""
+Module for reading the element tree Blender's exporter builds before encoding an fbx.
+
+Elements are io_scene_fbx.encode_bin.FBXElem. Their properties are stored encoded, integers packed and strings
+prefixed with their length.
+"""
+from struct import unpack
+
+
+__all__ = ['find_children', 'find_child', 'get_int', 'get_string', 'get_name']
+
+
+def find_children(element, element_id: bytes) -> list:
+    """Returns the children of an element with an id, e.g. b'Model'."""
+    return [child for child in element.elems if child.id == element_id]
+
+
+def find_child(element, element_id: bytes):
+    """
+    Returns the first child of an element with an id.
+
+    Raises:
+        ValueError: If the element has no such child.
+    """
+    children = find_children(element, element_id)
+    if not children:
+        raise ValueError(f'No {element_id.decode()} element found')
+    return children[0]
+
+
+def get_int(element, index: int = 0) -> int:
+    """Returns an int32 or int64 property of an element."""
+    return unpack('<q' if len(element.props[index]) == 8 else '<i', element.props[index])[0]
+
+
+def get_string(element, index: int = 0) -> bytes:
+    """Returns a string property of an element, without its length."""
+    return element.props[index][4:]
+
+
+def get_name(element) -> str:
+    """Returns the name of an object element, without its class."""
+    return get_string(element, 1).split(b'\x00\x01')[0].decode('utf-8')
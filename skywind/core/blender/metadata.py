@@ -1,9 +1,11 @@
 
-import re
+import functools
 
 import bpy
+import numpy as np
 
 from ..fbx.tags import Tag
+from .action import ensure_action, get_keyframe_frames, write_fcurve
 
 
 SOURCE_PATH_PROPERTY_NAME = 'sourcePath'
@@ -26,34 +28,47 @@ def _get_frame_rate():
 
 
 def save_tags_to_object(object: str, tags: list[Tag]):
+    action = ensure_action(object)
+    frame_rate = _get_frame_rate()
 
-    # Ensure the armature has an action (to store animation data)
-    if object.animation_data is None:
-        object.animation_data_create()
-    if object.animation_data.action is None:
-        object.animation_data.action = bpy.data.actions.new(name=f"{object.name}_Action")
-    action = object.animation_data.action
-
+    # Group the keyframes of each custom property, so each fcurve is written once
+    frames_by_property = {}
     for tag in tags:
-
         for time, label in tag.keyframes:
-
             property_name = f'{tag.node}::{tag.name}::{label}'
-            if property_name not in object:
-                object[property_name] = 0.0
+            frames_by_property.setdefault(property_name, []).append(time * frame_rate)
+
+    for property_name, frames in frames_by_property.items():
+        if property_name not in object:
+            object[property_name] = 0.0
 
-            # Data path for the custom property
-            data_path = f'["{property_name}"]'
+        # Data path for the custom property
+        data_path = f'["{property_name}"]'
 
-            # Create or get the F-Curve for the property
-            fcurve = action.fcurves.find(data_path)
-            if fcurve is None:
-                fcurve = action.fcurves.new(data_path=data_path, index=0)
+        # Keep existing keyframes, as inserting keyframes would
+        frames = np.unique(np.array(frames, dtype=np.float32))
+        values = np.zeros(len(frames), dtype=np.float32)
+        fcurve = action.fcurves.find(data_path)
+        if fcurve is not None and len(fcurve.keyframe_points):
+            coordinates = np.empty(len(fcurve.keyframe_points) * 2, dtype=np.float32)
+            fcurve.keyframe_points.foreach_get('co', coordinates)
+            existing_frames, existing_values = coordinates.reshape(-1, 2).T
+            existing = ~np.isin(existing_frames, frames)
+            frames = np.concatenate([frames, existing_frames[existing]])
+            values = np.concatenate([values, existing_values[existing]])
+            order = np.argsort(frames, kind='stable')
+            frames, values = frames[order], values[order]
 
-            # Set the keyframe
-            frame = time * _get_frame_rate()
-            key = fcurve.keyframe_points.insert(frame=frame, value=0.0)
-            key.interpolation = 'LINEAR'
+        write_fcurve(action, data_path, 0, frames, values, interpolation='LINEAR')
+
+
+@functools.lru_cache(maxsize=None)
+def _parse_tag_path(data_path: str) -> tuple[str, str, str] | None:
+    """Returns the node, tag name and label of a custom property data path like '["node::tag_name::label"]'."""
+    if not data_path.startswith('["') or not data_path.endswith('"]'):
+        return None
+    parts = data_path[2:-2].split('::', 2)
+    return tuple(parts) if len(parts) == 3 else None
 
 
 def load_tags_from_object(object: str) -> list[Tag]:
@@ -67,20 +82,12 @@ def load_tags_from_object(object: str) -> list[Tag]:
     action = object.animation_data.action
     frame_rate = _get_frame_rate()
 
-    # Regex to parse custom property names in the format: "node::tag_name::label"
-    pattern = re.compile(r'^(.*?)::(.*?)::(.*?)$')
-
     for fcurve in action.fcurves:
-        data_path = fcurve.data_path
-        if not data_path.startswith('["') or not data_path.endswith('"]'):
-            continue
-
-        property_name = data_path[2:-2]  # Strip [" and "]
-        match = pattern.match(property_name)
-        if not match:
+        parsed = _parse_tag_path(fcurve.data_path)
+        if parsed is None:
             continue
 
-        node, tag_name, label = match.groups()
+        node, tag_name, label = parsed
         tag_id = (node, tag_name)
 
         if tag_id not in tags_by_id:
@@ -90,8 +97,7 @@ def load_tags_from_object(object: str) -> list[Tag]:
             tag = tags_by_id[tag_id]
 
         # Extract time from keyframes
-        for key in fcurve.keyframe_points:
-            time = key.co.x / frame_rate
-            tag.keyframes.append((time, label))
+        times = get_keyframe_frames(fcurve) / frame_rate
+        tag.keyframes.extend((time, label) for time in times.tolist())
 
-    return list(tags_by_id.values())
\ No newline at end of file
+    return list(tags_by_id.values())
@@ -0,0 +1,317 @@
+"""
+Module for retargeting animation between armatures with NumPy.
+
+This is meant to reproduce the constraint rigs of opening and publishing without building them. Each mapped bone
+follows its source with the offset the CHILD_OF constraints (with their inverse set on creation) would keep between the
+world space copies of both armatures. The source animation is sampled once per frame, the targets are computed for all
+frames at once, converted to pose basis channels as visual keying would, and written to fcurves in bulk.
+
+benchmark_publish compares both paths on an opened animation, but has not been run on real actors yet. Until it has,
+publish_control_rig_animation(use_constraints=True) still bakes through the constraint rig.
+"""
+import logging
+
+import bpy
+import numpy as np
+
+from .action import ensure_action, write_transform_animation, OBJECT_TRANSFORMS_GROUP
+from .armature import get_bone_matrices, get_world_bone_matrices
+
+_logger = logging.getLogger(__name__)
+ROOT_BONE_NAME = 'NPC_s_Root_s__ob_Root_cb_'
+
+
+def get_frames() -> np.ndarray:
+    """Returns every frame of the scene's frame range."""
+    scene = bpy.context.scene
+    return np.arange(scene.frame_start, scene.frame_end + 1, dtype=np.float64)
+
+
+def _get_indices(bones) -> dict[str, int]:
+    return {bone.name: index for index, bone in enumerate(bones)}
+
+
+def sample_world_matrices(armature_obj: bpy.types.Object, frames: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Evaluates an armature on every frame.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The (frames, bones, 4, 4) world matrices of the pose bones, in pose bone order,
+            and the (frames, 4, 4) world matrices of the object.
+    """
+    scene = bpy.context.scene
+    current_frame = scene.frame_current
+    pose_bones = armature_obj.pose.bones
+    buffer = np.empty(len(pose_bones) * 16, dtype=np.float32)
+    bone_matrices = np.empty((len(frames), len(pose_bones), 4, 4))
+    object_matrices = np.empty((len(frames), 4, 4))
+    for index, frame in enumerate(frames):
+        scene.frame_set(int(frame))
+        pose_bones.foreach_get('matrix', buffer)
+        bone_matrices[index] = buffer.reshape(-1, 4, 4).transpose(0, 2, 1)
+        object_matrices[index] = armature_obj.matrix_world
+    scene.frame_set(current_frame)
+    return object_matrices[:, None] @ bone_matrices, object_matrices
+
+
+def get_mapping_plan(bones, mapping: dict[str, str]) -> list[tuple[str, str, bool]]:
+    """
+    Returns the mapped bones of a constraint rig in bone order.
+
+    Returns:
+        list[tuple[str, str, bool]]: The name of each mapped bone, the name it maps to, and whether that is the root.
+    """
+    return [
+        (bone.name, mapping[bone.name], mapping[bone.name] == ROOT_BONE_NAME) for bone in bones if bone.name in mapping
+    ]
+
+
+def add_child_of_constraint(owner, target: bpy.types.Object, subtarget: str = '') -> bpy.types.Constraint:
+    """
+    Adds a CHILD_OF constraint that keeps the owner where it is, without evaluating the scene to set its inverse.
+
+    The inverse is computed from the rest pose of the target, so the target must not be posed or constrained yet, as
+    the world space copies of a constraint rig are when it is built.
+
+    Args:
+        owner(bpy.types.Object | bpy.types.PoseBone): The object or pose bone to constrain.
+        target(bpy.types.Object): The armature to follow.
+        subtarget(str): The bone to follow. Follows the armature object if empty.
+    """
+    target_matrix = target.matrix_world.copy()
+    if subtarget:
+        target_matrix = target_matrix @ target.data.bones[subtarget].matrix_local
+    inverse_matrix = target_matrix.inverted()
+    if isinstance(owner, bpy.types.PoseBone):
+        inverse_matrix = inverse_matrix @ owner.id_data.matrix_world
+
+    constraint = owner.constraints.new(type='CHILD_OF')
+    constraint.target = target
+    constraint.subtarget = subtarget
+    constraint.inverse_matrix = inverse_matrix
+    constraint.set_inverse_pending = False
+    return constraint
+
+
+def _get_ancestors(bone: bpy.types.Bone) -> list[bpy.types.Bone]:
+    ancestors = []
+    while bone.parent is not None:
+        bone = bone.parent
+        ancestors.append(bone)
+    return ancestors
+
+
+def get_retarget_blocker(armature_obj: bpy.types.Object, bone_names: list[str]) -> str | None:
+    """
+    Returns why the pose of an armature cannot be baked without evaluating it, or None if it can.
+
+    Baked bones are converted to pose basis assuming full inheritance from their parents, and the parents that are not
+    baked are assumed to hold their current pose, so they must not be constrained.
+    """
+    bones = armature_obj.data.bones
+    for name in bone_names:
+        for bone in [bones[name]] + _get_ancestors(bones[name]):
+            if not bone.use_inherit_rotation or bone.inherit_scale != 'FULL' or not bone.use_local_location:
+                return f'{bone.name} does not fully inherit its parent transforms'
+            if bone.name not in bone_names and armature_obj.pose.bones[bone.name].constraints:
+                return f'{bone.name} is constrained'
+    return None
+
+
+def compute_pose_basis(armature_obj: bpy.types.Object, pose_matrices: dict[str, np.ndarray]) -> dict[str, np.ndarray]:
+    """
+    Converts armature space pose matrices to basis matrices, as visual keying converts them.
+
+    Bones without a pose matrix keep their current basis, and move with their posed parents.
+
+    Args:
+        armature_obj(bpy.types.Object): The armature the poses are for.
+        pose_matrices(dict[str, np.ndarray]): The (frames, 4, 4) armature space matrices of each posed bone.
+
+    Returns:
+        dict[str, np.ndarray]: The (frames, 4, 4) basis matrices of each posed bone.
+    """
+    bones = armature_obj.data.bones
+    indices = _get_indices(bones)
+    rest_matrices = get_bone_matrices(armature_obj)
+    pose_bones = armature_obj.pose.bones
+    current_basis = np.empty(len(pose_bones) * 16, dtype=np.float32)
+    pose_bones.foreach_get('matrix_basis', current_basis)
+    current_basis = current_basis.reshape(-1, 4, 4).transpose(0, 2, 1)
+    current_basis = {bone.name: current_basis[index] for index, bone in enumerate(pose_bones)}
+
+    poses = {}
+
+    def get_pose(bone: bpy.types.Bone) -> np.ndarray:
+        if bone.name not in poses:
+            if bone.name in pose_matrices:
+                poses[bone.name] = pose_matrices[bone.name]
+            elif bone.parent is None:
+                poses[bone.name] = rest_matrices[indices[bone.name]] @ current_basis[bone.name]
+            else:
+                relative_rest = np.linalg.inv(rest_matrices[indices[bone.parent.name]]) @ \
+                    rest_matrices[indices[bone.name]]
+                poses[bone.name] = get_pose(bone.parent) @ relative_rest @ current_basis[bone.name]
+        return poses[bone.name]
+
+    basis = {}
+    for name, pose in pose_matrices.items():
+        bone = bones[name]
+        rest = rest_matrices[indices[name]]
+        if bone.parent is None:
+            basis[name] = np.linalg.inv(rest) @ pose
+        else:
+            parent_rest = rest_matrices[indices[bone.parent.name]]
+            basis[name] = np.linalg.inv(rest) @ parent_rest @ np.linalg.inv(get_pose(bone.parent)) @ pose
+    return basis
+
+
+def _write_pose_animation(armature_obj: bpy.types.Object, frames: np.ndarray, basis: dict[str, np.ndarray]):
+    action = ensure_action(armature_obj)
+    for name, matrices in basis.items():
+        write_transform_animation(
+            action, frames, matrices, armature_obj.pose.bones[name].rotation_mode, f'pose.bones["{name}"].', name
+        )
+
+
+def _compute_import_offsets(export_skeleton: bpy.types.Object, control_skeleton: bpy.types.Object,
+                            import_mapping: dict[str, str]) -> dict[str, np.ndarray]:
+    """
+    Returns the offset each control keeps from its mapped bone when opening an animation.
+
+    Returns:
+        dict[str, np.ndarray]: The (4, 4) offset of each mapped control, in bone order. The control mapped to the root
+            keeps its world matrix, as it follows the animation object.
+    """
+    export_world = get_world_bone_matrices(export_skeleton, use_pose_bones=True)
+    export_indices = _get_indices(export_skeleton.pose.bones)
+    control_world = get_world_bone_matrices(control_skeleton, use_pose_bones=True)
+    offsets = {}
+    for control_name, control_index in _get_indices(control_skeleton.pose.bones).items():
+        if control_name not in import_mapping:
+            continue
+        bone_name = import_mapping[control_name]
+        if bone_name == ROOT_BONE_NAME:
+            offsets[control_name] = control_world[control_index]
+        else:
+            offsets[control_name] = np.linalg.inv(export_world[export_indices[bone_name]]) @ \
+                control_world[control_index]
+    return offsets
+
+
+def retarget_to_control_rig(animation_skeleton: bpy.types.Object, export_skeleton: bpy.types.Object,
+                            control_skeleton: bpy.types.Object, import_mapping: dict[str, str],
+                            frames: np.ndarray) -> list[str]:
+    """
+    Bakes an imported animation onto a control rig, as opening an animation does.
+
+    Each control follows its mapped animation bone, keeping the offset between the posed export skeleton and control
+    rig. The control mapped to the root follows the animation object instead.
+
+    Args:
+        animation_skeleton(bpy.types.Object): The imported animation.
+        export_skeleton(bpy.types.Object): The imported skeleton the mapping refers to.
+        control_skeleton(bpy.types.Object): The control rig to bake onto.
+        import_mapping(dict[str, str]): The animation bone of each control.
+        frames(np.ndarray): The frames to bake.
+
+    Returns:
+        list[str]: The baked controls.
+    """
+    offsets = _compute_import_offsets(export_skeleton, control_skeleton, import_mapping)
+    animation_world, animation_object = sample_world_matrices(animation_skeleton, frames)
+    animation_indices = _get_indices(animation_skeleton.pose.bones)
+
+    control_object_inverse = np.linalg.inv(np.array(control_skeleton.matrix_world))
+    pose_matrices = {}
+    for control_name, offset in offsets.items():
+        bone_name = import_mapping[control_name]
+        if bone_name == ROOT_BONE_NAME:
+            world = animation_object @ offset
+        else:
+            world = animation_world[:, animation_indices[bone_name]] @ offset
+        pose_matrices[control_name] = control_object_inverse @ world
+
+    _write_pose_animation(control_skeleton, frames, compute_pose_basis(control_skeleton, pose_matrices))
+    _logger.info('Retargeted %s controls over %s frames', len(pose_matrices), len(frames))
+    return list(pose_matrices)
+
+
+def _compute_export_offsets(control_skeleton: bpy.types.Object, export_skeleton: bpy.types.Object,
+                            export_mapping: dict[str, str]) -> dict[str, np.ndarray]:
+    """
+    Returns the rest matrices each bone follows its mapped control by when publishing an animation.
+
+    Returns:
+        dict[str, np.ndarray]: The (2, 4, 4) inverse world rest matrix of each mapped control and world rest matrix of
+            its bone, in control bone order. The bone of the control mapped to the root is left as identity.
+    """
+    control_rest = get_world_bone_matrices(control_skeleton)
+    export_rest = get_world_bone_matrices(export_skeleton)
+    export_indices = _get_indices(export_skeleton.data.bones)
+    offsets = {}
+    for control_index, control in enumerate(control_skeleton.data.bones):
+        if control.name not in export_mapping:
+            continue
+        bone_name = export_mapping[control.name]
+        offsets[control.name] = np.stack([
+            np.linalg.inv(control_rest[control_index]),
+            np.identity(4) if bone_name == ROOT_BONE_NAME else export_rest[export_indices[bone_name]],
+        ])
+    return offsets
+
+
+def retarget_to_export_skeleton(control_skeleton: bpy.types.Object, export_skeleton: bpy.types.Object,
+                                export_mapping: dict[str, str], frames: np.ndarray) -> list[str]:
+    """
+    Bakes a control rig animation onto an export skeleton, as publishing an animation does.
+
+    Each bone follows its mapped control relative to the rest poses of both armatures. The control mapped to the root
+    animates the export skeleton object, which the bones follow as well.
+
+    Args:
+        control_skeleton(bpy.types.Object): The animated control rig.
+        export_skeleton(bpy.types.Object): The imported skeleton to bake onto.
+        export_mapping(dict[str, str]): The export bone of each control.
+        frames(np.ndarray): The frames to bake.
+
+    Returns:
+        list[str]: The baked bones, not including the root.
+    """
+    offsets = _compute_export_offsets(control_skeleton, export_skeleton, export_mapping)
+    control_world, _ = sample_world_matrices(control_skeleton, frames)
+    control_indices = _get_indices(control_skeleton.pose.bones)
+
+    def get_control_motion(control_name: str) -> np.ndarray:
+        return control_world[:, control_indices[control_name]] @ offsets[control_name][0]
+
+    root_controls = [name for name in offsets if export_mapping[name] == ROOT_BONE_NAME]
+    if root_controls:
+        object_world = get_control_motion(root_controls[-1])
+    else:
+        object_world = np.broadcast_to(np.array(export_skeleton.matrix_world), (len(frames), 4, 4))
+
+    # The world space export skeleton moves with its object, so the root motion applies before the rest offsets
+    rest_object_world = object_world if root_controls else np.identity(4)
+    object_inverse = np.linalg.inv(object_world)
+    pose_matrices = {}
+    for control_name, (_, export_rest) in offsets.items():
+        bone_name = export_mapping[control_name]
+        if bone_name == ROOT_BONE_NAME:
+            continue
+        world = get_control_motion(control_name) @ rest_object_world @ export_rest
+        pose_matrices[bone_name] = object_inverse @ world
+
+    _write_pose_animation(export_skeleton, frames, compute_pose_basis(export_skeleton, pose_matrices))
+    if root_controls:
+        object_basis = object_world
+        if export_skeleton.parent is not None:
+            parent_world = np.array(export_skeleton.parent.matrix_world) @ \
+                np.array(export_skeleton.matrix_parent_inverse)
+            object_basis = np.linalg.inv(parent_world) @ object_world
+        write_transform_animation(
+            ensure_action(export_skeleton), frames, object_basis, export_skeleton.rotation_mode,
+            group=OBJECT_TRANSFORMS_GROUP
+        )
+    _logger.info('Retargeted %s bones over %s frames', len(pose_matrices), len(frames))
+    return list(pose_matrices)
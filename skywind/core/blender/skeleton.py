@@ -0,0 +1,163 @@
+"""
+Module for building skeletons from a cache instead of importing their fbx.
+
+The first time a skeleton fbx is needed, it is imported, and the names, hierarchy, rest matrices, lengths, inheritance
+and deform flags and pose of its bones are saved to a NumPy archive next to it, keyed by the hash of the fbx and the
+import options. Afterwards the armature is built from the archive, without running the FBX importer.
+"""
+import os
+import zipfile
+import hashlib
+import logging
+import tempfile
+from functools import lru_cache
+
+import bpy
+import numpy as np
+
+from ..manifest import MANIFEST_DIRECTORY
+from .armature import create_armature, get_bone_matrices
+from .fbx import import_fbx
+
+
+_logger = logging.getLogger(__name__)
+__all__ = ['load_skeleton_fbx', 'get_skeleton_cache_file']
+SKELETON_CACHE_VERSION = 2
+
+
+@lru_cache(maxsize=None)
+def _get_key(skeleton_fbx: str, mtime: int, size: int, import_options: str) -> str:
+    with open(skeleton_fbx, 'rb') as openfile:
+        digest = hashlib.file_digest(openfile, 'sha256')
+    digest.update(f'{SKELETON_CACHE_VERSION}{import_options}'.encode())
+    return digest.hexdigest()
+
+
+@lru_cache(maxsize=16)
+def _read_cache(cache_file: str, mtime: int) -> dict[str, np.ndarray]:
+    with np.load(cache_file, allow_pickle=False) as archive:
+        return dict(archive)
+
+
+def get_skeleton_cache_file(skeleton_fbx: str) -> str:
+    """Returns the archive a skeleton fbx is cached in."""
+    directory, filename = os.path.split(os.path.abspath(skeleton_fbx))
+    return os.path.join(directory, MANIFEST_DIRECTORY, f'{os.path.splitext(filename)[0]}.skeleton.npz')
+
+
+def _extract_skeleton(armature_obj: bpy.types.Object, key: str) -> dict[str, np.ndarray]:
+    bones = armature_obj.data.bones
+    indices = {bone.name: index for index, bone in enumerate(bones)}
+    lengths = np.empty(len(bones), dtype=np.float32)
+    bones.foreach_get('length', lengths)
+    pose_bones = armature_obj.pose.bones
+    basis = np.empty((len(pose_bones), 16), dtype=np.float32)
+    pose_bones.foreach_get('matrix_basis', basis.ravel())
+    # Pose data is stored in the order of the bones
+    pose_order = [indices[pose_bone.name] for pose_bone in pose_bones]
+    rotation_modes = np.empty(len(bones), dtype=object)
+    rotation_modes[pose_order] = [pose_bone.rotation_mode for pose_bone in pose_bones]
+    bone_basis = np.empty_like(basis)
+    bone_basis[pose_order] = basis
+    return {
+        'key': np.array(key),
+        'object_name': np.array(armature_obj.name),
+        'data_name': np.array(armature_obj.data.name),
+        'object_matrix': np.array(armature_obj.matrix_world),
+        'names': np.array(list(indices)),
+        'parents': np.array([indices[bone.parent.name] if bone.parent else -1 for bone in bones], dtype=np.int32),
+        'matrices': get_bone_matrices(armature_obj),
+        'lengths': lengths,
+        'use_connect': np.array([bone.use_connect for bone in bones]),
+        'use_inherit_rotation': np.array([bone.use_inherit_rotation for bone in bones]),
+        'use_local_location': np.array([bone.use_local_location for bone in bones]),
+        'use_deform': np.array([bone.use_deform for bone in bones]),
+        'inherit_scale': np.array([bone.inherit_scale for bone in bones]),
+        'rotation_modes': rotation_modes.astype(str),
+        'basis': bone_basis,
+    }
+
+
+def _save_cache(cache_file: str, skeleton: dict[str, np.ndarray]):
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(cache_file), prefix='.', suffix='.npz')
+    try:
+        with os.fdopen(handle, 'wb') as openfile:
+            np.savez(openfile, **skeleton)
+        os.replace(temp_path, cache_file)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def _build_skeleton(skeleton: dict[str, np.ndarray]) -> bpy.types.Object:
+    armature_obj = create_armature(
+        str(skeleton['object_name']), skeleton['names'].tolist(), skeleton['matrices'], skeleton['lengths'],
+        parents=skeleton['parents'], use_connect=skeleton['use_connect']
+    )
+    armature_obj.data.name = str(skeleton['data_name'])
+    armature_obj.matrix_world = skeleton['object_matrix'].tolist()
+
+    bones = armature_obj.data.bones
+    bones.foreach_set('use_inherit_rotation', skeleton['use_inherit_rotation'])
+    bones.foreach_set('use_local_location', skeleton['use_local_location'])
+    bones.foreach_set('use_deform', skeleton['use_deform'])
+    for bone, inherit_scale in zip(bones, skeleton['inherit_scale'].tolist()):
+        if bone.inherit_scale != inherit_scale:
+            bone.inherit_scale = inherit_scale
+
+    indices = {name: index for index, name in enumerate(skeleton['names'].tolist())}
+    pose_bones = armature_obj.pose.bones
+    pose_order = [indices[pose_bone.name] for pose_bone in pose_bones]
+    rotation_modes = skeleton['rotation_modes'].tolist()
+    for pose_bone, index in zip(pose_bones, pose_order):
+        if pose_bone.rotation_mode != rotation_modes[index]:
+            pose_bone.rotation_mode = rotation_modes[index]
+    pose_bones.foreach_set('matrix_basis', skeleton['basis'][pose_order].ravel())
+    armature_obj.update_tag()
+    return armature_obj
+
+
+def load_skeleton_fbx(skeleton_fbx: str, **kwargs) -> bpy.types.Object:
+    """
+    Adds the armature of a skeleton fbx to the current scene, building it from its cache when the cache is up to date.
+
+    When the fbx is imported, the imported armature is returned and every other object the fbx holds is removed. An
+    armature built from the cache only has what the cache keeps: the bone names, hierarchy, rest matrices, lengths,
+    connections, inheritance and deform flags, rotation modes and pose. Custom properties are not kept.
+
+    Args:
+        skeleton_fbx(str): The skeleton fbx.
+        kwargs: Import options, as import_fbx accepts them. They are part of the cache key.
+
+    Returns:
+        bpy.types.Object: The armature.
+    """
+    skeleton_fbx = os.path.abspath(skeleton_fbx)
+    stat = os.stat(skeleton_fbx)
+    key = _get_key(skeleton_fbx, stat.st_mtime_ns, stat.st_size, repr(sorted(kwargs.items())))
+    cache_file = get_skeleton_cache_file(skeleton_fbx)
+    try:
+        skeleton = _read_cache(cache_file, os.stat(cache_file).st_mtime_ns)
+        if str(skeleton['key']) == key:
+            _logger.debug('Building skeleton from %s', cache_file)
+            return _build_skeleton(skeleton)
+    except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile) as e:
+        _logger.debug('Skeleton cache %s is not usable: %s', cache_file, e)
+
+    _logger.info('Importing skeleton: %s', skeleton_fbx)
+    objects = import_fbx(skeleton_fbx, **kwargs)
+    armatures = [obj for obj in objects if obj.type == 'ARMATURE']
+    if len(armatures) != 1:
+        raise RuntimeError(f'Expected one skeleton in {skeleton_fbx}, found {len(armatures)}.')
+    armature_obj = armatures[0]
+    skeleton = _extract_skeleton(armature_obj, key)
+    others = [obj for obj in objects if obj != armature_obj]
+    bpy.data.batch_remove(others + [obj.data for obj in others if obj.data is not None])
+    # Removing a parent the importer created would move the armature
+    armature_obj.matrix_world = skeleton['object_matrix'].tolist()
+    try:
+        _save_cache(cache_file, skeleton)
+    except OSError as e:
+        _logger.warning('Failed to save skeleton cache %s: %s', cache_file, e)
+    return armature_obj
@@ -0,0 +1,227 @@
+"""
+Module for reusing control rigs between animations opened in the same session.
+
+A rig file is linked once as a library. Each time the rig is needed, its objects are copied into local objects that
+use local copies of the armatures and actions, and keep using the linked meshes, so nothing is read from disk again.
+Resetting the file with reset_file instead of reading the home file keeps the linked rigs loaded between animations.
+"""
+import os
+import hashlib
+import logging
+
+import bpy
+
+
+_logger = logging.getLogger(__name__)
+__all__ = ['RigTemplateCache', 'rig_templates', 'reset_file', 'SCENE_SETTINGS']
+
+
+def _hash_file(filepath: str) -> str:
+    with open(filepath, 'rb') as openfile:
+        return hashlib.file_digest(openfile, 'sha256').hexdigest()
+
+
+def _remap_references(copies: dict):
+    """Points the references between copied objects, such as parents, constraint targets and drivers, to the copies."""
+    for copy in copies.values():
+        if copy.parent in copies:
+            copy.parent = copies[copy.parent]
+        for modifier in copy.modifiers:
+            if getattr(modifier, 'object', None) in copies:
+                modifier.object = copies[modifier.object]
+        constraints = list(copy.constraints)
+        if copy.pose is not None:
+            for pose_bone in copy.pose.bones:
+                constraints.extend(pose_bone.constraints)
+                if pose_bone.custom_shape in copies:
+                    pose_bone.custom_shape = copies[pose_bone.custom_shape]
+        for constraint in constraints:
+            for attribute in ('target', 'pole_target'):
+                if getattr(constraint, attribute, None) in copies:
+                    setattr(constraint, attribute, copies[getattr(constraint, attribute)])
+        for owner in (copy, copy.data):
+            animation_data = getattr(owner, 'animation_data', None)
+            if animation_data is None or owner.library is not None:
+                continue
+            for fcurve in animation_data.drivers:
+                for variable in fcurve.driver.variables:
+                    for target in variable.targets:
+                        if target.id in copies:
+                            target.id = copies[target.id]
+
+
+def _is_used_locally(library: bpy.types.Library) -> bool:
+    """Returns True if any local data, such as a copied rig, uses data linked from a library."""
+    linked = [id_data for id_data in bpy.data.user_map() if id_data.library == library]
+    return any(user.library is None for users in bpy.data.user_map(subset=linked).values() for user in users)
+
+
+class RigTemplateCache:
+    """
+    Keeps the rig files linked in this session, keyed by their path, modification time and hash.
+
+    A rig is linked again when its modification time and contents changed. A modification time change alone, e.g. from
+    a checkout, only updates the key.
+    """
+
+    def __init__(self):
+        self._templates = {}
+
+    def _get_collections(self, filepath: str) -> list[bpy.types.Collection] | None:
+        """Returns the linked collections of a rig file, or None if they were removed, e.g. by reading another file."""
+        cached = self._templates.get(filepath)
+        if cached is None:
+            return None
+        try:
+            if all(collection.library is not None for collection in cached[2]):
+                return cached[2]
+        except ReferenceError:
+            pass
+        del self._templates[filepath]
+        return None
+
+    def _load(self, filepath: str) -> list[bpy.types.Collection]:
+        stat = os.stat(filepath)
+        collections = self._get_collections(filepath)
+        if collections is not None:
+            mtime, digest, _ = self._templates[filepath]
+            if mtime == stat.st_mtime_ns:
+                return collections
+            new_digest = _hash_file(filepath)
+            if new_digest == digest:
+                self._templates[filepath] = (stat.st_mtime_ns, digest, collections)
+                return collections
+            _logger.info('Rig changed: %s', filepath)
+            library = collections[0].library
+            del self._templates[filepath]
+            if _is_used_locally(library):
+                # Earlier copies still use its meshes, so it is reloaded for them as well
+                library.reload()
+            else:
+                bpy.data.libraries.remove(library)
+
+        _logger.info('Linking rig: %s', filepath)
+        with bpy.data.libraries.load(filepath, link=True) as (data_from, data_to):
+            data_to.collections = data_from.collections
+        collections = [collection for collection in data_to.collections if collection is not None]
+        if not collections:
+            raise RuntimeError(f'No collections found in {filepath}')
+        self._templates[filepath] = (stat.st_mtime_ns, _hash_file(filepath), collections)
+        return collections
+
+    def get_libraries(self) -> list[bpy.types.Library]:
+        """Returns the libraries of the rigs in the cache."""
+        libraries = []
+        for filepath in list(self._templates):
+            collections = self._get_collections(filepath)
+            if collections is not None:
+                libraries.append(collections[0].library)
+        return libraries
+
+    def instantiate(self, filepath: str, scene: bpy.types.Scene = None) -> list[bpy.types.Object]:
+        """
+        Adds a local copy of a rig to a scene, as appending every collection of the rig file would.
+
+        Args:
+            filepath(str): The rig file.
+            scene(bpy.types.Scene): The scene to add the rig to. Uses the current scene if None.
+
+        Returns:
+            list[bpy.types.Object]: The objects of the copy.
+        """
+        filepath = os.path.abspath(filepath)
+        scene = scene or bpy.context.scene
+        copies = {}
+        for template in self._load(filepath):
+            collection = bpy.data.collections.new(template.name)
+            scene.collection.children.link(collection)
+            for template_obj in template.objects:
+                if template_obj not in copies:
+                    copy = template_obj.copy()
+                    if template_obj.type == 'ARMATURE':
+                        copy.data = template_obj.data.copy()
+                    if copy.animation_data is not None and copy.animation_data.action is not None:
+                        copy.animation_data.action = copy.animation_data.action.copy()
+                    copies[template_obj] = copy
+                collection.objects.link(copies[template_obj])
+            if not any(obj.type == 'ARMATURE' for obj in template.objects):
+                collection.hide_viewport = True
+                collection.hide_render = True
+        _remap_references(copies)
+
+        _logger.debug('Instantiated objects: %s', list(copies.values()))
+        return list(copies.values())
+
+    def invalidate(self, filepath: str = ''):
+        """Forgets a rig file, or every rig file if empty, so it is linked again the next time it is needed."""
+        if filepath:
+            self._templates.pop(os.path.abspath(filepath), None)
+        else:
+            self._templates.clear()
+
+
+rig_templates = RigTemplateCache()
+
+
+@bpy.app.handlers.persistent
+def _forget_templates(*args):
+    rig_templates.invalidate()
+
+
+def register():
+    # Reading a file frees the linked rigs
+    unregister()
+    bpy.app.handlers.load_pre.append(_forget_templates)
+
+
+def unregister():
+    # Compared by name, so a handler added before the module was reloaded is removed as well
+    for handler in [handler for handler in bpy.app.handlers.load_pre if handler.__name__ == _forget_templates.__name__]:
+        bpy.app.handlers.load_pre.remove(handler)
+
+
+# The scene settings reset_file restores, by the struct of the scene holding them
+SCENE_SETTINGS = {
+    '': ('frame_start', 'frame_end', 'frame_step', 'frame_preview_start', 'frame_preview_end', 'use_preview_range'),
+    'render': ('fps', 'fps_base', 'frame_map_old', 'frame_map_new', 'resolution_x', 'resolution_y'),
+    'unit_settings': (
+        'system', 'system_rotation', 'scale_length', 'length_unit', 'mass_unit', 'time_unit', 'temperature_unit',
+        'use_separate'
+    ),
+    'display_settings': ('display_device',),
+    'view_settings': ('view_transform', 'look', 'exposure', 'gamma'),
+}
+
+
+def reset_file():
+    """
+    Empties the current file like reading an empty home file, but keeps the rigs linked by rig_templates.
+
+    The frame range, frame rate, units and color management of the current scene, as listed in SCENE_SETTINGS, are
+    reset to those of a new scene, and its world, markers and custom properties are removed. A new scene has the
+    factory settings, not the settings of the home file.
+    """
+    scene = bpy.context.scene
+    for other_scene in [other_scene for other_scene in bpy.data.scenes if other_scene != scene]:
+        bpy.data.scenes.remove(other_scene)
+    defaults = bpy.data.scenes.new('Defaults')
+    try:
+        for path, attributes in SCENE_SETTINGS.items():
+            target = scene.path_resolve(path) if path else scene
+            source = defaults.path_resolve(path) if path else defaults
+            for attribute in attributes:
+                setattr(target, attribute, getattr(source, attribute))
+    finally:
+        bpy.data.scenes.remove(defaults)
+    scene.world = None
+    scene.timeline_markers.clear()
+    for key in list(scene.keys()):
+        del scene[key]
+    scene.frame_set(scene.frame_start)
+
+    bpy.data.batch_remove([obj for obj in bpy.data.objects if obj.library is None])
+    bpy.data.batch_remove([collection for collection in bpy.data.collections if collection.library is None])
+    templates = set(rig_templates.get_libraries())
+    for library in [library for library in bpy.data.libraries if library not in templates]:
+        bpy.data.libraries.remove(library)
+    bpy.data.orphans_purge(do_local_ids=True, do_linked_ids=False, do_recursive=True)
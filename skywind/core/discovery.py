@@ -0,0 +1,104 @@
+"""
+Module for finding actor configs in large directory trees.
+
+Directories are listed with os.scandir on a pool of threads, which overlaps the latency of network drives, and
+subtrees that never contain actors, such as textures and sounds, are pruned before they are listed.
+"""
+import os
+import logging
+import fnmatch
+from typing import Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from skywind.core.actor import Actor, CONFIG_EXTENSION, registry
+
+
+_logger = logging.getLogger(__name__)
+__all__ = ['DEFAULT_EXCLUDES', 'is_excluded', 'discover_configs', 'discover_actors']
+# Directories relative to a Data directory. Patterns without a slash match directory names at any depth.
+DEFAULT_EXCLUDES = (
+    '.git', '.skywind', 'textures', 'sound', 'music', 'interface', 'strings', 'video', 'meshes/*/lod',
+)
+DEFAULT_WORKERS = 8
+
+
+def is_excluded(relative_path: str, exclude: Iterable[str]) -> bool:
+    """
+    Returns True if a directory matches any of the exclude patterns.
+
+    Args:
+        relative_path(str): The directory relative to the root being searched.
+        exclude(Iterable[str]): Case-insensitive fnmatch patterns. Patterns containing a slash are matched against
+            the whole relative path, other patterns against the directory name.
+    """
+    relative_path = relative_path.replace('\\', '/').lower()
+    name = relative_path.rsplit('/', 1)[-1]
+    for pattern in exclude:
+        pattern = pattern.lower()
+        if fnmatch.fnmatchcase(relative_path if '/' in pattern else name, pattern):
+            return True
+    return False
+
+
+def _scan_directory(directory: str) -> tuple[list[str], list[str]]:
+    """Returns the config files and subdirectories of a directory."""
+    configs = []
+    subdirectories = []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirectories.append(entry.path)
+                elif entry.name.endswith(CONFIG_EXTENSION):
+                    configs.append(entry.path)
+    except OSError as e:
+        _logger.debug('Skipping %s: %s', directory, e)
+    return configs, subdirectories
+
+
+def discover_configs(
+        root: str, include: Iterable[str] = (), exclude: Iterable[str] = DEFAULT_EXCLUDES, max_depth: int = None,
+        workers: int = DEFAULT_WORKERS
+) -> Iterator[str]:
+    """
+    Yields the actor configs in a directory tree as soon as they are found, in no particular order.
+
+    Args:
+        root(str): The directory to search.
+        include(Iterable[str]): Case-insensitive fnmatch patterns of config paths relative to the root. Only matching
+            configs are yielded. Yields every config if empty.
+        exclude(Iterable[str]): Patterns of directories that are not searched, see is_excluded.
+        max_depth(int): The deepest directory level searched, where the root is level 0. Unlimited if None.
+        workers(int): The number of directories listed at once.
+    """
+    root = os.path.abspath(root)
+    include = [pattern.lower() for pattern in include]
+    exclude = list(exclude)
+    executor = ThreadPoolExecutor(workers)
+    try:
+        pending = {executor.submit(_scan_directory, root): 0}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                depth = pending.pop(future)
+                configs, subdirectories = future.result()
+                for config in configs:
+                    relative_config = os.path.relpath(config, root).replace('\\', '/').lower()
+                    if not include or any(fnmatch.fnmatchcase(relative_config, pattern) for pattern in include):
+                        yield config
+                if max_depth is not None and depth >= max_depth:
+                    continue
+                for subdirectory in subdirectories:
+                    if not is_excluded(os.path.relpath(subdirectory, root), exclude):
+                        pending[executor.submit(_scan_directory, subdirectory)] = depth + 1
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def discover_actors(root: str, **kwargs) -> Iterator[Actor]:
+    """Yields the actors in a directory tree as soon as they are found. Accepts the arguments of discover_configs."""
+    for config in discover_configs(root, **kwargs):
+        try:
+            yield registry.get(config)
+        except (OSError, ValueError) as e:
+            _logger.warning('Skipping actor config %s: %s', config, e)
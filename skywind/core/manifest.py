@@ -0,0 +1,209 @@
+"""
+Module for the project manifest, a persistent index of the actors in a project.
+
+The manifest is a compact JSON file in a directory at the project root, listing the directory tree, every actor config
+with its resolved paths, and the animation files of each actor with their modification times. Refreshing it lists only
+the directories whose modification time changed, so finding the actors of a large Data tree takes a stat per directory
+instead of a full walk.
+"""
+from __future__ import annotations
+
+import os
+import json
+import shutil
+import logging
+import tempfile
+from typing import Iterable
+
+from skywind.core.actor import Actor, CONFIG_EXTENSION
+from skywind.core.discovery import DEFAULT_EXCLUDES, is_excluded
+
+
+_logger = logging.getLogger(__name__)
+__all__ = ['ProjectManifest', 'load_manifest', 'MANIFEST_DIRECTORY', 'MANIFEST_FILENAME']
+# The manifest lives in its own directory, so writing it does not modify the project root it indexes
+MANIFEST_DIRECTORY = '.skywind'
+MANIFEST_FILENAME = 'manifest.json'
+MANIFEST_VERSION = 1
+RESOLVED_PATHS = (
+    'skeleton_fbx', 'skeleton_hkx', 'skeleton_nif', 'skeleton_le_hkx', 'animations_fbx', 'animations_hkx',
+    'cache_txt', 'behavior_directory', 'blender_rig', 'maya_rig',
+)
+ANIMATION_DIRECTORIES = (('fbx', 'animations_fbx'), ('hkx', 'animations_hkx'))
+
+
+def _scan_animations(directory: str, extension: str) -> dict[str, int]:
+    if not os.path.isdir(directory):
+        return {}
+    with os.scandir(directory) as entries:
+        return {
+            entry.name: entry.stat().st_mtime_ns for entry in entries
+            if entry.name.endswith(extension) and entry.is_file()
+        }
+
+
+class ProjectManifest:
+    """
+    The actors of a project, indexed by their config path relative to the project root.
+
+    Args:
+        root(str): The project root, e.g. a Data directory.
+        exclude(Iterable[str]): Patterns of directories that are not indexed, see skywind.core.discovery.is_excluded.
+    """
+
+    def __init__(self, root: str, exclude: Iterable[str] = DEFAULT_EXCLUDES):
+        self.root = os.path.abspath(root)
+        self.exclude = list(exclude)
+        self.filepath = os.path.join(self.root, MANIFEST_DIRECTORY, MANIFEST_FILENAME)
+        self.modified = False
+        self._directories = {}
+        self._configs = {}
+        self._actors = {}
+
+    @classmethod
+    def load(cls, root: str, exclude: Iterable[str] = DEFAULT_EXCLUDES) -> ProjectManifest:
+        """Loads the manifest of a project, or returns an empty one if the project has no valid manifest."""
+        manifest = cls(root, exclude)
+        if not os.path.exists(manifest.filepath):
+            return manifest
+        try:
+            with open(manifest.filepath, 'r') as openfile:
+                data = json.load(openfile)
+        except ValueError as e:
+            _logger.warning('Ignoring invalid manifest %s: %s', manifest.filepath, e)
+            return manifest
+        # Resolved paths are absolute, so a moved project is scanned again
+        if data.get('version') == MANIFEST_VERSION and data.get('root') == manifest.root and \
+                data.get('exclude') == manifest.exclude:
+            manifest._directories = data['directories']
+            manifest._configs = data['configs']
+        return manifest
+
+    def _refresh_directories(self) -> dict[str, dict]:
+        directories = {}
+        stack = ['']
+        while stack:
+            relative = stack.pop()
+            try:
+                mtime = os.stat(os.path.join(self.root, relative)).st_mtime_ns
+            except OSError:
+                continue
+            entry = self._directories.get(relative)
+            if entry is None or entry['mtime'] != mtime:
+                configs = []
+                subdirectories = []
+                with os.scandir(os.path.join(self.root, relative)) as children:
+                    for child in children:
+                        if child.is_dir(follow_symlinks=False):
+                            relative_child = os.path.join(relative, child.name)
+                            if relative_child != MANIFEST_DIRECTORY and not is_excluded(relative_child, self.exclude):
+                                subdirectories.append(child.name)
+                        elif child.name.endswith(CONFIG_EXTENSION):
+                            configs.append(child.name)
+                entry = {'mtime': mtime, 'configs': sorted(configs), 'subdirectories': sorted(subdirectories)}
+            directories[relative] = entry
+            stack.extend(os.path.join(relative, name) for name in entry['subdirectories'])
+        return directories
+
+    def _refresh_config(self, config: str, entry: dict | None) -> dict:
+        filepath = os.path.join(self.root, config)
+        mtime = os.stat(filepath).st_mtime_ns
+        if entry is None or entry['mtime'] != mtime:
+            with open(filepath, 'r') as openfile:
+                data = json.load(openfile)
+            actor = Actor(filepath, data)
+            paths = {}
+            for key in RESOLVED_PATHS:
+                try:
+                    paths[key] = getattr(actor, key)
+                except KeyError:
+                    continue
+            entry = {'mtime': mtime, 'data': data, 'paths': paths, 'animations': {}}
+        animations = {
+            kind: _scan_animations(entry['paths'][key], f'.{kind}') if key in entry['paths'] else {}
+            for kind, key in ANIMATION_DIRECTORIES
+        }
+        if animations != entry['animations']:
+            entry = dict(entry, animations=animations)
+        return entry
+
+    def refresh(self) -> bool:
+        """
+        Updates the manifest from the file system. Only directories and configs whose modification time changed are
+        read again. Returns True if anything changed.
+        """
+        directories = self._refresh_directories()
+        configs = {}
+        for relative, entry in directories.items():
+            for name in entry['configs']:
+                config = os.path.join(relative, name)
+                try:
+                    configs[config] = self._refresh_config(config, self._configs.get(config))
+                except (OSError, ValueError) as e:
+                    _logger.warning('Skipping actor config %s: %s', config, e)
+        changed = directories != self._directories or configs != self._configs
+        if changed:
+            self._actors = {
+                config: actor for config, actor in self._actors.items() if configs.get(config) is self._configs[config]
+            }
+            self._directories = directories
+            self._configs = configs
+            self.modified = True
+        return changed
+
+    def save(self):
+        """Writes the manifest atomically."""
+        os.makedirs(os.path.dirname(self.filepath), exist_ok=True)
+        handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(self.filepath), prefix='.', suffix='.tmp')
+        try:
+            if os.path.exists(self.filepath):
+                shutil.copymode(self.filepath, temp_path)
+            with os.fdopen(handle, 'w') as openfile:
+                json.dump({
+                    'version': MANIFEST_VERSION,
+                    'root': self.root,
+                    'exclude': self.exclude,
+                    'directories': self._directories,
+                    'configs': self._configs,
+                }, openfile, separators=(',', ':'))
+            os.replace(temp_path, self.filepath)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        self.modified = False
+
+    def get_configs(self) -> list[str]:
+        """Returns the absolute paths of every actor config."""
+        return [os.path.join(self.root, config) for config in sorted(self._configs)]
+
+    def get_actors(self) -> list[Actor]:
+        """Returns every actor, built from the manifest without reading their config files."""
+        for config in sorted(self._configs):
+            if config not in self._actors:
+                self._actors[config] = Actor(os.path.join(self.root, config), self._configs[config]['data'])
+        return [self._actors[config] for config in sorted(self._configs)]
+
+    def get_paths(self, config: str) -> dict[str, str]:
+        """Returns the resolved paths defined by an actor config."""
+        return self._configs[os.path.relpath(config, self.root)]['paths']
+
+    def get_animations(self, config: str, kind: str = 'fbx') -> dict[str, int]:
+        """
+        Returns the animation files of an actor with their modification times in nanoseconds.
+
+        Args:
+            config(str): The actor config file.
+            kind(str): Either fbx or hkx.
+        """
+        return self._configs[os.path.relpath(config, self.root)]['animations'][kind]
+
+
+def load_manifest(root: str, exclude: Iterable[str] = DEFAULT_EXCLUDES) -> ProjectManifest:
+    """Loads the manifest of a project, refreshes it and saves it if anything changed."""
+    manifest = ProjectManifest.load(root, exclude)
+    if manifest.refresh():
+        try:
+            manifest.save()
+        except OSError as e:
+            _logger.warning('Failed to save manifest %s: %s', manifest.filepath, e)
+    return manifest